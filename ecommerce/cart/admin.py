@@ -8,8 +8,15 @@ class CartItemInline(admin.TabularInline):
     extra = 0
 
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'updated_at', 'total_price')
+    list_display = ('user', 'created_at', 'updated_at', 'items_count', 'total_price')
+    list_select_related = ('user',)
+    readonly_fields = ('items_count', 'subtotal')
     inlines = [CartItemInline]
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Items edited inline bypass the cart views, so refresh the stored totals
+        Cart.objects.filter(pk=form.instance.pk).recalculate_totals()
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -17,10 +24,11 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ('product', 'price', 'quantity', 'total_price')
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'first_name', 'last_name', 'status', 'payment_method', 'total_price', 'created_at')
+    list_display = ('id', 'user', 'first_name', 'last_name', 'status', 'payment_method', 'order_total', 'order_items', 'created_at')
     list_filter = ('status', 'payment_method', 'created_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'first_name', 'last_name', 'email')
-    readonly_fields = ('created_at', 'updated_at', 'total_price')
+    readonly_fields = ('created_at', 'updated_at', 'grand_total', 'total_price')
     list_editable = ('status',)
     inlines = [OrderItemInline]
     fieldsets = (
@@ -28,9 +36,20 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('user', 'first_name', 'last_name', 'email', 'phone')
         }),
         ('Order Details', {
-            'fields': ('address', 'payment_method', 'status', 'created_at', 'updated_at', 'total_price')
+            'fields': ('address', 'payment_method', 'status', 'created_at', 'updated_at', 'grand_total', 'total_price')
         }),
     )
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+    
+    @admin.display(description='Total', ordering='items_total')
+    def order_total(self, obj):
+        return obj.total_price
+    
+    @admin.display(description='Items', ordering='item_count')
+    def order_items(self, obj):
+        return obj.item_count
 
 admin.site.register(Cart, CartAdmin)
 admin.site.register(CartItem)
@@ -1,17 +1,23 @@
+from django.utils.functional import SimpleLazyObject
+from store.metrics import timed
 from .models import Cart
+from .summary import CartSummary
 
+@timed('store_context_processor_seconds', processor='cart')
 def cart(request):
     """
-    Context processor to provide cart information to all templates
+    Context processor to provide cart information to all templates.
+    Everything is lazy: pages that never show the cart run no queries.
     """
+    summary = CartSummary(request)
+    
     if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_items_count = cart.items.count()
+        cart = SimpleLazyObject(lambda: Cart.objects.filter(user=request.user).first())
     else:
         cart = None
-        cart_items_count = 0
     
     return {
         'cart': cart,
-        'cart_items_count': cart_items_count
+        'cart_summary': summary,
+        'cart_items_count': SimpleLazyObject(lambda: summary.count)
     }
\ No newline at end of file
@@ -0,0 +1,84 @@
+# cart/management/commands/benchmark_checkout.py
+
+import statistics
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from store.benchmarks import ORDER_FORM, Rollback
+from store.models import Category, Product
+from cart.models import Cart, CartItem
+
+class Command(BaseCommand):
+    help = 'Measure query count and wall time of checkout for carts of different sizes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100])
+        parser.add_argument('--repeat', type=int, default=5)
+    
+    def handle(self, *args, **options):
+        # Lets the test client through ALLOWED_HOSTS, unless we are already
+        # running inside the test runner
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            own_environment = False
+        else:
+            own_environment = True
+        
+        try:
+            self.stdout.write(f"{'items':>6} {'queries':>8} {'median ms':>10} {'min ms':>8}")
+            for size in options['sizes']:
+                queries, timings = [], []
+                for run in range(options['repeat']):
+                    count, elapsed = self.run_checkout(size, run)
+                    queries.append(count)
+                    timings.append(elapsed * 1000)
+                self.stdout.write(
+                    f'{size:>6} {max(queries):>8} {statistics.median(timings):>10.1f} {min(timings):>8.1f}'
+                )
+        finally:
+            if own_environment:
+                teardown_test_environment()
+    
+    def run_checkout(self, size, run):
+        """
+        Build a cart of ``size`` items and check it out through the test
+        client. Everything happens in a transaction that is rolled back.
+        """
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(f'checkout-bench-{size}-{run}')
+                category = Category.objects.create(
+                    name='Benchmark', slug=f'checkout-bench-{size}-{run}'
+                )
+                products = Product.objects.bulk_create([
+                    Product(
+                        category=category,
+                        name=f'Benchmark product {i}',
+                        slug=f'checkout-bench-{size}-{run}-{i}',
+                        price=Decimal('9.99'),
+                        quantity=1000
+                    )
+                    for i in range(size)
+                ])
+                cart = Cart.objects.create(user=user, items_count=size, subtotal=Decimal('9.99') * size)
+                CartItem.objects.bulk_create([
+                    CartItem(cart=cart, product=product, quantity=1) for product in products
+                ])
+                
+                client = Client()
+                client.force_login(user)
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.post(reverse('cart:checkout'), ORDER_FORM)
+                    elapsed = time.perf_counter() - start
+                if response.status_code != 302:
+                    self.stderr.write(f'Checkout returned {response.status_code}')
+                raise Rollback(len(captured), elapsed)
+        except Rollback as result:
+            return result.args
@@ -1,10 +1,102 @@
 # cart/models.py (add Order models)
 
+from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from store.models import Product
 
-# Existing Cart and CartItem models...
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate each cart with its line count and subtotal computed in SQL
+        (``line_count`` and ``computed_subtotal``).
+        """
+        return self.annotate(
+            line_count=Count('items'),
+            computed_subtotal=Coalesce(
+                Sum(F('items__quantity') * F('items__product__price'), output_field=DecimalField()),
+                Value(Decimal('0.00')),
+                output_field=DecimalField()
+            )
+        )
+    
+    def recalculate_totals(self):
+        """
+        Rewrite the stored items_count and subtotal from the cart items,
+        picking up product price changes.
+        """
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        return self.update(
+            items_count=Coalesce(Subquery(items.annotate(n=Count('id')).values('n')), 0),
+            subtotal=Coalesce(
+                Subquery(items.annotate(
+                    total=Sum(F('quantity') * F('product__price'), output_field=DecimalField())
+                ).values('total')),
+                Value(Decimal('0.00')),
+                output_field=DecimalField()
+            ),
+            updated_at=timezone.now()
+        )
+
+class Cart(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized totals, kept in step by the cart views
+    items_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    objects = CartQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.user.username}'s cart"
+    
+    @property
+    def total_price(self):
+        return self.subtotal
+    
+    def adjust_totals(self, lines=0, amount=0):
+        """
+        Atomically add to the stored totals (use negative values to subtract).
+        """
+        Cart.objects.filter(pk=self.pk).update(
+            items_count=F('items_count') + lines,
+            subtotal=F('subtotal') + amount,
+            updated_at=timezone.now()
+        )
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        unique_together = ('cart', 'product')
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name}"
+    
+    @property
+    def total_price(self):
+        return self.product.price * self.quantity
+
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate each order with ``items_total`` and ``item_count`` computed
+        in SQL, so listing orders does not run a query per row.
+        """
+        return self.annotate(
+            items_total=Coalesce(
+                Sum(F('items__price') * F('items__quantity'), output_field=DecimalField()),
+                Value(Decimal('0.00')),
+                output_field=DecimalField()
+            ),
+            item_count=Coalesce(Sum('items__quantity'), 0)
+        )
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -31,14 +123,27 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Snapshot of the amount charged, written at checkout
+    grand_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's order history, newest first, without a sort
+            models.Index(fields=['user', '-created_at'], name='cart_order_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
     
     @property
     def total_price(self):
+        if self.grand_total is not None:
+            return self.grand_total
+        if hasattr(self, 'items_total'):
+            return self.items_total
         return sum(item.total_price for item in self.items.all())
 
 class OrderItem(models.Model):
@@ -53,104 +158,3 @@ class OrderItem(models.Model):
     @property
     def total_price(self):
         return self.price * self.quantity
-
-# cart/views.py (add checkout views)
-
-from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
-from django.contrib import messages
-from django.db import transaction
-from .models import Cart, CartItem, Order, OrderItem
-from .forms import OrderForm  # We'll create this next
-
-@login_required
-def checkout(request):
-    cart = get_object_or_404(Cart, user=request.user)
-    
-    # Check if cart is empty
-    if not cart.items.exists():
-        messages.warning(request, 'Your cart is empty. Please add items before checkout.')
-        return redirect('cart:cart_detail')
-    
-    if request.method == 'POST':
-        form = OrderForm(request.POST)
-        if form.is_valid():
-            # Create order in a transaction to ensure consistency
-            with transaction.atomic():
-                order = form.save(commit=False)
-                order.user = request.user
-                order.save()
-                
-                # Create order items from cart items
-                for cart_item in cart.items.all():
-                    OrderItem.objects.create(
-                        order=order,
-                        product=cart_item.product,
-                        price=cart_item.product.price,
-                        quantity=cart_item.quantity
-                    )
-                
-                # Clear the cart
-                cart.items.all().delete()
-                
-                messages.success(request, 'Your order has been placed successfully!')
-                return redirect('cart:order_success', order_id=order.id)
-    else:
-        # Pre-fill form with user data if available
-        initial_data = {}
-        if hasattr(request.user, 'profile'):
-            initial_data = {
-                'first_name': request.user.first_name,
-                'last_name': request.user.last_name,
-                'email': request.user.email,
-                'address': request.user.profile.address,
-                'phone': request.user.profile.phone_number,
-            }
-        form = OrderForm(initial=initial_data)
-    
-    context = {
-        'form': form,
-        'cart': cart,
-    }
-    
-    return render(request, 'cart/checkout.html', context)
-
-@login_required
-def order_success(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    return render(request, 'cart/order_success.html', {'order': order})
-
-@login_required
-def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    return render(request, 'cart/order_detail.html', {'order': order})
-
-# cart/forms.py
-
-from django import forms
-from .models import Order
-
-class OrderForm(forms.ModelForm):
-    class Meta:
-        model = Order
-        fields = ['first_name', 'last_name', 'email', 'address', 'phone', 'payment_method']
-        widgets = {
-            'address': forms.Textarea(attrs={'rows': 3}),
-        }
-
-# cart/urls.py (update)
-
-from django.urls import path
-from . import views
-
-app_name = 'cart'
-
-urlpatterns = [
-    path('', views.cart_detail, name='cart_detail'),
-    path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
-    path('remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
-    path('update/<int:item_id>/', views.update_cart, name='update_cart'),
-    path('checkout/', views.checkout, name='checkout'),
-    path('order/success/<int:order_id>/', views.order_success, name='order_success'),
-    path('order/<int:order_id>/', views.order_detail, name='order_detail'),
-]
\ No newline at end of file
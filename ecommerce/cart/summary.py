@@ -0,0 +1,59 @@
+# cart/summary.py
+
+from decimal import Decimal
+from django.utils.functional import cached_property
+from .models import Cart
+
+SESSION_KEY = 'cart_summary'
+
+def _summarize(user):
+    totals = Cart.objects.filter(user=user).values('items_count', 'subtotal').first()
+    if totals is None:
+        return {'count': 0, 'subtotal': '0.00'}
+    return {
+        'count': totals['items_count'],
+        'subtotal': str(totals['subtotal'].quantize(Decimal('0.01'))),
+    }
+
+def update_cart_summary(request):
+    """
+    Recompute the cart badge data kept in the session. Called by the cart
+    views whenever they change the cart.
+    """
+    request.session[SESSION_KEY] = _summarize(request.user)
+
+class CartSummary:
+    """
+    Item count and subtotal of the current user's cart for templates.
+    
+    Nothing is read until a template touches ``count`` or ``subtotal``; the
+    values are then taken from the session and only computed from the
+    database when the session does not have them yet.
+    """
+    
+    def __init__(self, request):
+        self.request = request
+    
+    @cached_property
+    def _data(self):
+        if not self.request.user.is_authenticated:
+            return {'count': 0, 'subtotal': '0.00'}
+        data = self.request.session.get(SESSION_KEY)
+        if data is None:
+            data = _summarize(self.request.user)
+            self.request.session[SESSION_KEY] = data
+        return data
+    
+    @property
+    def count(self):
+        return self._data['count']
+    
+    @property
+    def subtotal(self):
+        return Decimal(self._data['subtotal'])
+    
+    def __bool__(self):
+        return bool(self.count)
+    
+    def __str__(self):
+        return str(self.count)
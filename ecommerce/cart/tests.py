@@ -1,3 +1,256 @@
-from django.test import TestCase
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from store.benchmarks import ORDER_FORM
+from store.catalog import CatalogImporter
+from store.categories import get_categories
+from store.inventory import take_stock
+from store.models import Category, Product, ProductPopularity, StockReservation
+from .context_processors import cart as cart_context
+from .models import Cart, CartItem, Order
+from .summary import SESSION_KEY
 
-# Create your tests here.
+def make_product(quantity):
+    category = Category.objects.create(name='Hot', slug='hot')
+    return Product.objects.create(
+        category=category, name='Hot SKU', slug='hot-sku', price=Decimal('10.00'), quantity=quantity
+    )
+
+class CartSummaryTests(TestCase):
+    def test_badge_is_lazy_and_read_from_the_session(self):
+        user = User.objects.create_user('shopper')
+        product = make_product(5)
+        self.client.force_login(user)
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = self.client.session
+        with self.assertNumQueries(0):
+            context = cart_context(request)
+        self.assertEqual(str(context['cart_items_count']), '0')
+        self.assertFalse(Cart.objects.exists())
+        
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        self.assertEqual(self.client.session[SESSION_KEY], {'count': 1, 'subtotal': '20.00'})
+        request.session = self.client.session
+        self.assertIn(SESSION_KEY, request.session)
+        context = cart_context(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(context['cart_summary'].count, 1)
+            self.assertEqual(context['cart_summary'].subtotal, Decimal('20.00'))
+
+class CartTotalsTests(TestCase):
+    def test_stored_totals_follow_the_cart_views(self):
+        self.client.force_login(User.objects.create_user('shopper'))
+        product = make_product(5)
+        other = Product.objects.create(
+            category=product.category, name='Other', slug='other', price=Decimal('1.25'), quantity=5
+        )
+        for added in (product, product, other):
+            self.client.get(reverse('cart:add_to_cart', args=[added.id]))
+        cart = Cart.objects.get()
+        self.assertEqual((cart.items_count, cart.subtotal), (2, Decimal('21.25')))
+        
+        item = CartItem.objects.get(product=product)
+        self.client.post(reverse('cart:update_cart', args=[item.id]), {'quantity': 3})
+        self.client.get(reverse('cart:remove_from_cart', args=[CartItem.objects.get(product=other).id]))
+        cart.refresh_from_db()
+        self.assertEqual((cart.items_count, cart.subtotal), (1, Decimal('30.00')))
+        annotated = Cart.objects.with_totals().get()
+        self.assertEqual((annotated.line_count, annotated.computed_subtotal), (1, Decimal('30.00')))
+    
+    def test_recalculate_picks_up_price_changes(self):
+        product = make_product(5)
+        cart = Cart.objects.create(user=User.objects.create_user('shopper'))
+        CartItem.objects.create(cart=cart, product=product, quantity=2)
+        Product.objects.filter(pk=product.pk).update(price=Decimal('4.00'))
+        Cart.objects.filter(pk=cart.pk).recalculate_totals()
+        cart.refresh_from_db()
+        self.assertEqual((cart.items_count, cart.subtotal), (1, Decimal('8.00')))
+    
+    def test_price_changes_between_add_and_remove(self):
+        self.client.force_login(User.objects.create_user('shopper'))
+        product = make_product(5)
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        product.price = Decimal('4.00')
+        product.save()
+        cart = Cart.objects.get()
+        self.assertEqual((cart.items_count, cart.subtotal), (1, Decimal('4.00')))
+        self.client.get(reverse('cart:remove_from_cart', args=[CartItem.objects.get().id]))
+        cart.refresh_from_db()
+        self.assertEqual((cart.items_count, cart.subtotal), (0, Decimal('0.00')))
+    
+    def test_catalog_import_reprices_carts(self):
+        product = make_product(5)
+        cart = Cart.objects.create(user=User.objects.create_user('shopper'), items_count=1, subtotal=Decimal('20.00'))
+        CartItem.objects.create(cart=cart, product=product, quantity=2)
+        row = {'slug': product.slug, 'name': product.name, 'category': 'hot', 'price': '7.50', 'quantity': 5}
+        CatalogImporter().run([(2, row)])
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, Decimal('15.00'))
+
+class OrderTotalsTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.product = make_product(100)
+    
+    def place_order(self):
+        self.client.get(reverse('cart:add_to_cart', args=[self.product.id]))
+        self.client.get(reverse('cart:add_to_cart', args=[self.product.id]))
+        response = self.client.post(reverse('cart:checkout'), ORDER_FORM)
+        self.assertEqual(response.status_code, 302)
+    
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('admin:cart_order_changelist')).status_code, 200)
+        return len(queries)
+    
+    def test_checkout_snapshots_the_total_and_admin_annotates_it(self):
+        self.place_order()
+        order = Order.objects.with_totals().get()
+        self.assertEqual(order.grand_total, Decimal('20.00'))
+        self.assertEqual((order.items_total, order.item_count), (Decimal('20.00'), 2))
+        self.assertEqual(Cart.objects.get().items_count, 0)
+        
+        # Every page lists the categories; load them before measuring
+        get_categories()
+        queries = self.changelist_queries()
+        for _ in range(3):
+            self.place_order()
+        self.assertEqual(self.changelist_queries(), queries)
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('shopper'))
+        self.category = Category.objects.create(name='Bulk', slug='bulk')
+    
+    def fill_cart(self, size, quantity=3):
+        products = [
+            Product.objects.create(
+                category=self.category, name=f'{size}-{i}', slug=f'{size}-{i}', price=Decimal('1.50'), quantity=quantity
+            )
+            for i in range(size)
+        ]
+        for product in products:
+            self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        return products
+    
+    def checkout_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(reverse('cart:checkout'), ORDER_FORM).status_code, 302)
+        return len(queries)
+    
+    def test_query_count_does_not_grow_with_the_cart(self):
+        self.fill_cart(2)
+        small = self.checkout_queries()
+        products = self.fill_cart(8)
+        self.assertEqual(self.checkout_queries(), small)
+        
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(Order.objects.latest('id').grand_total, Decimal('12.00'))
+        self.assertEqual(Product.objects.get(pk=products[0].pk).quantity, 2)
+        # One cart event and one order event of weight 2
+        self.assertEqual(ProductPopularity.objects.get(product=products[0]).score_all, 3)
+    
+    def test_short_stock_places_no_order(self):
+        product, = self.fill_cart(1, quantity=1)
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        response = self.client.post(reverse('cart:checkout'), ORDER_FORM)
+        self.assertRedirects(response, reverse('cart:cart_detail'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=product.pk).quantity, 1)
+    
+    def test_benchmark_command_rolls_back(self):
+        out, err = StringIO(), StringIO()
+        call_command('benchmark_checkout', '--sizes', '1', '5', '--repeat', '1', stdout=out, stderr=err)
+        self.assertEqual(err.getvalue(), '')
+        header, *rows = out.getvalue().splitlines()
+        self.assertEqual([row.split()[0] for row in rows], ['1', '5'])
+        self.assertEqual(len({row.split()[1] for row in rows}), 1)
+        self.assertFalse(Order.objects.exists())
+
+class ReservationTests(TestCase):
+    @override_settings(CART_RESERVATION_TTL=600)
+    def test_cart_lines_hold_stock_until_checkout(self):
+        product = make_product(2)
+        holder, other = User.objects.create_user('holder'), User.objects.create_user('other')
+        self.client.force_login(holder)
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+        
+        self.client.force_login(other)
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        self.assertFalse(CartItem.objects.filter(cart__user=other).exists())
+        
+        self.client.force_login(holder)
+        item = CartItem.objects.get(cart__user=holder)
+        self.client.post(reverse('cart:update_cart', args=[item.id]), {'quantity': 1})
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+        self.assertEqual(self.client.post(reverse('cart:checkout'), ORDER_FORM).status_code, 302)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Product.objects.get(pk=product.pk).quantity, 1)
+    
+    @override_settings(CART_RESERVATION_TTL=None)
+    def test_removing_a_line_skips_reservations_when_disabled(self):
+        product = make_product(2)
+        self.client.force_login(User.objects.create_user('shopper'))
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        item = CartItem.objects.get()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('cart:remove_from_cart', args=[item.id]))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(any(StockReservation._meta.db_table in query['sql'] for query in queries))
+    
+    @override_settings(CART_RESERVATION_TTL=None)
+    def test_checkout_releases_nothing_when_disabled(self):
+        product = make_product(2)
+        self.client.force_login(User.objects.create_user('shopper'))
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(reverse('cart:checkout'), ORDER_FORM).status_code, 302)
+        self.assertEqual(Product.objects.get(pk=product.pk).quantity, 1)
+        table = StockReservation._meta.db_table
+        self.assertFalse(any(query['sql'].startswith(f'DELETE FROM "{table}"') for query in queries))
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """
+    Many threads buying the same hot SKU must never oversell it.
+    """
+    databases = '__all__'
+    STOCK = 25
+    BUYERS = 60
+    WORKERS = 8
+    
+    def buy(self, product_id, partial):
+        try:
+            for attempt in range(100):
+                try:
+                    return take_stock({product_id: 1}, partial=partial)[product_id].taken
+                except OperationalError:
+                    # SQLite reports lock contention instead of waiting
+                    time.sleep(0.005)
+            return False
+        finally:
+            connection.close()
+    
+    def assert_not_oversold(self, partial):
+        product = make_product(self.STOCK)
+        with ThreadPoolExecutor(self.WORKERS) as pool:
+            sold = sum(pool.map(lambda _: self.buy(product.id, partial), range(self.BUYERS)))
+        product.refresh_from_db()
+        self.assertEqual(sold, self.STOCK)
+        self.assertEqual(product.quantity, 0)
+    
+    def test_all_or_nothing(self):
+        self.assert_not_oversold(partial=False)
+    
+    def test_partial(self):
+        self.assert_not_oversold(partial=True)
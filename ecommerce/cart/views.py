@@ -2,55 +2,197 @@
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
+from store import popularity, signals as store_signals
+from store.inventory import (
+    InsufficientStock, decrement_stock, hold_for_cart, release_for_cart, reservation_ttl
+)
 from store.models import Product
-from .models import Cart, CartItem
+from .models import Cart, CartItem, Order, OrderItem
+from .forms import OrderForm
+from .summary import update_cart_summary
 
 @login_required
 def cart_detail(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'cart/cart.html', {'cart': cart})
+    # The cart row is only created on the first add_to_cart
+    cart = Cart.objects.filter(user=request.user).first()
+    cart_items = cart.items.select_related('product') if cart else []
+    return render(request, 'cart/cart.html', {'cart': cart, 'cart_items': cart_items})
+
+def _hold_stock(request, cart, product, quantity):
+    """
+    When carts reserve stock (settings.CART_RESERVATION_TTL), hold
+    ``quantity`` of the product for this cart. Returns False, with an error
+    message, if that much is not available.
+    """
+    if reservation_ttl() is None:
+        return True
+    line = hold_for_cart(cart.id, {product.id: quantity})[product.id]
+    if not line.taken:
+        messages.error(request, f'Only {max(line.available, 0)} x {product.name} left in stock.')
+    return line.taken
+
+def _release_stock(cart_item):
+    """
+    Drop the cart's hold on a line that was removed, when carts reserve
+    stock.
+    """
+    if reservation_ttl() is not None:
+        release_for_cart(cart_item.cart_id, [cart_item.product_id])
 
 @login_required
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
     
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        
+        if reservation_ttl() is not None:
+            in_cart = CartItem.objects.filter(cart=cart, product=product).values_list('quantity', flat=True).first()
+            if not _hold_stock(request, cart, product, (in_cart or 0) + 1):
+                return redirect('cart:cart_detail')
+        
+        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
+        
+        if not created:
+            CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') + 1)
+        
+        cart.adjust_totals(lines=1 if created else 0, amount=product.price)
     
+    update_cart_summary(request)
     return redirect('cart:cart_detail')
 
 @login_required
 def remove_from_cart(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    cart_item.delete()
+    with transaction.atomic():
+        cart_item = get_object_or_404(
+            CartItem.objects.select_for_update().select_related('cart', 'product'),
+            id=item_id, cart__user=request.user
+        )
+        cart_item.cart.adjust_totals(lines=-1, amount=-cart_item.total_price)
+        cart_item.delete()
+        _release_stock(cart_item)
+    update_cart_summary(request)
     return redirect('cart:cart_detail')
 
 @login_required
 def update_cart(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    
     if request.method == 'POST':
         quantity = int(request.POST.get('quantity', 1))
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-        else:
-            cart_item.delete()
+        with transaction.atomic():
+            cart_item = get_object_or_404(
+                CartItem.objects.select_for_update().select_related('cart', 'product'),
+                id=item_id, cart__user=request.user
+            )
+            if quantity > 0:
+                if _hold_stock(request, cart_item.cart, cart_item.product, quantity):
+                    cart_item.cart.adjust_totals(
+                        amount=cart_item.product.price * (quantity - cart_item.quantity)
+                    )
+                    cart_item.quantity = quantity
+                    cart_item.save()
+            else:
+                cart_item.cart.adjust_totals(lines=-1, amount=-cart_item.total_price)
+                cart_item.delete()
+                _release_stock(cart_item)
+        update_cart_summary(request)
+    else:
+        get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     
     return redirect('cart:cart_detail')
 
+def _place_order(request, cart, form):
+    """
+    Turn the cart into an order with a fixed number of queries: one read
+    of the cart items, one stock UPDATE (which may use the cart's own
+    reservations), one bulk insert of order items and the delete of the
+    cart items (a SELECT and a DELETE, with the per-row signal
+    bookkeeping suspended).
+    """
+    with transaction.atomic():
+        cart_items = list(cart.items.select_related('product'))
+        # Without reservations the cart has no holds of its own to use and release
+        decrement_stock(
+            {item.product_id: item.quantity for item in cart_items},
+            cart_id=cart.id if reservation_ttl() is not None else None
+        )
+        
+        order = form.save(commit=False)
+        order.user = request.user
+        order.grand_total = sum(item.total_price for item in cart_items)
+        order.save()
+        
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item.product,
+                price=item.product.price,
+                quantity=item.quantity
+            )
+            for item in cart_items
+        ])
+        
+        # Items move from the cart to the order, which leaves the user's
+        # co-occurrence pairs unchanged; only popularity needs the events.
+        with store_signals.suspended():
+            CartItem.objects.filter(cart=cart).delete()
+        popularity.record_events(
+            (item.product_id, 'order', item.quantity) for item in order_items
+        )
+        Cart.objects.filter(pk=cart.pk).update(items_count=0, subtotal=0)
+    return order
+
 @login_required
 def checkout(request):
     cart = get_object_or_404(Cart, user=request.user)
     
+    # Check if cart is empty
+    if not cart.items.exists():
+        messages.warning(request, 'Your cart is empty. Please add items before checkout.')
+        return redirect('cart:cart_detail')
+    
     if request.method == 'POST':
-        # Process cash payment (in a real app, you'd add more logic here)
-        # Clear the cart after successful checkout
-        cart.items.all().delete()
-        return render(request, 'cart/checkout_success.html')
+        form = OrderForm(request.POST)
+        if form.is_valid():
+            try:
+                order = _place_order(request, cart, form)
+            except InsufficientStock as e:
+                names = Product.objects.filter(pk__in=e.product_ids).values_list('name', flat=True)
+                messages.error(request, f"Not enough stock for: {', '.join(names)}")
+                return redirect('cart:cart_detail')
+            
+            update_cart_summary(request)
+            messages.success(request, 'Your order has been placed successfully!')
+            return redirect('cart:order_success', order_id=order.id)
+    else:
+        # Pre-fill form with user data if available
+        initial_data = {}
+        if hasattr(request.user, 'profile'):
+            initial_data = {
+                'first_name': request.user.first_name,
+                'last_name': request.user.last_name,
+                'email': request.user.email,
+                'address': request.user.profile.address,
+                'phone': request.user.profile.phone_number,
+            }
+        form = OrderForm(initial=initial_data)
     
-    return render(request, 'cart/checkout.html', {'cart': cart})
+    context = {
+        'form': form,
+        'cart': cart,
+    }
+    
+    return render(request, 'cart/checkout.html', context)
+
+@login_required
+def order_success(request, order_id):
+    order = get_object_or_404(Order.objects.with_totals(), id=order_id, user=request.user)
+    return render(request, 'cart/order_success.html', {'order': order})
+
+@login_required
+def order_detail(request, order_id):
+    order = get_object_or_404(Order.objects.with_totals(), id=order_id, user=request.user)
+    order_items = order.items.select_related('product')
+    return render(request, 'cart/order_detail.html', {'order': order, 'order_items': order_items})
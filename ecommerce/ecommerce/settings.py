@@ -38,8 +38,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.querybudget.QueryBudgetMiddleware',  # Outermost, so session and auth queries count too
+    'store.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'store.replication.ReplicaPinningMiddleware',  # Needs the session
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -51,7 +54,7 @@ ROOT_URLCONF = 'ecommerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'store.metrics.InstrumentedDjangoTemplates',  # DjangoTemplates with render timings
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,12 +72,145 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'ecommerce.wsgi.application'
 
+# Serve the catalog views (home, listings, product detail, search) from
+# store.async_views, which run independent queries concurrently. On by
+# default under ecommerce.asgi; under WSGI every async view would need its
+# own event loop, so the sync views are used there.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '') == '1'
+
 # Database
+# 'default' takes the writes; 'read' is a second connection to the same file
+# for reads outside transactions (store.routers.ReadWriteRouter), so readers
+# never hold up a transaction waiting for the write lock. Connections are
+# reused for CONN_MAX_AGE seconds instead of being opened per request.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'read': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ['store.routers.ReadWriteRouter']
+DATABASE_READ_ALIASES = ['read']
+
+# Read replicas: catalog and recommendation reads outside transactions go
+# to one of DATABASE_REPLICAS; cart, order, account and session data is
+# always read from the primary. After a request writes, its user reads from
+# the primary for REPLICA_PIN_SECONDS, which must exceed the replication
+# lag. DJANGO_DB_REPLICA=1 adds a local replica file, kept in sync with
+# 'manage.py replicate' as a stand-in for real replication.
+DATABASE_REPLICAS = []
+REPLICATED_MODELS = [
+    'store.category',
+    'store.product',
+    'store.productimage',
+    'store.productcooccurrence',
+    'store.productpopularity',
+    'store.productfacetcount',
+]
+REPLICA_PIN_SECONDS = 5
+if os.environ.get('DJANGO_DB_REPLICA', '') == '1':
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS = ['replica']
+
+# SQLite tuning applied to every new connection by store.dbtuning. WAL lets
+# readers work while a write is in progress, synchronous=NORMAL only syncs
+# at checkpoints (safe with WAL), and busy_timeout is how many ms a writer
+# waits for the write lock before failing with "database is locked".
+# Write transactions begin IMMEDIATE, taking the lock up front instead of
+# failing when a read turns into a write. Compare throughput with
+# 'manage.py benchmark_writes'.
+SQLITE_TUNING = True
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -32000,  # Negative means KiB: 32 MB of page cache per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+SQLITE_WRITE_TRANSACTION_MODE = 'IMMEDIATE'
+
+# Caches
+# Local-memory caches are per process; point these at a shared backend
+# (FileBasedCache, Redis, Memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce-default',
+    },
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce-recommendations',
+        'TIMEOUT': 60 * 60,  # Stale entries are evicted after an hour
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,  # Least recently used entries are culled first
+        },
+    },
+    # Rendered product cards and recommendation blocks, see store.fragments.
+    # Bump VERSION to drop them all after changing their templates.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce-fragments',
+        'VERSION': 1,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+# Seconds a cart holds stock for the products in it; None disables holds
+# and stock is only taken at checkout. Expired holds are purged with
+# 'manage.py purge_reservations'.
+CART_RESERVATION_TTL = None
+
+# Product search: 'fts5' (SQLite full-text index), 'python' (inverted index
+# pickled to SEARCH_INDEX_PATH) or 'auto' to use FTS5 when SQLite has it.
+# Rebuild with 'manage.py rebuild_search_index'.
+SEARCH_BACKEND = 'auto'
+SEARCH_INDEX_PATH = BASE_DIR / 'search_index.pickle'
+
+# In-process timing histograms for views, templates, context processors and
+# recommender stages (store.metrics), scraped from /metrics by the listed IPs
+# or printed with 'manage.py show_metrics'
+METRICS_ENABLED = False
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Query budgets per URL name, checked by store.querybudget.QueryBudgetMiddleware.
+# Mode is 'off', 'log' or 'raise'; a query shape repeated more than
+# QUERY_BUDGET_DUPLICATES times in one request counts as an N+1.
+QUERY_BUDGET_MODE = 'log' if DEBUG else 'off'
+QUERY_BUDGET_HEADERS = DEBUG
+QUERY_BUDGET_DUPLICATES = 3
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGETS = {
+    'store:home': 5,
+    'store:category_list': 5,
+    'store:category_detail': 10,
+    'store:product_detail': 12,
+    'store:search': 8,
+    'store:saved_products': 8,
+    'cart:cart_detail': 8,
+    'cart:add_to_cart': 20,
+    'cart:update_cart': 10,
+    'cart:remove_from_cart': 10,
+    'cart:checkout': 25,
+    'cart:order_success': 8,
+    'cart:order_detail': 8,
 }
 
 # Password validation
@@ -108,6 +244,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Threads resizing uploaded and imported images into MEDIA_ROOT/derived/
+# (see store.images); 0 resizes synchronously when the upload commits.
+# Existing images are backfilled with 'manage.py generate_image_derivatives'.
+IMAGE_WORKERS = 2
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -5,6 +5,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
+from store.metrics import prometheus_view
+from store.views import image_derivative
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,6 +15,13 @@ urlpatterns = [
     path('accounts/', include('users.urls')),
     path('accounts/', include('django.contrib.auth.urls')),  # Django auth URLs
     path('accounts/', include('allauth.urls')),  # For Google authentication
+    path('metrics', prometheus_view, name='metrics'),  # Prometheus scrape endpoint
+    # Resized images missing from MEDIA_ROOT are generated on first request
+    path(
+        f"{settings.MEDIA_URL.strip('/')}/derived/<str:variant>/<str:filename>",
+        image_derivative,
+        name='image_derivative'
+    ),
     path('favicon.ico', RedirectView.as_view(url='/static/images/favicon.ico')),  # Favicon route
 ]
 
@@ -1,18 +1,36 @@
 # store/admin.py
 
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from .models import Category, Product, ProductImage, SavedItem
+from . import search
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 3  # Show 3 empty forms for adding images
 
+class ProductChangeList(ChangeList):
+    def get_ordering(self, request, queryset):
+        # Best matches first while searching, unless a column is sorted
+        if 'search_rank' in queryset.query.annotations and not self.params.get(ORDER_VAR):
+            return ['search_rank', '-pk']
+        return super().get_ordering(request, queryset)
+
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'price', 'quantity', 'category', 'created', 'updated')
     list_filter = ('category', 'created')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
     inlines = [ProductImageInline]
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of LIKE scans over name/description
+        if not search_term:
+            return queryset, False
+        return search.rank_queryset(queryset, search_term), False
+    
+    def get_changelist(self, request, **kwargs):
+        return ProductChangeList
 
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
@@ -23,26 +41,3 @@ admin.site.register(Category, CategoryAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductImage)
 admin.site.register(SavedItem)
-
-# cart/admin.py
-
-from django.contrib import admin
-from .models import Cart, CartItem
-
-class CartItemInline(admin.TabularInline):
-    model = CartItem
-    extra = 0
-
-class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'updated_at', 'total_price')
-    inlines = [CartItemInline]
-
-admin.site.register(Cart, CartAdmin)
-admin.site.register(CartItem)
-
-# users/admin.py
-
-from django.contrib import admin
-from .models import Profile
-
-admin.site.register(Profile)
\ No newline at end of file
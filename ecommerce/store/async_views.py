@@ -0,0 +1,113 @@
+# store/async_views.py
+
+import asyncio
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, render
+from .categories import get_categories
+from .concurrency import in_thread
+from .facets import filter_products, get_facet_counts
+from .models import Category, Product, SavedItem
+from .pagination import keyset_page
+from .recommendations import aget_cached_recommendations
+from .views import PRODUCTS_PER_PAGE, SEARCH_RESULTS_PER_PAGE, listing_queryset
+from . import search as product_search
+
+# Async versions of the catalog views in store.views, routed instead of them
+# when settings.ASYNC_VIEWS is on (the default under ecommerce.asgi).
+# Independent queries run at the same time through concurrency.in_thread.
+# Templates are rendered in the request's sync thread, where the context
+# processors use the session and the user as they do under WSGI.
+
+arender = sync_to_async(render)
+
+async def home(request):
+    categories = await sync_to_async(get_categories)()
+    return await arender(request, 'home.html', {'categories': categories})
+
+async def category_list(request):
+    categories = await sync_to_async(get_categories)()
+    return await arender(request, 'store/category_list.html', {'categories': categories})
+
+async def product_list(request, category_slug=None):
+    category = None
+    if category_slug:
+        category = await aget_object_or_404(Category, slug=category_slug)
+    
+    price_range = request.GET.get('price') or None
+    in_stock = {'1': True, '0': False}.get(request.GET.get('in_stock'))
+    
+    def page():
+        products = listing_queryset(category)
+        products = filter_products(products, price_range=price_range, in_stock=in_stock)
+        return keyset_page(products, request.GET.get('after'), per_page=PRODUCTS_PER_PAGE)
+    
+    try:
+        (products, next_cursor), facets = await asyncio.gather(
+            in_thread(page),
+            in_thread(
+                get_facet_counts,
+                category_id=category.id if category else None,
+                price_range=price_range,
+                in_stock=in_stock
+            )
+        )
+    except ValueError:
+        raise Http404('Invalid filter or page cursor')
+    
+    return await arender(request, 'store/product_list.html', {
+        'category': category,
+        'products': products,
+        'next_cursor': next_cursor,
+        'price_range': price_range,
+        'in_stock': in_stock,
+        'facets': facets
+    })
+
+async def product_detail(request, slug):
+    user = await request.auser()
+    
+    lookups = [in_thread(Product.objects.select_related('category').filter(slug=slug).first)]
+    if user.is_authenticated:
+        # Goes by slug so it does not have to wait for the product
+        lookups.append(in_thread(SavedItem.objects.filter(user=user, product__slug=slug).exists))
+    product, *saved = await asyncio.gather(*lookups)
+    is_saved = bool(saved and saved[0])
+    if product is None:
+        raise Http404('No Product matches the given query.')
+    
+    recommended_products = await aget_cached_recommendations(user, product, limit=5)
+    
+    return await arender(request, 'store/product_detail.html', {
+        'product': product,
+        'recommended_products': recommended_products,
+        'is_saved': is_saved
+    })
+
+async def search(request):
+    query = request.GET.get('q', '').strip()
+    category_id = request.GET.get('category')
+    price_range = request.GET.get('price') or None
+    try:
+        category_id = int(category_id) if category_id else None
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        raise Http404('Invalid search parameters')
+    
+    results = await in_thread(
+        product_search.search,
+        query,
+        category_id=category_id,
+        price_range=price_range,
+        limit=SEARCH_RESULTS_PER_PAGE,
+        offset=(page - 1) * SEARCH_RESULTS_PER_PAGE
+    )
+    
+    return await arender(request, 'store/search_results.html', {
+        'query': query,
+        'products': results.products,
+        'total': results.total,
+        'facets': results.facets,
+        'page': page,
+        'has_next': page * SEARCH_RESULTS_PER_PAGE < results.total
+    })
@@ -0,0 +1,348 @@
+# store/benchmarks.py
+
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, NamedTuple
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import (
+    DEFAULT_DB_ALIAS, close_old_connections, connection, connections, transaction
+)
+from django.db.models import F
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment
+)
+from django.urls import reverse
+from cart.models import Cart, CartItem
+from .loadgen import LoadGenerator
+from .models import Product
+
+ORDER_FORM = {
+    'first_name': 'Bench',
+    'last_name': 'Mark',
+    'email': 'bench@example.com',
+    'address': '1 Benchmark Street',
+    'phone': '555-0100',
+    'payment_method': 'cash',
+}
+
+# Used only for templates this checkout does not have, so every endpoint
+# renders; they touch the same context a real page would
+FALLBACK_TEMPLATES = {
+    'cart/cart.html': (
+        '{% for item in cart_items %}{{ item.product.name }} {{ item.quantity }} {{ item.total_price }}{% endfor %}'
+        '{{ cart.total_price }}'
+    ),
+    'cart/checkout.html': '{{ form }}{{ cart.total_price }}',
+}
+
+class Rollback(Exception):
+    pass
+
+class Scenario(NamedTuple):
+    """
+    One benchmarked endpoint. ``prepare`` gets the BenchmarkRun and returns
+    (method, url, data); it runs inside the rolled-back transaction but is
+    not timed.
+    """
+    name: str
+    prepare: Callable
+
+def _home(run):
+    return 'get', reverse('store:home'), None
+
+def _product_list(run):
+    product = run.popular_product()
+    return 'get', reverse('store:category_detail', args=[product.category.slug]), None
+
+def _product_detail(run):
+    return 'get', reverse('store:product_detail', args=[run.popular_product().slug]), None
+
+def _cart_detail(run):
+    return 'get', reverse('cart:cart_detail'), None
+
+def _add_to_cart(run):
+    return 'get', reverse('cart:add_to_cart', args=[run.popular_product().id]), None
+
+def _update_cart(run):
+    item = CartItem.objects.filter(cart=run.cart).order_by('id').first()
+    return 'post', reverse('cart:update_cart', args=[item.id]), {'quantity': item.quantity + 1}
+
+def _checkout(run):
+    # Make sure the order goes through instead of bouncing on stock
+    Product.objects.filter(pk__in=CartItem.objects.filter(cart=run.cart).values('product')).update(
+        quantity=F('quantity') + 100
+    )
+    return 'post', reverse('cart:checkout'), ORDER_FORM
+
+SCENARIOS = (
+    Scenario('home', _home),
+    Scenario('product_list', _product_list),
+    Scenario('product_detail', _product_detail),
+    Scenario('cart_detail', _cart_detail),
+    Scenario('add_to_cart', _add_to_cart),
+    Scenario('update_cart', _update_cart),
+    Scenario('checkout', _checkout),
+)
+
+def _templates_with_fallback():
+    templates = [dict(backend, OPTIONS=dict(backend.get('OPTIONS', {}))) for backend in settings.TEMPLATES]
+    django_templates = templates[0]
+    loaders = ['django.template.loaders.filesystem.Loader']
+    if django_templates.pop('APP_DIRS', False):
+        loaders.append('django.template.loaders.app_directories.Loader')
+    django_templates['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', loaders),
+        ('django.template.loaders.locmem.Loader', FALLBACK_TEMPLATES),
+    ]
+    return templates
+
+class BenchmarkRun:
+    """
+    Drives the scenarios through the test client as one shopper with a
+    non-empty cart. Product picks follow the shopper-side popularity
+    (products in many carts and orders are picked more often).
+    
+    Args:
+        repeat: Timed requests per scenario
+        warmup: Untimed requests per scenario, to fill caches
+        seed: Seed of the product picks
+    """
+    
+    def __init__(self, repeat=20, warmup=2, seed=0):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.rng = random.Random(seed)
+        self.cart = Cart.objects.filter(items_count__gt=0).select_related('user').order_by('id').first()
+        if self.cart is None:
+            raise ValueError('The benchmark needs at least one user with a non-empty cart')
+        self.client = Client()
+        self.client.force_login(self.cart.user)
+        self.products = list(
+            Product.objects.select_related('category').order_by(
+                F('popularity__score_all').desc(nulls_last=True), 'id'
+            )[:1000]
+        )
+        self.weights = [1 / rank for rank in range(1, len(self.products) + 1)]
+    
+    def popular_product(self):
+        return self.rng.choices(self.products, weights=self.weights)[0]
+    
+    def request(self, scenario):
+        """
+        One request, rolled back afterwards.
+        
+        Returns:
+            (seconds, query count)
+        """
+        try:
+            with transaction.atomic():
+                method, url, data = scenario.prepare(self)
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = getattr(self.client, method)(url, data)
+                    elapsed = time.perf_counter() - start
+                if response.status_code >= 400:
+                    raise RuntimeError(f'{scenario.name}: {method.upper()} {url} returned {response.status_code}')
+                raise Rollback(elapsed, len(captured))
+        except Rollback as result:
+            return result.args
+    
+    def measure(self, scenario):
+        """
+        Returns:
+            Dict with p50_ms, p95_ms, queries (max seen) and alloc_kb (peak
+            memory allocated while serving one request)
+        """
+        for i in range(self.warmup):
+            self.request(scenario)
+        timings, queries = [], []
+        for i in range(self.repeat):
+            elapsed, count = self.request(scenario)
+            timings.append(elapsed * 1000)
+            queries.append(count)
+        
+        # Memory is traced on a separate request since tracing slows
+        # everything down
+        tracemalloc.start()
+        try:
+            self.request(scenario)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'queries': max(queries),
+            'alloc_kb': round(peak / 1024, 1),
+        }
+    
+    def run(self, scenarios=SCENARIOS):
+        with override_settings(TEMPLATES=_templates_with_fallback()):
+            return {scenario.name: self.measure(scenario) for scenario in scenarios}
+
+@contextmanager
+def benchmark_database(products=2000, seed=0, prefix='bench', current=False, path=None, users=None):
+    """
+    Set up the test environment (so the test client passes ALLOWED_HOSTS)
+    and, unless ``current`` is set, a throwaway test database filled with
+    generated data.
+    
+    Args:
+        products: Products to generate; 0 leaves the database empty for
+            the caller to fill
+        path: File for the test database instead of memory, needed when
+            several connections write at once
+        users: Number of users, products / 5 by default
+    """
+    try:
+        setup_test_environment()
+    except RuntimeError:
+        own_environment = False
+    else:
+        own_environment = True
+    test_settings = connections[DEFAULT_DB_ALIAS].settings_dict['TEST']
+    old_name = test_settings.get('NAME')
+    if path is not None:
+        test_settings['NAME'] = str(path)
+    old_config = None if current else setup_databases(verbosity=0, interactive=False)
+    try:
+        if old_config is not None and products:
+            LoadGenerator(prefix=prefix, seed=seed).generate(
+                users=users or max(products // 5, 10), products=products
+            )
+        yield
+    finally:
+        if old_config is not None:
+            teardown_databases(old_config, verbosity=0)
+        test_settings['NAME'] = old_name
+        if own_environment:
+            teardown_test_environment()
+
+def concurrent_add_to_cart(shoppers=8, requests=25, seed=0):
+    """
+    Write throughput under load: ``shoppers`` threads, each logged in as a
+    different user, add popular products to their carts ``requests`` times
+    as fast as they can. Connections are closed or kept after each request
+    as a server would (see CONN_MAX_AGE). Run it on a file database; an
+    in-memory one locks whole tables instead.
+    
+    Returns:
+        Dict with requests, errors (requests that failed, mostly with
+        "database is locked"), seconds, per_second (successful requests)
+        and p50_ms/p95_ms
+    """
+    users = list(User.objects.order_by('id')[:shoppers])
+    if len(users) < shoppers:
+        raise ValueError(f'The benchmark needs {shoppers} users')
+    product_ids = list(
+        Product.objects.order_by(
+            F('popularity__score_all').desc(nulls_last=True), 'id'
+        ).values_list('id', flat=True)[:200]
+    )
+    clients = []
+    for user in users:
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        clients.append(client)
+    connections.close_all()
+    start_together = threading.Barrier(shoppers)
+    request_logger = logging.getLogger('django.request')
+    
+    def shop(index):
+        rng = random.Random(seed + index)
+        timings, errors = [], 0
+        try:
+            start_together.wait()
+            for i in range(requests):
+                url = reverse('cart:add_to_cart', args=[rng.choice(product_ids)])
+                start = time.perf_counter()
+                failed = clients[index].get(url).status_code >= 400
+                timings.append((time.perf_counter() - start) * 1000)
+                errors += failed
+                close_old_connections()
+        finally:
+            connections.close_all()
+        return timings, errors
+    
+    # Failed requests are counted rather than logged, and get the plain 500
+    # page instead of the (slow) debug one
+    request_logger.disabled = True
+    try:
+        with override_settings(DEBUG=False, QUERY_BUDGET_MODE='off'):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=shoppers) as executor:
+                results = list(executor.map(shop, range(shoppers)))
+            elapsed = time.perf_counter() - start
+    finally:
+        request_logger.disabled = False
+    
+    timings = [timing for shopper_timings, errors in results for timing in shopper_timings]
+    errors = sum(errors for shopper_timings, errors in results)
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'per_second': round((len(timings) - errors) / elapsed, 1),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+    }
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile.
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+# How much worse than the baseline a metric may get before it is flagged,
+# and the absolute slack below which timing differences are noise
+TOLERANCE = 0.2
+MIN_SLOWDOWN_MS = 1.0
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare results with a baseline of the same shape
+    ({size: {scenario: metrics}}).
+    
+    Returns:
+        List of (size, scenario, metric, baseline value, new value) for
+        every regression
+    """
+    regressions = []
+    for size, scenarios in results.items():
+        for name, metrics in scenarios.items():
+            old = baseline.get(size, {}).get(name)
+            if not old:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                if metrics[metric] > old[metric] * (1 + tolerance) and metrics[metric] - old[metric] > MIN_SLOWDOWN_MS:
+                    regressions.append((size, name, metric, old[metric], metrics[metric]))
+            if metrics['queries'] > old['queries']:
+                regressions.append((size, name, 'queries', old['queries'], metrics['queries']))
+            if metrics['alloc_kb'] > old['alloc_kb'] * (1 + tolerance):
+                regressions.append((size, name, 'alloc_kb', old['alloc_kb'], metrics['alloc_kb']))
+    return regressions
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,246 @@
+# store/catalog.py
+
+import csv
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import transaction
+from django.utils.text import slugify
+from cart.models import Cart
+from .models import Category, Product, ProductImage
+from .recommendations import invalidate_recommendations
+from . import categories, facets, images, primary_images, sampling, search
+
+# Columns written by export and understood by import
+FIELDS = ('slug', 'name', 'category', 'category_name', 'price', 'quantity', 'description', 'image')
+
+# Product columns overwritten when an imported slug already exists
+UPDATE_FIELDS = ['name', 'category', 'price', 'quantity', 'description', 'updated']
+
+FORMATS = ('csv', 'jsonl')
+
+class InvalidRow(ValueError):
+    pass
+
+def detect_format(path, format=None):
+    """
+    The explicit format, or the one implied by the file extension.
+    """
+    format = format or path.rsplit('.', 1)[-1].lower()
+    if format == 'json':
+        format = 'jsonl'
+    if format not in FORMATS:
+        raise ValueError(f"Unknown catalog format {format!r}, use one of {', '.join(FORMATS)}")
+    return format
+
+def read_rows(stream, format):
+    """
+    Yield (line number, dict) pairs from a CSV or JSONL stream, one line at
+    a time.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_num, json.loads(line)
+
+def write_rows(stream, format, rows):
+    """
+    Write dicts to a CSV or JSONL stream as they come.
+    """
+    if format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    else:
+        for row in rows:
+            stream.write(json.dumps({field: row.get(field) for field in FIELDS}, default=str) + '\n')
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def clean_row(row):
+    """
+    Validate one imported row and normalize its values.
+    
+    Raises:
+        InvalidRow: If a required value is missing or malformed
+    """
+    name = (row.get('name') or '').strip()
+    category = (row.get('category') or row.get('category_name') or '').strip()
+    if not name:
+        raise InvalidRow('name is required')
+    if not category:
+        raise InvalidRow('category is required')
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+        quantity = int(row.get('quantity') or 0)
+    except (InvalidOperation, ValueError):
+        raise InvalidRow(f"bad price {row.get('price')!r} or quantity {row.get('quantity')!r}")
+    slug = slugify(row.get('slug') or name)[:200]
+    if not slug:
+        raise InvalidRow(f'cannot make a slug from {name!r}')
+    return {
+        'slug': slug,
+        'name': name[:200],
+        'category': slugify(category)[:100],
+        'category_name': (row.get('category_name') or category).strip()[:100],
+        'price': price,
+        'quantity': quantity,
+        'description': row.get('description') or '',
+        'image': (row.get('image') or '').strip(),
+    }
+
+class CatalogImporter:
+    """
+    Upserts products in batches keyed by slug. Categories are looked up
+    (and created) by slug once per batch, and the search index, facet
+    counts and other derived data are updated per batch instead of per
+    product, since bulk_create sends no signals.
+    """
+    
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.stats = Counter()
+    
+    def _category_ids(self, rows):
+        missing = {row['category']: row['category_name'] for row in rows if row['category'] not in self.categories}
+        if not missing:
+            return
+        # Categories added since __init__ (by the admin, another import) are only looked up
+        existing = dict(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+        self.categories.update(existing)
+        new = [Category(slug=slug, name=name) for slug, name in missing.items() if slug not in existing]
+        if new:
+            Category.objects.bulk_create(new, ignore_conflicts=True)
+            self.categories.update(
+                Category.objects.filter(slug__in=[category.slug for category in new]).values_list('slug', 'id')
+            )
+            self.stats['categories'] += len(new)
+            # bulk_create sends no post_save, which is what normally invalidates the category cache
+            categories.invalidate()
+    
+    def import_batch(self, rows):
+        """
+        Upsert one batch of cleaned rows (later rows win on duplicate slugs).
+        """
+        rows = list({row['slug']: row for row in rows}.values())
+        slugs = [row['slug'] for row in rows]
+        
+        with transaction.atomic():
+            self._category_ids(rows)
+            stored = {
+                slug: cell
+                for slug, *cell in Product.objects.filter(slug__in=slugs).values_list('slug', *facets.FACET_FIELDS)
+            }
+            previous = {slug: facets.facet_key(*cell) for slug, cell in stored.items()}
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        slug=row['slug'],
+                        name=row['name'],
+                        category_id=self.categories[row['category']],
+                        price=row['price'],
+                        quantity=row['quantity'],
+                        description=row['description']
+                    )
+                    for row in rows
+                ],
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=UPDATE_FIELDS
+            )
+            ids = dict(Product.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+            
+            deltas = Counter()
+            for row in rows:
+                deltas[previous.get(row['slug'])] -= 1
+                deltas[facets.facet_key(self.categories[row['category']], row['price'], row['quantity'])] += 1
+            facets.adjust(deltas)
+            
+            # FACET_FIELDS: category_id, price, quantity
+            repriced = [
+                ids[row['slug']] for row in rows if row['slug'] in stored and stored[row['slug']][1] != row['price']
+            ]
+            if repriced:
+                # bulk_create sends no post_save; carts holding these products have stale subtotals
+                Cart.objects.filter(items__product_id__in=repriced).recalculate_totals()
+            
+            self._import_images(rows, ids)
+            
+            product_ids = list(ids.values())
+            transaction.on_commit(lambda: search.index_products(product_ids))
+            invalidate_recommendations([ids[slug] for slug in previous])
+            if len(previous) < len(rows):
+                sampling.invalidate()
+        
+        self.stats['created'] += len(rows) - len(previous)
+        self.stats['updated'] += len(previous)
+    
+    def _import_images(self, rows, ids):
+        image_names = {ids[row['slug']]: row['image'] for row in rows if row['image']}
+        if not image_names:
+            return
+        existing = set(ProductImage.objects.filter(product_id__in=image_names).values_list('product_id', 'image'))
+        with_primary = set(ProductImage.objects.filter(
+            product_id__in=image_names, is_primary=True
+        ).values_list('product_id', flat=True))
+        new = [
+            ProductImage(product_id=product_id, image=image, is_primary=product_id not in with_primary)
+            for product_id, image in image_names.items() if (product_id, image) not in existing
+        ]
+        ProductImage.objects.bulk_create(new)
+        primary_images.rebuild([image.product_id for image in new if image.is_primary])
+        self.stats['images'] += len(new)
+        # Hashed and resized by the background worker pool
+        image_ids = [image.pk for image in new]
+        transaction.on_commit(lambda: images.schedule(ProductImage, image_ids))
+    
+    def run(self, rows, on_error=None, on_batch=None):
+        """
+        Import an iterable of (line number, raw row) pairs.
+        
+        Args:
+            rows: Raw rows as produced by read_rows
+            on_error: Called with (line number, InvalidRow) for skipped rows
+            on_batch: Called with the running stats after each batch
+        
+        Returns:
+            Counter with created/updated/skipped/categories/images totals
+        """
+        def cleaned():
+            for line_num, row in rows:
+                try:
+                    yield clean_row(row)
+                except InvalidRow as e:
+                    self.stats['skipped'] += 1
+                    if on_error:
+                        on_error(line_num, e)
+        
+        for batch in batched(cleaned(), self.batch_size):
+            self.import_batch(batch)
+            if on_batch:
+                on_batch(self.stats)
+        return self.stats
+
+def export_rows(queryset=None, chunk_size=2000):
+    """
+    Stream products as export dicts without loading the catalog in memory.
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('id').values(
+        'slug', 'name', 'category__slug', 'category__name', 'price', 'quantity', 'description', 'primary_image__image'
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        row['category'] = row.pop('category__slug')
+        row['category_name'] = row.pop('category__name')
+        row['image'] = row.pop('primary_image__image') or ''
+        yield row
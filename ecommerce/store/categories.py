@@ -0,0 +1,35 @@
+# store/categories.py
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from .models import Category
+from . import versions
+
+VERSION_CACHE_KEY = 'store:categories:version'
+CATEGORIES_TIMEOUT = 60 * 60 * 24
+
+_categories = {'version': None, 'items': []}
+
+def get_categories():
+    """
+    All categories, served from process memory while the version token in
+    the shared cache is unchanged. A process that sees a new version first
+    looks in the shared cache and only then queries the database.
+    """
+    version = versions.current(VERSION_CACHE_KEY)
+    if _categories['version'] != version:
+        key = f'store:categories:{version}'
+        items = cache.get(key)
+        if items is None:
+            # From the primary: a lagging replica would cache the old list under the new version
+            items = list(Category.objects.using(DEFAULT_DB_ALIAS))
+            cache.set(key, items, CATEGORIES_TIMEOUT)
+        _categories['items'] = items
+        _categories['version'] = version
+    return _categories['items']
+
+def invalidate():
+    """
+    Called when a category is saved or deleted.
+    """
+    versions.bump(VERSION_CACHE_KEY)
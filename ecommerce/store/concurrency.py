@@ -0,0 +1,29 @@
+# store/concurrency.py
+
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+def _closing_connections(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Worker threads are reused; treat each call like a request so
+            # its connection is closed (or kept, with CONN_MAX_AGE)
+            close_old_connections()
+    return wrapper
+
+async def in_thread(func, *args, **kwargs):
+    """
+    Run blocking code (ORM queries) in a worker thread with its own
+    database connection, so that several calls awaited together with
+    asyncio.gather() really run at the same time. Django's async ORM
+    methods (aget, aexists, ...) all go through the request's single sync
+    thread and never overlap.
+    
+    The worker connections run in autocommit and do not see uncommitted
+    writes of the request, so only use this for reads.
+    """
+    return await sync_to_async(_closing_connections(func), thread_sensitive=False)(*args, **kwargs)
@@ -1,9 +1,11 @@
-from .models import Category
+from .categories import get_categories
+from .metrics import timed
 
+@timed('store_context_processor_seconds', processor='categories')
 def categories(request):
     """
     Context processor to provide categories list to all templates
     """
     return {
-        'categories': Category.objects.all()
+        'categories': get_categories()
     }
\ No newline at end of file
@@ -0,0 +1,121 @@
+# store/cooccurrence.py
+
+import threading
+from collections import Counter, defaultdict
+from itertools import permutations
+from django.db import transaction
+from django.db.models import F, Q
+from cart.models import CartItem, OrderItem
+from .models import ProductCooccurrence, SavedItem
+
+# Rows deleted in the current thread whose post_delete has not fired yet,
+# per user. Queryset and cascade deletes remove the whole batch before any
+# post_delete runs, so pairs between two rows of the same batch would
+# otherwise never be decremented.
+_pending = threading.local()
+
+def _pending_deletes(user_id):
+    if not hasattr(_pending, 'users'):
+        _pending.users = defaultdict(Counter)
+    return _pending.users[user_id]
+
+def user_interactions(user_id):
+    """
+    Count the save/cart/order rows a user has per product.
+    
+    A product can be linked to a user through several rows (saved and in the
+    cart, ordered twice, ...); the pair scores only change when the first row
+    appears or the last one goes away.
+    """
+    saved = SavedItem.objects.filter(user_id=user_id).values_list('product_id', flat=True)
+    carted = CartItem.objects.filter(cart__user_id=user_id).values_list('product_id', flat=True)
+    ordered = OrderItem.objects.filter(order__user_id=user_id).values_list('product_id', flat=True)
+    return Counter(saved.union(carted, ordered, all=True))
+
+def _adjust(product_id, other_ids, delta):
+    if not other_ids:
+        return []
+    pairs = (
+        Q(product_id=product_id, related_id__in=other_ids) |
+        Q(product_id__in=other_ids, related_id=product_id)
+    )
+    with transaction.atomic():
+        if delta > 0:
+            ProductCooccurrence.objects.bulk_create(
+                [ProductCooccurrence(product_id=product_id, related_id=pk) for pk in other_ids] +
+                [ProductCooccurrence(product_id=pk, related_id=product_id) for pk in other_ids],
+                ignore_conflicts=True
+            )
+            ProductCooccurrence.objects.filter(pairs).update(score=F('score') + delta)
+        else:
+            ProductCooccurrence.objects.filter(pairs, score__gt=0).update(score=F('score') + delta)
+            ProductCooccurrence.objects.filter(pairs, score=0).delete()
+    return [product_id] + list(other_ids)
+
+def record_interaction(user_id, product_id):
+    """
+    Called after a SavedItem, CartItem or OrderItem row has been created.
+    
+    Returns:
+        IDs of the products whose co-occurrence scores changed
+    """
+    counts = user_interactions(user_id)
+    if counts[product_id] != 1:
+        return []
+    return _adjust(product_id, [pk for pk in counts if pk != product_id], 1)
+
+def pending_delete(user_id, product_id):
+    """
+    Called before a SavedItem, CartItem or OrderItem row is deleted.
+    """
+    _pending_deletes(user_id)[product_id] += 1
+
+def forget_interaction(user_id, product_id):
+    """
+    Called after a SavedItem, CartItem or OrderItem row has been deleted.
+    
+    Returns:
+        IDs of the products whose co-occurrence scores changed
+    """
+    pending = _pending_deletes(user_id)
+    pending[product_id] -= 1
+    pending += Counter()  # drop exhausted entries
+    if not pending:
+        del _pending.users[user_id]
+    
+    counts = user_interactions(user_id)
+    if counts[product_id] or pending[product_id]:
+        return []
+    return _adjust(product_id, list(set(counts) | set(pending)), -1)
+
+def rebuild(batch_size=1000):
+    """
+    Recompute the whole co-occurrence table from scratch.
+    
+    Returns:
+        Number of (product, related) rows written
+    """
+    baskets = defaultdict(set)
+    sources = (
+        SavedItem.objects.values_list('user_id', 'product_id'),
+        CartItem.objects.values_list('cart__user_id', 'product_id'),
+        OrderItem.objects.values_list('order__user_id', 'product_id'),
+    )
+    for queryset in sources:
+        for user_id, product_id in queryset.iterator(chunk_size=batch_size):
+            baskets[user_id].add(product_id)
+    
+    scores = Counter()
+    for product_ids in baskets.values():
+        scores.update(permutations(product_ids, 2))
+    
+    with transaction.atomic():
+        ProductCooccurrence.objects.all().delete()
+        ProductCooccurrence.objects.bulk_create(
+            [
+                ProductCooccurrence(product_id=product_id, related_id=related_id, score=score)
+                for (product_id, related_id), score in scores.items()
+            ],
+            batch_size=batch_size
+        )
+    return len(scores)
@@ -0,0 +1,74 @@
+# store/dbtuning.py
+
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.test.utils import override_settings
+from .replication import replica_aliases
+from .routers import read_aliases
+
+def apply_pragmas(connection, pragmas=None):
+    """
+    Run ``PRAGMA name = value`` for each of ``pragmas`` (SQLITE_PRAGMAS by
+    default) on an open SQLite connection. They go straight to the sqlite3
+    connection, so they are not counted as queries of whatever request
+    happened to open it.
+    """
+    pragmas = settings.SQLITE_PRAGMAS if pragmas is None else pragmas
+    for name, value in pragmas.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+def pragma_values(connection, names=None):
+    """
+    Returns:
+        Dict of the current value of each pragma (those of SQLITE_PRAGMAS
+        by default)
+    """
+    names = settings.SQLITE_PRAGMAS if names is None else names
+    connection.ensure_connection()
+    return {name: connection.connection.execute(f'PRAGMA {name}').fetchone()[0] for name in names}
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """
+    Tune every new SQLite connection (with SQLITE_TUNING on). File
+    databases get SQLITE_PRAGMAS; in-memory ones (the test database) have
+    no journal or file to map and are left as they are. Read aliases and
+    replicas are made query-only; on the others, transactions begin with
+    SQLITE_WRITE_TRANSACTION_MODE unless DATABASES sets a transaction_mode.
+    """
+    if connection.vendor != 'sqlite' or not getattr(settings, 'SQLITE_TUNING', False):
+        return
+    if not connection.is_in_memory_db():
+        apply_pragmas(connection)
+    if connection.alias in read_aliases() or connection.alias in replica_aliases():
+        connection.connection.execute('PRAGMA query_only = ON')
+    elif connection.transaction_mode is None:
+        connection.transaction_mode = settings.SQLITE_WRITE_TRANSACTION_MODE
+
+@contextmanager
+def tuning(enabled=True):
+    """
+    Open connections with the tuning on or off, for before/after
+    comparisons. Off means SQLite's defaults (rollback journal,
+    synchronous=FULL, deferred transactions) and a new connection per
+    request (CONN_MAX_AGE = 0). The connections of this thread are closed
+    on entry and exit; other threads must close theirs.
+    
+    WAL mode is stored in the database file, so compare on databases
+    created inside the block.
+    """
+    saved = {alias: connections.settings[alias].get('CONN_MAX_AGE', 0) for alias in connections.settings}
+    connections.close_all()
+    try:
+        with override_settings(SQLITE_TUNING=enabled):
+            if not enabled:
+                for alias in saved:
+                    connections.settings[alias]['CONN_MAX_AGE'] = 0
+            yield
+    finally:
+        connections.close_all()
+        for alias, max_age in saved.items():
+            connections.settings[alias]['CONN_MAX_AGE'] = max_age
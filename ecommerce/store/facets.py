@@ -0,0 +1,199 @@
+# store/facets.py
+
+from collections import Counter, defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from typing import NamedTuple
+from django.db import transaction
+from django.db.models import BooleanField, Case, CharField, Count, ExpressionWrapper, F, IntegerField, Q, Value, When
+from .models import Product, ProductFacetCount
+from .search import PRICE_RANGES, price_range
+
+FACET_FIELDS = ('category_id', 'price', 'quantity')
+
+class FacetCounts(NamedTuple):
+    """
+    Products matching the current filters (``total``) and, for each
+    facet, how many would match if that option were picked instead (the
+    facet's own filter is ignored when counting its options).
+    """
+    total: int
+    category: dict
+    price: dict
+    in_stock: dict
+
+def facet_key(category_id, price, quantity):
+    """
+    The (category, price range, in stock) cell a product is counted in.
+    """
+    return (category_id, price_range(Decimal(str(price))), int(quantity) > 0)
+
+def product_key(product):
+    """
+    Facet cell of a Product instance, or None if it was loaded without the
+    fields the cell depends on.
+    """
+    if any(field not in product.__dict__ for field in FACET_FIELDS):
+        return None
+    return facet_key(product.category_id, product.price, product.quantity)
+
+def stored_values(product_id):
+    """
+    The FACET_FIELDS values of a product as currently stored in the
+    database, or None if it does not exist.
+    """
+    return Product.objects.filter(pk=product_id).values_list(*FACET_FIELDS).first()
+
+def _cell(key):
+    category_id, label, in_stock = key
+    return Q(category_id=category_id, price_range=label, in_stock=in_stock)
+
+def adjust(deltas):
+    """
+    Apply a {cell: delta} batch to the facet count table in a fixed number
+    of queries.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if key is not None and delta}
+    if not deltas:
+        return
+    
+    by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        by_delta[delta].append(_cell(key))
+    
+    with transaction.atomic():
+        # Cells only need creating when something is added to them; this
+        # also keeps products deleted along with their category from
+        # recreating that category's cells
+        ProductFacetCount.objects.bulk_create(
+            [
+                ProductFacetCount(category_id=category_id, price_range=label, in_stock=in_stock)
+                for (category_id, label, in_stock), delta in deltas.items() if delta > 0
+            ],
+            ignore_conflicts=True
+        )
+        ProductFacetCount.objects.filter(reduce(or_, map(_cell, deltas))).update(
+            count=F('count') + Case(
+                *[When(reduce(or_, cells), then=Value(delta)) for delta, cells in by_delta.items()],
+                output_field=IntegerField()
+            )
+        )
+
+def product_changed(previous, current):
+    """
+    Move a product from its previous cell to its current one (either may be
+    None for creates and deletes).
+    """
+    if previous != current:
+        adjust({previous: -1, current: 1})
+
+def stock_taken(product_ids):
+    """
+    Move products whose stock has just run out to their sold-out cells.
+    Called after stock is decremented with a queryset UPDATE, which does
+    not send save signals.
+    """
+    deltas = Counter()
+    for category_id, price, quantity in Product.objects.filter(
+        pk__in=list(product_ids), quantity__lte=0
+    ).order_by().values_list(*FACET_FIELDS):
+        deltas[facet_key(category_id, price, 1)] -= 1
+        deltas[facet_key(category_id, price, 0)] += 1
+    adjust(deltas)
+
+def _price_q(label):
+    for name, low, high in PRICE_RANGES:
+        if name == label:
+            q = Q()
+            if low is not None:
+                q &= Q(price__gte=low)
+            if high is not None:
+                q &= Q(price__lt=high)
+            return q
+    raise ValueError(f"Unknown price range {label!r}")
+
+def rebuild():
+    """
+    Recount every cell from the products table.
+    
+    Returns:
+        Number of non-empty cells
+    """
+    cells = Product.objects.order_by().annotate(
+        price_bucket=Case(
+            *[When(_price_q(label), then=Value(label)) for label, low, high in PRICE_RANGES],
+            output_field=CharField()
+        ),
+        has_stock=ExpressionWrapper(Q(quantity__gt=0), output_field=BooleanField())
+    ).values('category_id', 'price_bucket', 'has_stock').annotate(n=Count('id'))
+    
+    with transaction.atomic():
+        ProductFacetCount.objects.all().delete()
+        ProductFacetCount.objects.bulk_create([
+            ProductFacetCount(
+                category_id=cell['category_id'],
+                price_range=cell['price_bucket'],
+                in_stock=cell['has_stock'],
+                count=cell['n']
+            )
+            for cell in cells
+        ])
+    return ProductFacetCount.objects.count()
+
+def filter_products(queryset, price_range=None, in_stock=None):
+    """
+    Narrow a Product queryset to a price range and/or stock state.
+    
+    Raises:
+        ValueError: If price_range is not one of PRICE_RANGES
+    """
+    if price_range is not None:
+        queryset = queryset.filter(_price_q(price_range))
+    if in_stock is True:
+        queryset = queryset.filter(quantity__gt=0)
+    elif in_stock is False:
+        queryset = queryset.filter(quantity__lte=0)
+    return queryset
+
+def get_facet_counts(category_id=None, price_range=None, in_stock=None):
+    """
+    Facet counts for a product listing, read from the facet count table
+    (one small query, independent of the number of products).
+    
+    Args:
+        category_id: Selected category, if any
+        price_range: Selected PRICE_RANGES label, if any
+        in_stock: True/False to filter on stock, None for both
+    
+    Returns:
+        FacetCounts
+    """
+    selected = {'category': category_id, 'price': price_range, 'in_stock': in_stock}
+    
+    def matches(cell, ignore=None):
+        return all(
+            value is None or facet == ignore or cell[facet] == value
+            for facet, value in selected.items()
+        )
+    
+    counts = FacetCounts(
+        total=0,
+        category=defaultdict(int),
+        price={label: 0 for label, low, high in PRICE_RANGES},
+        in_stock={True: 0, False: 0}
+    )
+    total = 0
+    for category, label, stock, n in ProductFacetCount.objects.filter(count__gt=0).values_list(
+        'category_id', 'price_range', 'in_stock', 'count'
+    ):
+        cell = {'category': category, 'price': label, 'in_stock': stock}
+        if matches(cell, 'category'):
+            counts.category[category] += n
+        if matches(cell, 'price'):
+            counts.price[label] += n
+        if matches(cell, 'in_stock'):
+            counts.in_stock[stock] += n
+        if matches(cell):
+            total += n
+    return counts._replace(total=total, category=dict(counts.category))
@@ -0,0 +1,96 @@
+# store/fragments.py
+
+import hashlib
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from .categories import VERSION_CACHE_KEY as CATEGORIES_VERSION_KEY
+from .models import Product
+from . import versions
+
+CARD_TEMPLATE = 'store/includes/product_card.html'
+RECOMMENDATIONS_TEMPLATE = 'store/includes/recommendations.html'
+
+# Seconds a fragment is kept; entries of changed products are never read
+# again and simply age out
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+def _cache():
+    return caches['fragments']
+
+def _stamp(product):
+    return f'{product.pk}.{product.updated.timestamp():.6f}'
+
+def card_key(product, categories_version):
+    """
+    Fragments are keyed by product ID and ``updated``, so saving a product
+    moves it to a new key. Cards show the category name, so renaming a
+    category (which bumps the categories version) moves them all.
+    """
+    return f'fragment:card:{categories_version}:{_stamp(product)}'
+
+def recommendations_key(product, recommended, categories_version):
+    stamps = hashlib.md5(','.join(_stamp(p) for p in recommended).encode()).hexdigest()
+    return f'fragment:recommendations:{categories_version}:{_stamp(product)}:{stamps}'
+
+def _prefetch_related(products):
+    # Listings load categories and primary images already; anything else
+    # gets them in one query each instead of one per card
+    for field in ('category', 'primary_image'):
+        uncached = [product for product in products if not getattr(Product, field).is_cached(product)]
+        if uncached:
+            prefetch_related_objects(uncached, field)
+
+def render_cards(products, template_name=CARD_TEMPLATE):
+    """
+    The HTML of each product's card. Cached cards are fetched with one
+    cache round trip; the others are rendered and stored together.
+    
+    Cards must not depend on the request: per-user state such as the saved
+    flag or the cart badge is rendered around them by the page.
+    
+    Args:
+        products: Products with ``category`` loaded (select_related)
+        template_name: Card template, rendered with ``product``
+    
+    Returns:
+        List of safe strings, in the order of ``products``
+    """
+    products = list(products)
+    if not products:
+        return []
+    cache = _cache()
+    categories_version = versions.current(CATEGORIES_VERSION_KEY)
+    keys = [card_key(product, categories_version) for product in products]
+    fragments = cache.get_many(keys)
+    
+    missing = [(key, product) for key, product in zip(keys, products) if key not in fragments]
+    if missing:
+        _prefetch_related([product for key, product in missing])
+        template = get_template(template_name)
+        rendered = {key: template.render({'product': product}) for key, product in missing}
+        cache.set_many(rendered, FRAGMENT_TIMEOUT)
+        fragments.update(rendered)
+    
+    return [mark_safe(fragments[key]) for key in keys]
+
+def render_recommendations(product, recommended, template_name=RECOMMENDATIONS_TEMPLATE):
+    """
+    The recommendation block of a product page, keyed by the product and
+    every recommended product, so it changes with any of them.
+    
+    Returns:
+        Safe string
+    """
+    recommended = list(recommended)
+    cache = _cache()
+    key = recommendations_key(product, recommended, versions.current(CATEGORIES_VERSION_KEY))
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = get_template(template_name).render({
+            'product': product,
+            'cards': render_cards(recommended),
+        })
+        cache.set(key, fragment, FRAGMENT_TIMEOUT)
+    return mark_safe(fragment)
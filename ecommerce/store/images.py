@@ -0,0 +1,270 @@
+# store/images.py
+
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import NamedTuple
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps
+from .models import Category, Product, ProductImage
+from . import categories
+
+logger = logging.getLogger(__name__)
+
+class Variant(NamedTuple):
+    width: int
+    height: int
+    crop: bool  # Fill the box exactly (center crop) instead of fitting inside it
+
+VARIANTS = {
+    'thumb': Variant(160, 160, True),
+    'card': Variant(400, 400, False),
+    'zoom': Variant(1600, 1600, False),
+}
+
+# Format name -> (file extension, MIME type, Pillow save options)
+FORMATS = {
+    'webp': ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DERIVED_DIR = 'derived'
+DERIVED_NAME_RE = re.compile(r'^(?P<hash>[0-9a-f]{32})\.(?P<ext>webp|jpg)$')
+
+# Models with an ``image`` field and an ``image_hash`` of its contents
+SOURCE_MODELS = (ProductImage, Category)
+
+def content_hash(field_file):
+    """
+    Hex digest identifying the contents of an image file; derivatives are
+    named after it, so identical uploads share them and a replaced upload
+    gets new URLs.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+def derived_name(image_hash, variant, fmt):
+    return f'{DERIVED_DIR}/{variant}/{image_hash}.{FORMATS[fmt][0]}'
+
+def derived_url(source, variant, fmt='jpeg'):
+    """
+    URL of a derivative of ``source`` (a ProductImage or Category). Falls
+    back to the original upload until the image has been hashed. Missing
+    derivative files are generated on first request, see
+    store.views.image_derivative.
+    """
+    if not source.image:
+        return ''
+    if not source.image_hash:
+        return source.image.url
+    return default_storage.url(derived_name(source.image_hash, variant, fmt))
+
+def output_width(variant, width, height):
+    """
+    Width of the ``variant`` derivative of a ``width`` x ``height``
+    original, as render_variant makes it.
+    """
+    spec = VARIANTS[variant]
+    if spec.crop:
+        return spec.width
+    scale = min(spec.width / width, spec.height / height, 1)
+    return max(round(width * scale), 1)
+
+def srcset(source, fmt='jpeg', variants=('card', 'zoom')):
+    """
+    ``srcset`` attribute value listing the derivatives by their actual
+    width, or '' while the image has not been processed yet. Variants are
+    never upscaled, so one that comes out no wider than the previous one
+    (the original is smaller than its box) is left out. The default
+    leaves out the cropped thumb, whose different aspect ratio the
+    browser would stretch.
+    """
+    if not source.image or not source.image_hash or not source.image_width:
+        return ''
+    entries, widest = [], 0
+    for variant in variants:
+        width = output_width(variant, source.image_width, source.image_height)
+        if width > widest:
+            entries.append(f'{derived_url(source, variant, fmt)} {width}w')
+            widest = width
+    return ', '.join(entries)
+
+def dimensions(field_file):
+    """
+    (width, height) of an image as displayed, i.e. after its EXIF
+    orientation is applied. Only the header is read.
+    """
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as image:
+            width, height = image.size
+            # Orientations 5-8 turn the image by 90 degrees
+            if image.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8):
+                width, height = height, width
+    finally:
+        field_file.close()
+    return width, height
+
+def render_variant(data, variant, fmt):
+    """
+    Resize and recompress an image.
+    
+    Args:
+        data: The original file contents
+        variant: Key of VARIANTS
+        fmt: Key of FORMATS
+    
+    Returns:
+        Encoded bytes
+    """
+    spec = VARIANTS[variant]
+    extension, mime, options = FORMATS[fmt]
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if spec.crop:
+            image = ImageOps.fit(image, (spec.width, spec.height), Image.LANCZOS)
+        else:
+            image.thumbnail((spec.width, spec.height), Image.LANCZOS)  # Never upscales
+        if fmt == 'jpeg' and image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        output = BytesIO()
+        image.save(output, format=fmt.upper(), **options)
+    return output.getvalue()
+
+def _store(name, content):
+    if default_storage.exists(name):
+        return
+    saved = default_storage.save(name, ContentFile(content))
+    if saved != name:
+        # Another worker wrote the same derivative meanwhile
+        default_storage.delete(saved)
+
+def generate(source_name, image_hash, variants=None, formats=None):
+    """
+    Write the missing derivatives of one original.
+    
+    Returns:
+        Number of files written
+    """
+    wanted = [
+        (variant, fmt)
+        for variant in (variants or VARIANTS)
+        for fmt in (formats or FORMATS)
+        if not default_storage.exists(derived_name(image_hash, variant, fmt))
+    ]
+    if not wanted:
+        return 0
+    with default_storage.open(source_name, 'rb') as f:
+        data = f.read()
+    for variant, fmt in wanted:
+        _store(derived_name(image_hash, variant, fmt), render_variant(data, variant, fmt))
+    return len(wanted)
+
+def process(model, pk):
+    """
+    Hash one ProductImage or Category image and generate its derivatives.
+    A changed hash or size is stored with an UPDATE, and for product images
+    Product.updated is touched so cached product cards pick up the new
+    URLs; for categories the category cache is invalidated, since the
+    UPDATE sends no save signal. The row is read from the primary, since
+    this runs right after it was written.
+    
+    Returns:
+        Number of derivative files written
+    """
+    source = model.objects.using(DEFAULT_DB_ALIAS).filter(pk=pk).first()
+    if source is None or not source.image:
+        return 0
+    if not default_storage.exists(source.image.name):
+        logger.warning('%s %s: %s is missing', model.__name__, pk, source.image.name)
+        return 0
+    image_hash = content_hash(source.image)
+    width, height = dimensions(source.image)
+    if (image_hash, width, height) != (source.image_hash, source.image_width, source.image_height):
+        model.objects.filter(pk=pk).update(image_hash=image_hash, image_width=width, image_height=height)
+        if model is ProductImage:
+            Product.objects.filter(pk=source.product_id).update(updated=timezone.now())
+        elif model is Category:
+            categories.invalidate()
+    return generate(source.image.name, image_hash)
+
+def _process_job(model, pk):
+    try:
+        return process(model, pk)
+    except Exception:
+        logger.exception('Could not generate derivatives of %s %s', model.__name__, pk)
+        return 0
+    finally:
+        close_old_connections()
+
+_pool = {'executor': None}
+_pool_lock = threading.Lock()
+
+def _executor():
+    with _pool_lock:
+        if _pool['executor'] is None:
+            _pool['executor'] = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-derivatives'
+            )
+        return _pool['executor']
+
+def schedule(model, pks):
+    """
+    Process images in the background worker pool (synchronously with
+    IMAGE_WORKERS = 0). Called once the transaction that wrote them
+    commits.
+    
+    Returns:
+        List of futures (empty when run synchronously)
+    """
+    if not getattr(settings, 'IMAGE_WORKERS', 0):
+        for pk in pks:
+            _process_job(model, pk)
+        return []
+    executor = _executor()
+    return [executor.submit(_process_job, model, pk) for pk in pks]
+
+def process_many(model, pks, workers=None):
+    """
+    Process images with a pool of ``workers`` threads (IMAGE_WORKERS by
+    default) and wait for them.
+    
+    Returns:
+        Number of derivative files written
+    """
+    workers = settings.IMAGE_WORKERS if workers is None else workers
+    if workers <= 1:
+        return sum(_process_job(model, pk) for pk in pks)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(partial(_process_job, model), pks))
+
+def find_source(image_hash):
+    """
+    The stored name of an original with this content hash, or None.
+    """
+    for model in SOURCE_MODELS:
+        name = model.objects.filter(
+            image_hash=image_hash
+        ).values_list('image', flat=True).first()
+        if name:
+            return name
+    return None
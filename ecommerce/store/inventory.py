@@ -0,0 +1,230 @@
+# store/inventory.py
+
+from collections import defaultdict
+from datetime import timedelta
+from typing import NamedTuple, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Product, StockReservation
+from . import facets
+
+# How many times a partial take is retried when stock changes between the
+# availability read and the conditional UPDATE
+TAKE_ATTEMPTS = 3
+
+class InsufficientStock(Exception):
+    """
+    Raised when some products do not have enough stock; ``product_ids``
+    lists the ones that fell short.
+    """
+    
+    def __init__(self, product_ids):
+        super().__init__(f"Insufficient stock for products {product_ids}")
+        self.product_ids = product_ids
+
+class StockLine(NamedTuple):
+    """
+    Outcome of taking or holding stock for one product.
+    """
+    product_id: int
+    requested: int
+    available: Optional[int]  # None when the fast path did not need to read it
+    taken: bool
+
+class _StockChanged(Exception):
+    pass
+
+def _wanted(quantities):
+    # One WHEN per distinct quantity keeps the expression small for big carts
+    by_quantity = defaultdict(list)
+    for product_id, quantity in quantities.items():
+        by_quantity[quantity].append(product_id)
+    return Case(
+        *[When(pk__in=ids, then=Value(quantity)) for quantity, ids in by_quantity.items()],
+        output_field=IntegerField()
+    )
+
+def _held_by_others(cart_id, now):
+    """
+    Stock held by live reservations of carts other than cart_id, as a
+    subquery correlated with the product.
+    """
+    held = StockReservation.objects.filter(
+        product=OuterRef('pk'), expires_at__gt=now
+    )
+    if cart_id is not None:
+        held = held.exclude(cart_id=cart_id)
+    return Coalesce(
+        Subquery(held.order_by().values('product').annotate(total=Sum('quantity')).values('total')),
+        0
+    )
+
+def available_stock(product_ids, cart_id=None, lock=False):
+    """
+    Stock of each product that is not held by other carts.
+    
+    Returns:
+        Dict mapping product ID to available quantity (missing products are left out)
+    """
+    queryset = Product.objects.filter(pk__in=product_ids)
+    if lock:
+        queryset = queryset.select_for_update()
+    return dict(queryset.annotate(
+        available=F('quantity') - _held_by_others(cart_id, timezone.now())
+    ).values_list('pk', 'available'))
+
+def _lines(quantities, available, taken):
+    return {
+        product_id: StockLine(
+            product_id,
+            quantity,
+            None if available is None else available.get(product_id, 0),
+            product_id in taken
+        )
+        for product_id, quantity in quantities.items()
+    }
+
+def _update(quantities, cart_id):
+    """
+    The conditional UPDATE: only rows that still have enough unheld stock
+    are decremented. Returns the number of rows changed.
+    """
+    wanted = _wanted(quantities)
+    return Product.objects.filter(
+        pk__in=quantities,
+        quantity__gte=wanted + _held_by_others(cart_id, timezone.now())
+    ).update(quantity=F('quantity') - wanted)
+
+def take_stock(quantities, cart_id=None, partial=False):
+    """
+    Take stock for a batch of products (an order).
+    
+    All-or-nothing by default: a single conditional UPDATE either
+    decrements every product or, if any row lacks stock, is rolled back.
+    With ``partial=True`` the lines that fit are taken and the others are
+    reported. Either way the database never goes below the stock held by
+    other carts' reservations, so concurrent takers cannot oversell.
+    
+    Args:
+        quantities: Mapping of product ID to the quantity to take
+        cart_id: Cart whose own reservations may be used (and are released)
+        partial: Take what is available instead of all-or-nothing
+    
+    Returns:
+        Dict mapping product ID to a StockLine
+    """
+    if not quantities:
+        return {}
+    
+    if not partial:
+        try:
+            with transaction.atomic():
+                if _update(quantities, cart_id) != len(quantities):
+                    raise _StockChanged
+                facets.stock_taken(quantities)
+                _release(cart_id, quantities)
+            return _lines(quantities, None, quantities)
+        except _StockChanged:
+            return _lines(quantities, available_stock(quantities, cart_id), ())
+    
+    for attempt in range(TAKE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                available = available_stock(quantities, cart_id, lock=True)
+                fits = {
+                    product_id: quantity for product_id, quantity in quantities.items()
+                    if available.get(product_id, 0) >= quantity
+                }
+                if fits and _update(fits, cart_id) != len(fits):
+                    raise _StockChanged
+                facets.stock_taken(fits)
+                _release(cart_id, fits)
+            return _lines(quantities, available, fits)
+        except _StockChanged:
+            continue
+    
+    # Stock kept moving under us: settle each line on its own
+    taken = set()
+    for product_id, quantity in quantities.items():
+        with transaction.atomic():
+            if _update({product_id: quantity}, cart_id):
+                facets.stock_taken([product_id])
+                _release(cart_id, [product_id])
+                taken.add(product_id)
+    return _lines(quantities, available_stock(quantities, cart_id), taken)
+
+def decrement_stock(quantities, cart_id=None):
+    """
+    All-or-nothing take_stock that raises instead of returning lines.
+    
+    Raises:
+        InsufficientStock: If any product has less stock than requested
+    """
+    lines = take_stock(quantities, cart_id=cart_id)
+    missed = [line for line in lines.values() if not line.taken]
+    if missed:
+        # Name the lines that lack stock; if stock moved in the meantime and
+        # all of them look fine now, name every line that was not taken
+        short = [line.product_id for line in missed if line.available < line.requested]
+        raise InsufficientStock(sorted(short or [line.product_id for line in missed]))
+
+def reservation_ttl():
+    """
+    How long cart reservations last, or None when carts do not hold stock
+    (settings.CART_RESERVATION_TTL, in seconds).
+    """
+    ttl = getattr(settings, 'CART_RESERVATION_TTL', None)
+    return timedelta(seconds=ttl) if ttl else None
+
+def hold_for_cart(cart_id, quantities, ttl=None):
+    """
+    Hold stock for a cart until it expires, without touching
+    Product.quantity. Each line is set to exactly the requested quantity
+    (0 releases it); lines that cannot be held keep their previous hold.
+    
+    Returns:
+        Dict mapping product ID to a StockLine
+    """
+    ttl = ttl or reservation_ttl() or timedelta(minutes=15)
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        available = available_stock(quantities, cart_id, lock=True)
+        held = {
+            product_id: quantity for product_id, quantity in quantities.items()
+            if quantity > 0 and available.get(product_id, 0) >= quantity
+        }
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(cart_id=cart_id, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in held.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'expires_at']
+        )
+        _release(cart_id, [pk for pk, quantity in quantities.items() if quantity == 0])
+    return _lines(quantities, available, held)
+
+def _release(cart_id, product_ids):
+    if cart_id is not None and product_ids:
+        StockReservation.objects.filter(cart_id=cart_id, product_id__in=list(product_ids)).delete()
+
+def release_for_cart(cart_id, product_ids=None):
+    """
+    Drop a cart's reservations (all of them, or only for product_ids).
+    """
+    reservations = StockReservation.objects.filter(cart_id=cart_id)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    reservations.delete()
+
+def purge_expired_reservations(now=None):
+    """
+    Delete expired reservations. They already stopped counting when they
+    expired; this only keeps the table small.
+    """
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,314 @@
+# store/loadgen.py
+
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from decimal import Decimal
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save
+from cart.models import Cart, CartItem, Order, OrderItem
+from users.models import Profile, create_user_profile, save_user_profile
+from .models import Category, Product, ProductImage, SavedItem
+from . import categories as category_cache
+from . import cooccurrence, facets, popularity, primary_images, sampling, search
+from . import signals as store_signals
+
+ADJECTIVES = (
+    'Classic', 'Compact', 'Deluxe', 'Eco', 'Essential', 'Lightweight', 'Modern',
+    'Portable', 'Premium', 'Pro', 'Rugged', 'Smart', 'Ultra', 'Vintage', 'Wireless',
+)
+
+NOUNS = (
+    'Backpack', 'Blender', 'Camera', 'Chair', 'Desk Lamp', 'Headphones', 'Jacket',
+    'Kettle', 'Keyboard', 'Notebook', 'Running Shoes', 'Speaker', 'Tent', 'Watch', 'Yoga Mat',
+)
+
+WORDS = (
+    'durable', 'everyday', 'design', 'quality', 'comfortable', 'battery', 'travel',
+    'home', 'outdoor', 'office', 'stylish', 'easy', 'clean', 'fast', 'warranty',
+)
+
+STATUSES = [status for status, label in Order.STATUS_CHOICES]
+
+# Every generated user gets this password
+PASSWORD = 'loadtest'
+
+class Zipf:
+    """
+    Draws items with probability proportional to 1 / rank ** exponent, so a
+    few items get most of the traffic like real product popularity. Ranks
+    are assigned to the items in random order.
+    """
+    
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+    
+    def draw(self, k):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+    
+    def distinct(self, k):
+        """
+        Up to k different items, popular ones more likely.
+        """
+        k = min(k, len(self.items))
+        picked = set()
+        for attempt in range(4):
+            picked.update(self.draw(k - len(picked)))
+            if len(picked) >= k:
+                break
+        return list(picked)[:k]
+
+@contextmanager
+def signals_muted():
+    """
+    Disconnect the per-row User -> Profile post_save receivers (profiles are
+    bulk-created instead) and suspend the store's interaction bookkeeping
+    (derived tables are rebuilt once at the end).
+    """
+    post_save.disconnect(create_user_profile, sender=User)
+    post_save.disconnect(save_user_profile, sender=User)
+    try:
+        with store_signals.suspended():
+            yield
+    finally:
+        post_save.connect(create_user_profile, sender=User)
+        post_save.connect(save_user_profile, sender=User)
+
+class LoadGenerator:
+    """
+    Bulk-generates a synthetic store: users with profiles, categories,
+    products with images, saved items, carts and orders. Product choice
+    follows a Zipf distribution and everything is reproducible from the
+    seed.
+    
+    Args:
+        prefix: Prefix of generated usernames and slugs, so several data
+            sets can coexist
+        seed: Random seed
+        batch_size: Rows per bulk insert
+        exponent: Zipf exponent of product popularity
+        log: Called with progress messages
+    """
+    
+    def __init__(self, prefix='load', seed=0, batch_size=5000, exponent=1.1, log=None):
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.exponent = exponent
+        self.log = log or (lambda message: None)
+        self.counts = {}
+    
+    def _timed(self, label, rows):
+        self.counts[label] = rows
+        rate = rows / max(time.monotonic() - self._started, 1e-6)
+        self.log(f'{label}: {rows} rows ({rate:.0f}/s)')
+    
+    def _batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(start + self.batch_size, total))
+    
+    def users(self, n):
+        self._started = time.monotonic()
+        password = make_password(PASSWORD)
+        ids = array('q')
+        for batch in self._batches(n):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'{self.prefix}-user-{i}', email=f'{self.prefix}-user-{i}@example.com', password=password)
+                    for i in batch
+                ])
+                Profile.objects.bulk_create([
+                    Profile(user=user, address=f'{self.rng.randint(1, 999)} Load Street', phone_number=f'555{user.pk:07d}'[:15])
+                    for user in users
+                ])
+            ids.extend(user.pk for user in users)
+        self._timed('users', len(ids))
+        return ids
+    
+    def categories(self, n):
+        self._started = time.monotonic()
+        created = Category.objects.bulk_create([
+            Category(name=f'{self.prefix.title()} Category {i}', slug=f'{self.prefix}-category-{i}')
+            for i in range(n)
+        ])
+        self._timed('categories', len(created))
+        return [category.pk for category in created]
+    
+    def products(self, n, category_ids, images=1):
+        """
+        Returns:
+            (product IDs, prices in cents) as parallel arrays
+        """
+        self._started = time.monotonic()
+        rng = self.rng
+        ids, prices = array('q'), array('q')
+        image_count = 0
+        for batch in self._batches(n):
+            rows = []
+            for i in batch:
+                cents = int(min(rng.lognormvariate(3.5, 1.0), 5000) * 100) + 99
+                name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}'
+                rows.append(Product(
+                    category_id=rng.choice(category_ids),
+                    name=name,
+                    slug=f'{self.prefix}-product-{i}',
+                    price=Decimal(cents) / 100,
+                    quantity=0 if rng.random() < 0.05 else rng.randint(1, 500),
+                    description=' '.join(rng.choices(WORDS, k=12))
+                ))
+            with transaction.atomic():
+                products = Product.objects.bulk_create(rows)
+                product_images = ProductImage.objects.bulk_create([
+                    ProductImage(product=product, image=f'products/{product.slug}-{j}.jpg', is_primary=j == 0)
+                    for product in products for j in range(images)
+                ])
+                if images:
+                    primary_images.rebuild([product.pk for product in products])
+            ids.extend(product.pk for product in products)
+            prices.extend(int(product.price * 100) for product in products)
+            image_count += len(product_images)
+        self._timed('products', len(ids))
+        self._timed('images', image_count)
+        return ids, prices
+    
+    def _per_user(self, mean):
+        # Geometric-ish spread: most users have a few rows, some many
+        return int(self.rng.expovariate(1 / mean)) if mean else 0
+    
+    def saved_items(self, user_ids, zipf, mean):
+        self._started = time.monotonic()
+        total = 0
+        pending = []
+        for user_id in user_ids:
+            pending.extend(SavedItem(user_id=user_id, product_id=pk) for pk in zipf.distinct(self._per_user(mean)))
+            if len(pending) >= self.batch_size:
+                SavedItem.objects.bulk_create(pending)
+                total += len(pending)
+                pending = []
+        SavedItem.objects.bulk_create(pending)
+        self._timed('saved items', total + len(pending))
+    
+    def carts(self, user_ids, zipf, price_of, share, mean):
+        self._started = time.monotonic()
+        total = 0
+        shoppers = [user_id for user_id in user_ids if self.rng.random() < share]
+        for start in range(0, len(shoppers), self.batch_size):
+            lines = {}
+            carts = []
+            for user_id in shoppers[start:start + self.batch_size]:
+                items = {pk: self.rng.randint(1, 3) for pk in zipf.distinct(max(self._per_user(mean), 1))}
+                subtotal = sum(price_of[pk] * quantity for pk, quantity in items.items())
+                carts.append(Cart(user_id=user_id, items_count=len(items), subtotal=Decimal(subtotal) / 100))
+                lines[user_id] = items
+            with transaction.atomic():
+                carts = Cart.objects.bulk_create(carts)
+                items = CartItem.objects.bulk_create(
+                    [
+                        CartItem(cart=cart, product_id=pk, quantity=quantity)
+                        for cart in carts for pk, quantity in lines[cart.user_id].items()
+                    ],
+                    batch_size=self.batch_size
+                )
+            total += len(items)
+        self.counts['carts'] = len(shoppers)
+        self._timed('cart items', total)
+    
+    def orders(self, user_ids, zipf, price_of, mean_orders, mean_items):
+        self._started = time.monotonic()
+        order_total = item_total = 0
+        pending = []
+        
+        def flush():
+            nonlocal order_total, item_total
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([order for order, items in pending])
+                order_items = OrderItem.objects.bulk_create(
+                    [
+                        OrderItem(order=order, product_id=pk, price=Decimal(price_of[pk]) / 100, quantity=quantity)
+                        for order, (unsaved, items) in zip(orders, pending)
+                        for pk, quantity in items.items()
+                    ],
+                    batch_size=self.batch_size
+                )
+            order_total += len(orders)
+            item_total += len(order_items)
+            pending.clear()
+        
+        for user_id in user_ids:
+            for n in range(self._per_user(mean_orders)):
+                items = {pk: self.rng.randint(1, 3) for pk in zipf.distinct(max(self._per_user(mean_items), 1))}
+                grand_total = Decimal(sum(price_of[pk] * quantity for pk, quantity in items.items())) / 100
+                pending.append((Order(
+                    user_id=user_id,
+                    first_name='Load',
+                    last_name=f'User {user_id}',
+                    email=f'{self.prefix}-user-{user_id}@example.com',
+                    address='1 Load Street',
+                    phone='5550000000',
+                    status=self.rng.choice(STATUSES),
+                    grand_total=grand_total
+                ), items))
+                if len(pending) >= self.batch_size:
+                    flush()
+        if pending:
+            flush()
+        self._timed('orders', order_total)
+        self._timed('order items', item_total)
+    
+    def rebuild_derived(self):
+        """
+        Recompute the tables and caches that signals normally keep up to
+        date (bulk inserts do not send them).
+        """
+        for label, rebuild in (
+            ('facet counts', facets.rebuild),
+            ('search index', search.rebuild),
+            ('popularity', popularity.rebuild),
+            ('co-occurrence', cooccurrence.rebuild),
+        ):
+            started = time.monotonic()
+            rebuild()
+            self.log(f'{label} rebuilt in {time.monotonic() - started:.1f}s')
+        sampling.invalidate()
+        category_cache.invalidate()
+    
+    def generate(self, users=1000, categories=20, products=10000, images=1, saved=5,
+                 cart_share=0.3, cart_items=3, orders=2, order_items=3, derived=True):
+        """
+        Generate a whole data set.
+        
+        Args:
+            users: Number of users (each with a profile)
+            categories: Number of categories
+            products: Number of products
+            images: Images per product (the first one is primary)
+            saved: Mean saved items per user
+            cart_share: Fraction of users with a non-empty cart
+            cart_items: Mean lines per cart
+            orders: Mean orders per user
+            order_items: Mean lines per order
+            derived: Rebuild facet counts, search, popularity and
+                co-occurrence afterwards
+        
+        Returns:
+            Dict of row counts per table
+        """
+        with signals_muted():
+            user_ids = self.users(users)
+            category_ids = self.categories(categories)
+            product_ids, prices = self.products(products, category_ids, images)
+            zipf = Zipf(product_ids, self.exponent, self.rng)
+            price_of = dict(zip(product_ids, prices))
+            self.saved_items(user_ids, zipf, saved)
+            self.carts(user_ids, zipf, price_of, cart_share, cart_items)
+            self.orders(user_ids, zipf, price_of, orders, order_items)
+        if derived:
+            self.rebuild_derived()
+        return self.counts
@@ -0,0 +1,91 @@
+# store/management/commands/benchmark.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from store import benchmarks
+from store.loadgen import LoadGenerator
+from store.models import Product
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the store and cart hot paths (p50/p95 latency, queries, memory) on generated '
+        'data sets of increasing size and compare with a stored baseline'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                            help='Number of products of each data set')
+        parser.add_argument('--users-per-product', type=float, default=0.2)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='+', choices=[s.name for s in benchmarks.SCENARIOS],
+                            help='Run only these scenarios')
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmark_baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=benchmarks.TOLERANCE)
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--current-db', action='store_true',
+                            help='Benchmark the configured database as it is instead of generated data')
+    
+    def handle(self, *args, **options):
+        scenarios = [s for s in benchmarks.SCENARIOS if not options['only'] or s.name in options['only']]
+        
+        # A throwaway test database, grown to each size in turn, keeps
+        # generated data out of the real one
+        with benchmarks.benchmark_database(products=0, current=options['current_db']):
+            if options['current_db']:
+                results = {'current': self.run_benchmarks(scenarios, options)}
+            else:
+                results = {}
+                for index, size in enumerate(sorted(options['sizes'])):
+                    self.grow(size, index, options)
+                    results[str(size)] = self.run_benchmarks(scenarios, options)
+        
+        baseline = benchmarks.load_baseline(options['baseline'])
+        regressions = benchmarks.compare(results, baseline, options['tolerance'])
+        self.report(results, baseline, regressions)
+        
+        if options['save_baseline']:
+            benchmarks.save_baseline(options['baseline'], {**baseline, **results})
+            self.stdout.write(f"Baseline written to {options['baseline']}")
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regressions against the baseline')
+    
+    def grow(self, size, index, options):
+        """
+        Top the data set up to ``size`` products.
+        """
+        missing = size - Product.objects.count()
+        if missing <= 0:
+            return
+        self.stdout.write(f'Generating data set with {size} products...')
+        LoadGenerator(prefix=f'bench{index}', seed=options['seed'] + index).generate(
+            users=max(int(missing * options['users_per_product']), 10),
+            categories=max(missing // 500, 5),
+            products=missing
+        )
+    
+    def run_benchmarks(self, scenarios, options):
+        run = benchmarks.BenchmarkRun(repeat=options['repeat'], warmup=options['warmup'], seed=options['seed'])
+        return run.run(scenarios)
+    
+    def report(self, results, baseline, regressions):
+        flagged = {(size, name) for size, name, metric, old, new in regressions}
+        self.stdout.write(
+            f"{'size':>8} {'endpoint':<15} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'alloc KB':>9}  baseline p95/queries"
+        )
+        for size, scenarios in results.items():
+            for name, metrics in scenarios.items():
+                old = baseline.get(size, {}).get(name)
+                compared = f"{old['p95_ms']:>8.2f} {old['queries']:>4}" if old else '       -'
+                line = (
+                    f"{size:>8} {name:<15} {metrics['p50_ms']:>8.2f} {metrics['p95_ms']:>8.2f} "
+                    f"{metrics['queries']:>8} {metrics['alloc_kb']:>9.1f}  {compared}"
+                )
+                self.stdout.write(self.style.ERROR(line + '  REGRESSION') if (size, name) in flagged else line)
+        
+        for size, name, metric, old, new in regressions:
+            self.stdout.write(self.style.WARNING(f'{name} @ {size}: {metric} {old} -> {new}'))
+        if baseline and not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
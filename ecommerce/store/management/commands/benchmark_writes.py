@@ -0,0 +1,45 @@
+# store/management/commands/benchmark_writes.py
+
+import tempfile
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from store import benchmarks, dbtuning
+
+class Command(BaseCommand):
+    help = (
+        'Measure add_to_cart write throughput with concurrent shoppers on a file database, '
+        'with the SQLite tuning (WAL, IMMEDIATE transactions, persistent connections) off and on'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--shoppers', type=int, default=8, help='Concurrent shopper threads')
+        parser.add_argument('--requests', type=int, default=25, help='add_to_cart requests per shopper')
+        parser.add_argument('--products', type=int, default=500, help='Size of the generated data set')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--modes', nargs='+', choices=['untuned', 'tuned'], default=['untuned', 'tuned'])
+    
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in options['modes']:
+                # A new database per mode, since WAL mode sticks to the file
+                self.stdout.write(f'Running {mode}...')
+                with dbtuning.tuning(mode == 'tuned'), benchmarks.benchmark_database(
+                    options['products'], options['seed'], prefix='writes',
+                    path=Path(directory) / f'{mode}.sqlite3', users=max(options['shoppers'], 10)
+                ):
+                    results[mode] = benchmarks.concurrent_add_to_cart(
+                        options['shoppers'], options['requests'], options['seed']
+                    )
+        
+        self.stdout.write(
+            f"{'mode':<8} {'requests':>8} {'errors':>7} {'seconds':>8} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8}"
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<8} {result['requests']:>8} {result['errors']:>7} {result['seconds']:>8.2f} "
+                f"{result['per_second']:>7.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}"
+            )
+        if 'untuned' in results and 'tuned' in results and results['untuned']['per_second']:
+            speedup = results['tuned']['per_second'] / results['untuned']['per_second']
+            self.stdout.write(self.style.SUCCESS(f'Tuned: {speedup:.1f}x the successful writes per second'))
@@ -0,0 +1,30 @@
+# store/management/commands/check_query_budgets.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from store import benchmarks, querybudget
+
+class Command(BaseCommand):
+    help = 'Run the store and cart views against their query budgets and print a per-view report'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Size of the generated data set')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--current-db', action='store_true',
+                            help='Use the configured database as it is instead of generated data')
+    
+    def handle(self, *args, **options):
+        with benchmarks.benchmark_database(
+            options['products'], options['seed'], prefix='budget', current=options['current_db']
+        ):
+            querybudget.reset()
+            run = benchmarks.BenchmarkRun(repeat=options['repeat'], seed=options['seed'])
+            with override_settings(QUERY_BUDGET_MODE='log'):
+                run.run()
+        
+        self.stdout.write(querybudget.report())
+        offenders = [view_name for view_name, row in querybudget.summary().items() if row['over_budget']]
+        if offenders:
+            raise CommandError(f"Over budget: {', '.join(offenders)}")
+        self.stdout.write(self.style.SUCCESS('All views within their query budgets'))
@@ -0,0 +1,46 @@
+# store/management/commands/check_query_plans.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection
+from store import benchmarks, queryplans
+
+class Command(BaseCommand):
+    help = (
+        'Replay the benchmark scenarios, run EXPLAIN QUERY PLAN on every query shape they '
+        'issue and report full table scans and sorts (index regressions)'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Size of the generated data set')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--current-db', action='store_true',
+                            help='Use the configured database as it is instead of generated data')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Ignore full scans of tables smaller than this')
+        parser.add_argument('--ignore-sorts', action='store_true',
+                            help='Do not report sorts done in a temporary B-tree')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plans of all queries')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error if anything is reported')
+    
+    def handle(self, *args, **options):
+        collector = queryplans.QueryCollector()
+        with benchmarks.benchmark_database(
+            options['products'], options['seed'], prefix='plans', current=options['current_db']
+        ):
+            run = benchmarks.BenchmarkRun(repeat=1, warmup=0, seed=options['seed'])
+            with connection.execute_wrapper(collector):
+                for scenario in benchmarks.SCENARIOS:
+                    collector.label = scenario.name
+                    run.run([scenario])
+                for name, probe in queryplans.PROBES.items():
+                    collector.label = name
+                    # On the wrapped connection, not the read alias
+                    list(probe(run.cart.user_id, run.popular_product().id).using(DEFAULT_DB_ALIAS)[:1])
+            results = queryplans.analyze(collector, options['min_rows'], not options['ignore_sorts'])
+        
+        self.stdout.write(queryplans.report(results, options['verbose_plans']))
+        flagged = [result for result in results if result['problems']]
+        if flagged and options['fail']:
+            raise CommandError(f'{len(flagged)} query shapes with full scans or sorts')
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS('No full scans or sorts'))
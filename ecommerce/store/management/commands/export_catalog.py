@@ -0,0 +1,49 @@
+# store/management/commands/export_catalog.py
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from store import catalog
+from store.models import Product
+
+class Command(BaseCommand):
+    help = 'Export products to a CSV or JSONL file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write, or '-' for stdout")
+        parser.add_argument('--format', choices=catalog.FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--category', help='Only export products of this category slug')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            format = catalog.detect_format(path, options['format'] or ('jsonl' if path == '-' else None))
+        except ValueError as e:
+            raise CommandError(e)
+        
+        queryset = Product.objects.all()
+        if options['category']:
+            queryset = queryset.filter(category__slug=options['category'])
+        
+        started = time.monotonic()
+        exported = 0
+        
+        def counted(rows):
+            nonlocal exported
+            for row in rows:
+                yield row
+                exported += 1
+                if path != '-' and exported % 10000 == 0:
+                    rate = exported / max(time.monotonic() - started, 1e-6)
+                    self.stdout.write(f'{exported} products exported ({rate:.0f}/s)')
+        
+        stream = self.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            catalog.write_rows(stream, format, counted(catalog.export_rows(queryset, options['chunk_size'])))
+        finally:
+            if stream is not self.stdout:
+                stream.close()
+        
+        if path != '-':
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f'Exported {exported} products in {elapsed:.1f}s'))
@@ -0,0 +1,36 @@
+# store/management/commands/generate_image_derivatives.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from store import images
+
+class Command(BaseCommand):
+    help = 'Hash product and category images and write their missing resized derivatives'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=max(settings.IMAGE_WORKERS, 1),
+                            help='Worker threads (default: IMAGE_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--unhashed-only', action='store_true',
+                            help='Skip images that already have a content hash and size')
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for model in images.SOURCE_MODELS:
+            queryset = model.objects.exclude(image='').order_by('pk')
+            if options['unhashed_only']:
+                queryset = queryset.filter(Q(image_hash='') | Q(image_width=None))
+            pks = list(queryset.values_list('pk', flat=True))
+            written = 0
+            for start in range(0, len(pks), options['batch_size']):
+                written += images.process_many(
+                    model, pks[start:start + options['batch_size']], workers=options['workers']
+                )
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {len(pks)} images, {written} files written')
+            total += written
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} derivative files written in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,59 @@
+# store/management/commands/generate_load_data.py
+
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from store.loadgen import LoadGenerator, PASSWORD
+
+class Command(BaseCommand):
+    help = 'Bulk-generate a synthetic data set (users, products, carts, orders) for scale testing'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--images', type=int, default=1, help='Images per product')
+        parser.add_argument('--saved', type=float, default=5, help='Mean saved items per user')
+        parser.add_argument('--cart-share', type=float, default=0.3, help='Fraction of users with a cart')
+        parser.add_argument('--cart-items', type=float, default=3, help='Mean lines per cart')
+        parser.add_argument('--orders', type=float, default=2, help='Mean orders per user')
+        parser.add_argument('--order-items', type=float, default=3, help='Mean lines per order')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of product popularity')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='load', help='Prefix of generated usernames and slugs')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild facet counts, search, popularity and co-occurrence')
+    
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['categories'] < 1:
+            raise CommandError('--categories must be at least 1, every product needs a category')
+        if User.objects.filter(username__startswith=f'{prefix}-user-').exists():
+            raise CommandError(f"Data with prefix '{prefix}' already exists, pick another --prefix")
+        
+        started = time.monotonic()
+        generator = LoadGenerator(
+            prefix=prefix,
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            exponent=options['zipf'],
+            log=self.stdout.write
+        )
+        counts = generator.generate(
+            users=options['users'],
+            categories=options['categories'],
+            products=options['products'],
+            images=options['images'],
+            saved=options['saved'],
+            cart_share=options['cart_share'],
+            cart_items=options['cart_items'],
+            orders=options['orders'],
+            order_items=options['order_items'],
+            derived=not options['skip_derived']
+        )
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {sum(counts.values())} rows in {time.monotonic() - started:.1f}s '
+            f"(users log in as {prefix}-user-N / '{PASSWORD}')"
+        ))
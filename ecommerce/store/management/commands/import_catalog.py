@@ -0,0 +1,48 @@
+# store/management/commands/import_catalog.py
+
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from store import catalog
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV or JSONL file, updating existing slugs'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or '-' for stdin")
+        parser.add_argument('--format', choices=catalog.FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            format = catalog.detect_format(path, options['format'] or ('jsonl' if path == '-' else None))
+        except ValueError as e:
+            raise CommandError(e)
+        
+        started = time.monotonic()
+        
+        def report(stats):
+            done = stats['created'] + stats['updated']
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{done} products imported ({rate:.0f}/s)')
+        
+        def skipped(line_num, error):
+            self.stderr.write(f'Line {line_num} skipped: {error}')
+        
+        importer = catalog.CatalogImporter(batch_size=options['batch_size'])
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            stats = importer.run(catalog.read_rows(stream, format), on_error=skipped, on_batch=report)
+        except ValueError as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['created']} new and {stats['updated']} updated products, "
+            f"{stats['categories']} new categories and {stats['images']} images "
+            f"in {elapsed:.1f}s ({stats['skipped']} rows skipped)"
+        ))
@@ -0,0 +1,11 @@
+# store/management/commands/purge_reservations.py
+
+from django.core.management.base import BaseCommand
+from store import inventory
+
+class Command(BaseCommand):
+    help = 'Delete expired cart stock reservations'
+    
+    def handle(self, *args, **options):
+        deleted = inventory.purge_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired reservations'))
@@ -0,0 +1,15 @@
+# store/management/commands/rebuild_cooccurrence.py
+
+from django.core.management.base import BaseCommand
+from store import cooccurrence
+
+class Command(BaseCommand):
+    help = 'Rebuild the product co-occurrence index used by the recommender'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding product co-occurrence index...')
+        rows = cooccurrence.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Co-occurrence index rebuilt: {rows} rows'))
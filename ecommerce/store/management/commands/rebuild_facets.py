@@ -0,0 +1,12 @@
+# store/management/commands/rebuild_facets.py
+
+from django.core.management.base import BaseCommand
+from store import facets
+
+class Command(BaseCommand):
+    help = 'Recount the product facet count table used by listing filters'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding product facet counts...')
+        cells = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Facet counts rebuilt: {cells} cells'))
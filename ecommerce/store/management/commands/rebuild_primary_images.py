@@ -0,0 +1,12 @@
+# store/management/commands/rebuild_primary_images.py
+
+from django.core.management.base import BaseCommand
+from store import primary_images
+
+class Command(BaseCommand):
+    help = 'Leave every product with images exactly one primary image and recompute Product.primary_image'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding primary images...')
+        updated = primary_images.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Primary images rebuilt: {updated} products'))
@@ -0,0 +1,16 @@
+# store/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+from store import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+    
+    def handle(self, *args, **options):
+        backend = type(search.get_backend()).__name__
+        self.stdout.write(f'Rebuilding product search index ({backend})...')
+        count = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {count} products'))
@@ -0,0 +1,21 @@
+# store/management/commands/refresh_popularity.py
+
+from django.core.management.base import BaseCommand
+from store import popularity
+
+class Command(BaseCommand):
+    help = 'Refresh the 24h/7d product popularity windows (run hourly)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Recompute all scores from saved, cart and order rows'
+        )
+    
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            products = popularity.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Popularity rebuilt for {products} products'))
+        else:
+            popularity.refresh_windows()
+            self.stdout.write(self.style.SUCCESS('Popularity windows refreshed'))
@@ -0,0 +1,30 @@
+# store/management/commands/replicate.py
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from store import replication
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into the replica files (DATABASE_REPLICAS), once or '
+        'every --interval seconds; a stand-in for replication in local setups'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between copies, i.e. the replication lag')
+        parser.add_argument('--once', action='store_true', help='Copy once and exit')
+    
+    def handle(self, *args, **options):
+        if not replication.replica_aliases():
+            raise CommandError('No replicas configured (DATABASE_REPLICAS, or set DJANGO_DB_REPLICA=1)')
+        while True:
+            start = time.perf_counter()
+            synced = replication.sync_replicas()
+            elapsed = time.perf_counter() - start
+            if options['once']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Copied the primary to {', '.join(synced) or 'no replicas'} in {elapsed:.2f}s"
+                ))
+                return
+            time.sleep(max(options['interval'] - elapsed, 0))
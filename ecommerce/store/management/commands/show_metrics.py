@@ -0,0 +1,50 @@
+# store/management/commands/show_metrics.py
+
+from urllib.request import urlopen
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from store import benchmarks, metrics
+
+class Command(BaseCommand):
+    help = (
+        'Print view, template, context processor and recommender timings: scraped from a running '
+        'server with --url, or measured here by driving the benchmark scenarios'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Metrics endpoint of a running server, e.g. http://127.0.0.1:8000/metrics')
+        parser.add_argument('--products', type=int, default=2000, help='Size of the generated data set')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--current-db', action='store_true',
+                            help='Use the configured database as it is instead of generated data')
+        parser.add_argument('--prometheus', action='store_true', help='Print the Prometheus text format')
+    
+    def handle(self, *args, **options):
+        if options['url']:
+            with urlopen(options['url']) as response:
+                self.stdout.write(response.read().decode())
+            return
+        
+        with benchmarks.benchmark_database(
+            options['products'], options['seed'], prefix='metrics', current=options['current_db']
+        ), override_settings(METRICS_ENABLED=True):
+            metrics.reset()
+            benchmarks.BenchmarkRun(repeat=options['repeat'], seed=options['seed']).run()
+        
+        if options['prometheus']:
+            self.stdout.write(metrics.render_prometheus())
+            return
+        
+        histograms, counters = metrics.snapshot()
+        self.stdout.write(f"{'metric':<34} {'labels':<36} {'count':>6} {'avg ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            label_text = ','.join(f'{key}={value}' for key, value in labels)
+            self.stdout.write(
+                f'{name:<34} {label_text:<36} {histogram.count:>6} '
+                f'{histogram.sum * 1000 / histogram.count:>8.2f} '
+                f'{histogram.quantile(0.5) * 1000:>8.2f} {histogram.quantile(0.95) * 1000:>8.2f}'
+            )
+        for (name, labels), value in sorted(counters.items()):
+            label_text = ','.join(f'{key}={value}' for key, value in labels)
+            self.stdout.write(f'{name:<34} {label_text:<36} {value:>6}')
@@ -0,0 +1,256 @@
+# store/metrics.py
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+HELP = {
+    'store_view_seconds': 'Time spent handling a request, by URL name',
+    'store_template_render_seconds': 'Time spent rendering a template, including context processors',
+    'store_context_processor_seconds': 'Time spent in a context processor',
+    'store_recommender_stage_seconds': 'Time spent in a recommender stage',
+    'store_recommender_stage_products_total': 'Products contributed by a recommender stage',
+    'store_recommendations_cache_total': 'Recommendation cache lookups by outcome',
+}
+
+_NOOP = nullcontext()
+
+class _State:
+    enabled = False
+
+_state = _State()
+
+def _configure():
+    _state.enabled = getattr(settings, 'METRICS_ENABLED', False)
+
+@receiver(setting_changed)
+def _setting_changed(setting, **kwargs):
+    if setting == 'METRICS_ENABLED':
+        _configure()
+
+def enabled():
+    return _state.enabled
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating inside its bucket.
+        """
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = BUCKETS[index - 1] if index else 0.0
+                if BUCKETS[index] == float('inf'):
+                    return low
+                return low + (BUCKETS[index] - low) * (rank - seen) / n
+            seen += n
+        return 0.0
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> Histogram
+_counters = {}  # (name, labels) -> int
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+def increment(name, amount=1, **labels):
+    """
+    Add to a counter (no-op while metrics are disabled).
+    """
+    if not _state.enabled:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+    
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+def timer(name, **labels):
+    """
+    Context manager recording the duration of its block in a histogram.
+    A shared no-op context manager while metrics are disabled.
+    """
+    if not _state.enabled:
+        return _NOOP
+    return _Timer(name, labels)
+
+def timed(name, **labels):
+    """
+    Decorator form of timer().
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return function(*args, **kwargs)
+            with _Timer(name, labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def snapshot():
+    """
+    Copy of everything recorded in this process.
+    
+    Returns:
+        (histograms, counters) dicts keyed by (name, labels tuple)
+    """
+    with _lock:
+        histograms = {}
+        for key, histogram in _histograms.items():
+            copy = Histogram()
+            copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+            histograms[key] = copy
+        return histograms, dict(_counters)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs
+    ) + '}'
+
+def render_prometheus():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    histograms, counters = snapshot()
+    lines = []
+    for metric_type, series in (('histogram', histograms), ('counter', counters)):
+        for name in sorted({name for name, labels in series}):
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for (series_name, labels), value in sorted(series.items()):
+                if series_name != name:
+                    continue
+                if metric_type == 'counter':
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, n in zip(BUCKETS, value.counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value.count}')
+    return '\n'.join(lines) + '\n'
+
+def prometheus_view(request):
+    """
+    Prometheus scrape endpoint, served to METRICS_ALLOWED_IPS only.
+    """
+    if not _state.enabled or request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        raise Http404
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class MetricsMiddleware:
+    """
+    Times every request into store_view_seconds, labelled with the URL name.
+    """
+    async_capable = True
+    sync_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _state.enabled:
+            return self.get_response(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, start)
+        return response
+    
+    async def __acall__(self, request):
+        if not _state.enabled:
+            return await self.get_response(request)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, start)
+        return response
+    
+    def record(self, request, response, start):
+        match = getattr(request, 'resolver_match', None)
+        observe(
+            'store_view_seconds',
+            time.perf_counter() - start,
+            view=match.view_name if match else 'unresolved',
+            status=f'{response.status_code // 100}xx'
+        )
+
+class _TimedTemplate:
+    def __init__(self, template, name):
+        self.template = template
+        self.name = name
+    
+    def __getattr__(self, attr):
+        return getattr(self.template, attr)
+    
+    def render(self, context=None, request=None):
+        with timer('store_template_render_seconds', template=self.name):
+            return self.template.render(context, request)
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with render times recorded per template
+    while metrics are enabled.
+    """
+    
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return _TimedTemplate(template, template_name) if _state.enabled else template
+
+_configure()
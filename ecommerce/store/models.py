@@ -9,6 +9,11 @@ class Category(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True)
+    # Content hash naming the resized derivatives and the size of the
+    # original, which gives their widths; see store.images
+    image_hash = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, editable=False)
     
     class Meta:
         verbose_name_plural = 'Categories'
@@ -28,9 +33,18 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    # Denormalized from ProductImage.is_primary, see store.primary_images
+    primary_image = models.ForeignKey(
+        'ProductImage', null=True, blank=True, editable=False, related_name='+', on_delete=models.SET_NULL
+    )
     
     class Meta:
         ordering = ['-created']
+        indexes = [
+            # Keyset pagination of product listings, see store.pagination
+            models.Index(fields=['category', '-created', '-id'], name='store_product_cat_created_idx'),
+            models.Index(fields=['-created', '-id'], name='store_product_created_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -41,8 +55,20 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/')
+    image_hash = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, editable=False)
     is_primary = models.BooleanField(default=False)
     
+    class Meta:
+        constraints = [
+            # At most one primary image per product; the partial unique
+            # index also serves lookups of a product's primary image
+            models.UniqueConstraint(
+                fields=['product'], condition=models.Q(is_primary=True), name='store_productimage_one_primary'
+            ),
+        ]
+    
     def __str__(self):
         return f"Image for {self.product.name}"
 
@@ -57,59 +83,94 @@ class SavedItem(models.Model):
     def __str__(self):
         return f"{self.user.username}'s saved {self.product.name}"
 
-# cart/models.py
-
-from django.db import models
-from django.contrib.auth.models import User
-from store.models import Product
+class ProductCooccurrence(models.Model):
+    """
+    Item-to-item co-occurrence: how many users interacted (saved, carted or
+    ordered) with both ``product`` and ``related``. Kept up to date by
+    store.cooccurrence; each pair is stored in both directions.
+    """
+    product = models.ForeignKey(Product, related_name='cooccurrences', on_delete=models.CASCADE)
+    related = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    score = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('product', 'related')
+        indexes = [
+            models.Index(fields=['product', '-score'], name='store_cooc_product_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score})"
 
-class Cart(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+class ProductPopularity(models.Model):
+    """
+    Materialized popularity scores per product, see store.popularity.
+    The windowed scores are incremented live and re-aggregated from
+    ProductActivity by the refresh_popularity command.
+    """
+    product = models.OneToOneField(Product, primary_key=True, related_name='popularity', on_delete=models.CASCADE)
+    score_24h = models.PositiveIntegerField(default=0, db_index=True)
+    score_7d = models.PositiveIntegerField(default=0, db_index=True)
+    score_all = models.PositiveIntegerField(default=0, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Product popularity'
     
     def __str__(self):
-        return f"{self.user.username}'s cart"
+        return f"Popularity of product {self.product_id}"
+
+class ProductActivity(models.Model):
+    """
+    Hourly bucket of weighted save/cart/order events for a product.
+    """
+    product = models.ForeignKey(Product, related_name='activity', on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    score = models.PositiveIntegerField(default=0)
     
-    @property
-    def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+    class Meta:
+        unique_together = ('product', 'hour')
+        indexes = [
+            models.Index(fields=['hour'], name='store_activity_hour_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Activity of product {self.product_id} at {self.hour}"
 
-class CartItem(models.Model):
-    cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField(default=1)
+class StockReservation(models.Model):
+    """
+    Stock held for a cart until ``expires_at``, see store.inventory.
+    Product.quantity stays the physical stock; live reservations of other
+    carts are subtracted from it when stock is taken.
+    """
+    cart = models.ForeignKey('cart.Cart', related_name='reservations', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
     
     class Meta:
         unique_together = ('cart', 'product')
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='store_reservation_live_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.quantity} x {self.product.name}"
-    
-    @property
-    def total_price(self):
-        return self.product.price * self.quantity
-
-# users/models.py
+        return f"{self.quantity} x product {self.product_id} held for cart {self.cart_id}"
 
-from django.db import models
-from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-
-class Profile(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE)
-    address = models.TextField(blank=True, null=True)
-    phone_number = models.CharField(max_length=15, blank=True, null=True)
+class ProductFacetCount(models.Model):
+    """
+    Number of products in one (category, price range, in stock) cell,
+    maintained incrementally by store.facets so listing facet counts are
+    a small table read instead of a GROUP BY over products.
+    """
+    category = models.ForeignKey(Category, related_name='facet_counts', on_delete=models.CASCADE)
+    price_range = models.CharField(max_length=20)
+    in_stock = models.BooleanField()
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('category', 'price_range', 'in_stock')
     
     def __str__(self):
-        return f"{self.user.username}'s profile"
-
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+        stock = 'in stock' if self.in_stock else 'sold out'
+        return f"{self.count} products in category {self.category_id}, {self.price_range}, {stock}"
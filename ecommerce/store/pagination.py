@@ -0,0 +1,46 @@
+# store/pagination.py
+
+import base64
+import binascii
+from datetime import datetime
+from django.db.models import Q
+
+def encode_cursor(product):
+    raw = f'{product.created.isoformat()}|{product.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        (created, id) tuple
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created, product_id = raw.split('|')
+        return datetime.fromisoformat(created), int(product_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+def keyset_page(queryset, cursor=None, per_page=24):
+    """
+    One page of products ordered by (-created, -id), starting after the
+    product encoded in ``cursor``. Unlike OFFSET pagination the cost does
+    not grow with the page number: the (category, created, id) index is
+    seeked to the cursor position.
+    
+    Returns:
+        (products, next_cursor) tuple; next_cursor is None on the last page
+    """
+    queryset = queryset.order_by('-created', '-id')
+    if cursor:
+        created, product_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created__lt=created) | Q(created=created, id__lt=product_id)
+        )
+    products = list(queryset[:per_page + 1])
+    if len(products) > per_page:
+        return products[:per_page], encode_cursor(products[per_page - 1])
+    return products, None
@@ -0,0 +1,154 @@
+# store/popularity.py
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncHour
+from django.utils import timezone
+from cart.models import CartItem, OrderItem
+from .models import ProductActivity, ProductPopularity, SavedItem
+
+# How much each kind of event adds to a product's popularity
+WEIGHTS = {
+    'save': 1,
+    'cart': 1,
+    'order': 2,
+}
+
+# Sliding windows, keyed by the ProductPopularity column they feed
+WINDOWS = {
+    'score_24h': timedelta(hours=24),
+    'score_7d': timedelta(days=7),
+}
+
+FIELDS = {
+    '24h': 'score_24h',
+    '7d': 'score_7d',
+    'all': 'score_all',
+}
+
+def _current_hour(now=None):
+    return (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+def record_event(product_id, kind, quantity=1):
+    """
+    Add a save/cart/order event to the product's popularity scores.
+    """
+    record_events([(product_id, kind, quantity)])
+
+def record_events(events):
+    """
+    Add a batch of (product_id, kind, quantity) events with a fixed number
+    of queries, whatever the number of products involved.
+    """
+    scores = Counter()
+    for product_id, kind, quantity in events:
+        scores[product_id] += WEIGHTS[kind] * quantity
+    if not scores:
+        return
+    
+    by_score = defaultdict(list)
+    for product_id, score in scores.items():
+        by_score[score].append(product_id)
+    
+    hour = _current_hour()
+    increment = Case(
+        *[When(product_id__in=ids, then=Value(score)) for score, ids in by_score.items()],
+        output_field=PositiveIntegerField()
+    )
+    with transaction.atomic():
+        ProductActivity.objects.bulk_create(
+            [ProductActivity(product_id=product_id, hour=hour) for product_id in scores],
+            ignore_conflicts=True
+        )
+        ProductActivity.objects.filter(product_id__in=scores, hour=hour).update(
+            score=F('score') + increment
+        )
+        ProductPopularity.objects.bulk_create(
+            [ProductPopularity(product_id=product_id) for product_id in scores],
+            ignore_conflicts=True
+        )
+        ProductPopularity.objects.filter(product_id__in=scores).update(
+            score_24h=F('score_24h') + increment,
+            score_7d=F('score_7d') + increment,
+            score_all=F('score_all') + increment,
+            updated=timezone.now()
+        )
+
+def refresh_windows(now=None):
+    """
+    Re-aggregate the windowed scores from the hourly buckets and drop
+    buckets that no window looks at anymore. Meant to run periodically
+    (e.g. hourly from cron through the refresh_popularity command).
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        for field, window in WINDOWS.items():
+            window_total = ProductActivity.objects.filter(
+                product=OuterRef('product'), hour__gt=now - window
+            ).values('product').annotate(total=Sum('score')).values('total')
+            ProductPopularity.objects.filter(**{f'{field}__gt': 0}).update(
+                **{field: Coalesce(Subquery(window_total), 0)}
+            )
+        ProductActivity.objects.filter(hour__lte=now - max(WINDOWS.values())).delete()
+
+def rebuild(now=None):
+    """
+    Recompute every popularity score from the existing saved, cart and
+    order rows.
+    """
+    now = now or timezone.now()
+    buckets = Counter()
+    sources = (
+        (SavedItem.objects.annotate(bucket=TruncHour('date_added'))
+            .values('product', 'bucket').annotate(n=Count('id')), 'save'),
+        (CartItem.objects.annotate(bucket=TruncHour('cart__updated_at'))
+            .values('product', 'bucket').annotate(n=Count('id')), 'cart'),
+        (OrderItem.objects.annotate(bucket=TruncHour('order__created_at'))
+            .values('product', 'bucket').annotate(n=Sum('quantity')), 'order'),
+    )
+    for queryset, kind in sources:
+        for row in queryset:
+            buckets[row['product'], row['bucket']] += WEIGHTS[kind] * row['n']
+    
+    totals = Counter()
+    for (product_id, hour), score in buckets.items():
+        totals[product_id] += score
+    
+    oldest = now - max(WINDOWS.values())
+    with transaction.atomic():
+        ProductActivity.objects.all().delete()
+        ProductPopularity.objects.all().delete()
+        ProductActivity.objects.bulk_create(
+            [
+                ProductActivity(product_id=product_id, hour=hour, score=score)
+                for (product_id, hour), score in buckets.items() if hour > oldest
+            ],
+            batch_size=1000
+        )
+        ProductPopularity.objects.bulk_create(
+            [
+                ProductPopularity(product_id=product_id, score_all=score, score_7d=score, score_24h=score)
+                for product_id, score in totals.items()
+            ],
+            batch_size=1000
+        )
+    refresh_windows(now)
+    return len(totals)
+
+def get_popular_products(limit, window='all', exclude_ids=(), using=None):
+    """
+    Top products by popularity within the given window ('24h', '7d' or 'all'),
+    read from the ``using`` database alias (routed by default).
+    
+    Returns:
+        List of Product instances, most popular first
+    """
+    field = FIELDS[window]
+    ranking = ProductPopularity.objects.using(using).filter(
+        **{f'{field}__gt': 0}
+    ).exclude(
+        product_id__in=exclude_ids
+    ).select_related('product').order_by(f'-{field}')[:limit]
+    return [row.product for row in ranking]
@@ -0,0 +1,66 @@
+# store/primary_images.py
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Now
+from .models import Product, ProductImage
+
+def clear_others(image):
+    """
+    Unmark the product's current primary image before ``image`` is saved
+    as primary (the partial unique constraint allows only one).
+    """
+    ProductImage.objects.filter(
+        product_id=image.product_id, is_primary=True
+    ).exclude(pk=image.pk).update(is_primary=False)
+
+def refresh(product_id):
+    """
+    Make sure a product with images has exactly one primary image,
+    promoting its oldest image if the primary one was unmarked or
+    deleted. Reads the primary, which has the change that triggered this.
+    
+    Returns:
+        ID of the primary image, or None if the product has no images
+    """
+    images = ProductImage.objects.using(DEFAULT_DB_ALIAS).filter(product_id=product_id)
+    primary_id = images.filter(is_primary=True).values_list('id', flat=True).first()
+    if primary_id is None:
+        primary_id = images.order_by('id').values_list('id', flat=True).first()
+        if primary_id is not None:
+            ProductImage.objects.filter(pk=primary_id).update(is_primary=True)
+    return primary_id
+
+def rebuild(product_ids=None):
+    """
+    Repair is_primary and recompute Product.primary_image in bulk, for
+    data written without signals (bulk inserts, imports, old rows).
+    Extra primary images are unmarked (the oldest one is kept) and
+    products without one get their oldest image promoted.
+    
+    Args:
+        product_ids: Products to fix, or None for all of them
+    
+    Returns:
+        Number of products updated
+    """
+    images = ProductImage.objects.all()
+    products = Product.objects.all()
+    if product_ids is not None:
+        images = images.filter(product_id__in=product_ids)
+        products = products.filter(pk__in=product_ids)
+    
+    oldest_primary = ProductImage.objects.filter(
+        product=OuterRef('product'), is_primary=True
+    ).order_by('id').values('id')[:1]
+    oldest = ProductImage.objects.filter(product=OuterRef('pk')).order_by('id').values('id')[:1]
+    primary = ProductImage.objects.filter(product=OuterRef('pk'), is_primary=True).values('id')[:1]
+    
+    with transaction.atomic():
+        images.filter(is_primary=True).exclude(pk=Subquery(oldest_primary)).update(is_primary=False)
+        without_primary = products.exclude(images__is_primary=True).annotate(
+            first=Subquery(oldest)
+        ).filter(first__isnull=False).values('first')
+        ProductImage.objects.filter(pk__in=without_primary).update(is_primary=True)
+        # update() skips auto_now; touching updated refreshes cached product cards
+        return products.update(primary_image=Subquery(primary), updated=Now())
@@ -0,0 +1,236 @@
+# store/querybudget.py
+
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Statements that are transaction bookkeeping, not data access
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised (with QUERY_BUDGET_MODE = 'raise') when a view runs more queries
+    than its budget or repeats one query shape too often.
+    """
+
+def fingerprint(sql):
+    """
+    The shape of a query: parameters already are %s placeholders, IN lists
+    of any length and inlined numbers are collapsed, so the same query for
+    different rows (an N+1) gets the same fingerprint.
+    """
+    return NUMBER_RE.sub('?', IN_LIST_RE.sub('IN (...)', sql))
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting the queries of one request.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.shapes = Counter()
+        # Async views run queries of one request in several threads
+        self.lock = threading.Lock()
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.time += elapsed
+                if not sql.startswith(IGNORED_PREFIXES):
+                    self.count += 1
+                    self.shapes[fingerprint(sql)] += 1
+    
+    def duplicates(self, threshold=1):
+        """
+        Query shapes run more than ``threshold`` times, most repeated first.
+        """
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+# The recorder of the request being handled. Context variables follow the
+# request into the threads sync_to_async() runs its queries in, which a
+# wrapper on the handling thread's connection would miss.
+_current = ContextVar('query_budget_recorder', default=None)
+
+def _dispatch(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+@receiver(connection_created)
+def _install(connection, **kwargs):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+class _ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.time = 0.0
+        self.over_budget = 0
+        self.duplicates = Counter()
+
+_stats = defaultdict(_ViewStats)
+_stats_lock = threading.Lock()
+
+def _record(view_name, recorder, offenses):
+    with _stats_lock:
+        stats = _stats[view_name]
+        stats.requests += 1
+        stats.queries += recorder.count
+        stats.max_queries = max(stats.max_queries, recorder.count)
+        stats.time += recorder.time
+        stats.over_budget += bool(offenses)
+        for shape, n in recorder.duplicates(max_duplicates()):
+            stats.duplicates[shape] = max(stats.duplicates[shape], n)
+
+def budget_for(view_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+
+def max_duplicates():
+    return getattr(settings, 'QUERY_BUDGET_DUPLICATES', 3)
+
+def check(view_name, recorder):
+    """
+    Returns:
+        List of budget offenses as human-readable strings
+    """
+    offenses = []
+    budget = budget_for(view_name)
+    if budget is not None and recorder.count > budget:
+        offenses.append(f'{view_name} ran {recorder.count} queries (budget {budget})')
+    for shape, n in recorder.duplicates(max_duplicates()):
+        offenses.append(f'{view_name} ran the same query {n} times: {shape[:200]}')
+    return offenses
+
+def summary():
+    """
+    Per-view totals recorded so far in this process.
+    
+    Returns:
+        Dict mapping view name to a dict of requests, avg_queries,
+        max_queries, avg_db_ms, over_budget, budget and duplicates
+    """
+    with _stats_lock:
+        return {
+            view_name: {
+                'requests': stats.requests,
+                'avg_queries': stats.queries / stats.requests,
+                'max_queries': stats.max_queries,
+                'avg_db_ms': stats.time * 1000 / stats.requests,
+                'over_budget': stats.over_budget,
+                'budget': budget_for(view_name),
+                'duplicates': stats.duplicates.most_common(3),
+            }
+            for view_name, stats in _stats.items()
+        }
+
+def report():
+    """
+    The summary as a text table, views over budget first.
+    """
+    rows = sorted(summary().items(), key=lambda item: (-item[1]['over_budget'], -item[1]['max_queries']))
+    lines = [f"{'view':<28} {'requests':>8} {'avg q':>7} {'max q':>6} {'budget':>6} {'avg db ms':>9} {'over':>5}"]
+    for view_name, row in rows:
+        budget = '-' if row['budget'] is None else row['budget']
+        lines.append(
+            f"{view_name:<28} {row['requests']:>8} {row['avg_queries']:>7.1f} {row['max_queries']:>6} "
+            f"{budget:>6} {row['avg_db_ms']:>9.2f} {row['over_budget']:>5}"
+        )
+        for shape, n in row['duplicates']:
+            lines.append(f'    {n}x {shape[:120]}')
+    return '\n'.join(lines)
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries, repeated query shapes and database time of each
+    request and checks them against the budget of the view's URL name
+    (settings.QUERY_BUDGETS). QUERY_BUDGET_MODE is 'off', 'log' (warn) or
+    'raise' (QueryBudgetExceeded, for tests). With QUERY_BUDGET_HEADERS the
+    numbers are added to the response as X-Query-* headers.
+    """
+    
+    async_capable = True
+    sync_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+        if mode == 'off':
+            return self.get_response(request)
+        
+        recorder = QueryRecorder()
+        # In case the connection was opened before this module was imported
+        _install(connection)
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process(request, response, recorder, mode)
+    
+    async def __acall__(self, request):
+        mode = getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+        if mode == 'off':
+            return await self.get_response(request)
+        
+        # The connections of the worker threads get _dispatch on creation
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process(request, response, recorder, mode)
+    
+    def process(self, request, response, recorder, mode):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        offenses = check(view_name, recorder)
+        _record(view_name, recorder, offenses)
+        
+        if getattr(settings, 'QUERY_BUDGET_HEADERS', False):
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.time * 1000:.2f}'
+            response['X-Query-Max-Repeats'] = str(max(recorder.shapes.values(), default=0))
+            budget = budget_for(view_name)
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+            if offenses:
+                response['X-Query-Budget-Exceeded'] = '1'
+        
+        if offenses:
+            if mode == 'raise':
+                raise QueryBudgetExceeded('; '.join(offenses))
+            for offense in offenses:
+                logger.warning(offense)
+        return response
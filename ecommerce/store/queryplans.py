@@ -0,0 +1,132 @@
+# store/queryplans.py
+
+import re
+from collections import defaultdict
+from django.db import connection
+from cart.models import CartItem, Order, OrderItem
+from .models import SavedItem
+from .querybudget import IGNORED_PREFIXES, fingerprint
+
+# Statements worth explaining; INSERTs without a SELECT have no plan to speak of
+EXPLAINED_PREFIXES = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+# "SCAN store_product" (full table scan) but not "SCAN store_product USING
+# INDEX ..." (a walk over an index, as used for ORDER BY ... LIMIT)
+FULL_SCAN_RE = re.compile(r'^SCAN (?P<table>\w+)(?: AS \w+)?$')
+TEMP_SORT_RE = re.compile(r'USE TEMP B-TREE FOR (?P<what>.+)')
+ALIAS_RE = re.compile(r'"(?P<table>\w+)" (?:AS )?(?P<alias>[A-Z]\d+)\b')
+
+# Hot query shapes outside the benchmark scenarios (signal handlers,
+# recommender bookkeeping, account pages), called with a user and a product ID
+PROBES = {
+    'saved_by_product': lambda user_id, product_id: SavedItem.objects.filter(product_id=product_id),
+    'saved_by_user': lambda user_id, product_id: SavedItem.objects.filter(user_id=user_id, product_id=product_id),
+    'cart_items_by_product': lambda user_id, product_id: CartItem.objects.filter(product_id=product_id),
+    'cart_items_by_user': lambda user_id, product_id: CartItem.objects.filter(cart__user_id=user_id),
+    'orders_by_user': lambda user_id, product_id: Order.objects.filter(user_id=user_id),
+    'order_items_by_product': lambda user_id, product_id: OrderItem.objects.filter(product_id=product_id),
+}
+
+class QueryCollector:
+    """
+    Database execute wrapper keeping one example of every query shape
+    (see querybudget.fingerprint), tagged with the scenarios it ran in.
+    """
+    
+    def __init__(self):
+        self.label = None
+        self.queries = {}  # fingerprint -> (sql, params)
+        self.labels = defaultdict(set)
+    
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(EXPLAINED_PREFIXES) and not sql.startswith(IGNORED_PREFIXES):
+            shape = fingerprint(sql)
+            self.queries.setdefault(shape, (sql, params))
+            if self.label:
+                self.labels[shape].add(self.label)
+        return execute(sql, params, many, context)
+
+def explain(sql, params):
+    """
+    Returns:
+        List of plan detail strings from EXPLAIN QUERY PLAN
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+def _table_sizes():
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        sizes = {}
+        for table in tables:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            sizes[table] = cursor.fetchone()[0]
+    return sizes
+
+def problems(plan, sql, table_sizes, min_rows=1000):
+    """
+    Full scans of tables with at least ``min_rows`` rows and temporary
+    sorts in one plan. Subquery aliases (U0, T3) are resolved from the SQL;
+    scans of tables that cannot be resolved are always reported.
+    
+    Returns:
+        List of (kind, table, plan detail) tuples
+    """
+    aliases = {match['alias']: match['table'] for match in ALIAS_RE.finditer(sql)}
+    found = []
+    for detail in plan:
+        scan = FULL_SCAN_RE.match(detail)
+        if scan:
+            table = aliases.get(scan['table'], scan['table'])
+            if table_sizes.get(table, min_rows) >= min_rows:
+                found.append(('full scan', table, detail))
+            continue
+        sort = TEMP_SORT_RE.search(detail)
+        if sort:
+            found.append(('temp sort', sort['what'], detail))
+    return found
+
+def analyze(collector, min_rows=1000, include_sorts=True):
+    """
+    Explain every collected query shape.
+    
+    Returns:
+        List of dicts with sql, labels, plan and problems, problematic
+        queries first
+    """
+    table_sizes = _table_sizes()
+    results = []
+    for shape, (sql, params) in collector.queries.items():
+        plan = explain(sql, params)
+        found = [
+            problem for problem in problems(plan, sql, table_sizes, min_rows)
+            if include_sorts or problem[0] != 'temp sort'
+        ]
+        results.append({
+            'sql': shape,
+            'labels': sorted(collector.labels[shape]),
+            'plan': plan,
+            'problems': found,
+        })
+    results.sort(key=lambda result: -len(result['problems']))
+    return results
+
+def report(results, verbose=False):
+    """
+    The analysis as text: every query with problems and its plan, plus
+    (verbose) the plans of all others.
+    """
+    lines = []
+    for result in results:
+        if not result['problems'] and not verbose:
+            continue
+        lines.append(f"[{', '.join(result['labels']) or '-'}] {result['sql'][:300]}")
+        for detail in result['plan']:
+            lines.append(f'    {detail}')
+        for kind, table, detail in result['problems']:
+            lines.append(f'    !! {kind}: {table}')
+        lines.append('')
+    flagged = sum(1 for result in results if result['problems'])
+    lines.append(f'{len(results)} query shapes explained, {flagged} with problems')
+    return '\n'.join(lines)
@@ -1,116 +1,256 @@
 # store/recommendations.py
 
-from django.db.models import Count
-from .models import Product, SavedItem, Category
-from cart.models import CartItem
+import asyncio
+import time
+from functools import partial
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from . import metrics
+from .concurrency import in_thread
+from .models import Product, ProductCooccurrence
+from .popularity import get_popular_products
+from .sampling import sample_products
 
-def get_recommended_products(user, product, limit=5):
+# Everything a recommendation card shows
+CARD_RELATED = ('category', 'primary_image')
+
+def _collaborative(product, limit, exclude_ids, using):
+    # Products that users who saved, carted or ordered this product also
+    # interacted with, read straight from the precomputed co-occurrence index
+    with metrics.timer('store_recommender_stage_seconds', stage='collaborative'):
+        related = ProductCooccurrence.objects.using(using).filter(
+            product=product
+        ).exclude(
+            related_id__in=exclude_ids
+        ).select_related(*(f'related__{field}' for field in CARD_RELATED)).order_by('-score')[:limit]
+        return [item.related for item in related]
+
+def _same_category(product, limit, exclude_ids, using):
+    with metrics.timer('store_recommender_stage_seconds', stage='category'):
+        return list(Product.objects.using(using).select_related(*CARD_RELATED).filter(
+            category_id=product.category_id
+        ).exclude(
+            id__in=exclude_ids
+        )[:limit])
+
+def _popular(product, limit, exclude_ids, using):
+    # Served from the materialized popularity ranking (store.popularity)
+    with metrics.timer('store_recommender_stage_seconds', stage='popular'):
+        return get_popular_products(limit, exclude_ids=exclude_ids, using=using)
+
+def _random(product, limit, exclude_ids, using):
+    with metrics.timer('store_recommender_stage_seconds', stage='random'):
+        return sample_products(limit, exclude_ids=exclude_ids, using=using)
+
+def _stages(user):
+    """
+    The recommender stages for this user, in order of preference.
+    """
+    stages = [('category', _same_category), ('popular', _popular), ('random', _random)]
+    if user and user.is_authenticated:
+        stages.insert(0, ('collaborative', _collaborative))
+    return stages
+
+def get_recommended_products(user, product, limit=5, using=None):
     """
     Get recommended products based on the current product and user history.
     Uses a simple collaborative filtering approach:
     
     1. First tries to find products that users who viewed/bought this item also liked
+       (top-N lookup in the co-occurrence index, see store.cooccurrence)
     2. Then looks at products in the same category
-    3. Finally falls back to popular products if needed
+    3. Then falls back to popular products from other categories
+    4. Finally adds random products if needed
     
     Args:
         user: The current user (or None if anonymous)
         product: The current product being viewed
         limit: Number of recommendations to return
+        using: Database alias to read from (routed by default)
     
     Returns:
-        QuerySet of recommended products
+        List of recommended products
     """
     recommended = []
     
-    # Get the current product's category
-    current_category = product.category
+    for name, stage in _stages(user):
+        if len(recommended) >= limit:
+            break
+        found = stage(product, limit - len(recommended), [product.id] + [p.id for p in recommended], using)
+        recommended.extend(found)
+        metrics.increment('store_recommender_stage_products_total', len(found), stage=name)
     
-    # Start with a base queryset of all products except the current one
-    base_queryset = Product.objects.exclude(id=product.id)
+    return recommended[:limit]
+
+async def aget_recommended_products(user, product, limit=5, using=None):
+    """
+    Async get_recommended_products: the collaborative, category and popular
+    stages are queried at the same time, each in its own thread, and merged
+    in order of preference. Since a stage cannot exclude what the earlier
+    ones found, each fetches a full ``limit``, which always leaves enough
+    after dropping duplicates; the result is the same as the sequential
+    version. The random stage only runs if still short.
     
-    if user and user.is_authenticated:
-        # 1. Find products that other users who liked this product also liked
-        # Get users who saved or bought this product
-        users_who_liked = SavedItem.objects.filter(product=product).values_list('user', flat=True)
-        users_who_bought = CartItem.objects.filter(product=product).values_list('cart__user', flat=True)
-        
-        all_interested_users = list(set(list(users_who_liked) + list(users_who_bought)))
-        
-        if all_interested_users:
-            # Find products these users saved or bought
-            products_liked_by_similar_users = SavedItem.objects.filter(
-                user__in=all_interested_users
-            ).exclude(
-                product=product
-            ).values_list('product', flat=True)
-            
-            products_bought_by_similar_users = CartItem.objects.filter(
-                cart__user__in=all_interested_users
-            ).exclude(
-                product=product
-            ).values_list('product', flat=True)
-            
-            # Combine these product IDs
-            collaborative_recommendations = list(set(
-                list(products_liked_by_similar_users) + 
-                list(products_bought_by_similar_users)
-            ))
-            
-            if collaborative_recommendations:
-                # Get these products
-                collab_products = base_queryset.filter(id__in=collaborative_recommendations)
-                recommended.extend(list(collab_products)[:limit])
-    
-    # 2. If we need more recommendations, add products from the same category
-    if len(recommended) < limit:
-        needed = limit - len(recommended)
-        same_category_products = base_queryset.filter(
-            category=current_category
-        ).exclude(
-            id__in=[p.id for p in recommended]
-        )
-        recommended.extend(list(same_category_products)[:needed])
+    Args:
+        user: The current user (or None if anonymous)
+        product: The current product being viewed
+        limit: Number of recommendations to return
+        using: Database alias to read from (routed by default)
+    
+    Returns:
+        List of recommended products
+    """
+    *stages, (random_name, random_stage) = _stages(user)
+    results = await asyncio.gather(*(
+        in_thread(stage, product, limit, [product.id], using) for name, stage in stages
+    ))
+    
+    recommended = []
+    seen = {product.id}
+    for (name, stage), found in zip(stages, results):
+        added = [p for p in found if p.id not in seen][:limit - len(recommended)]
+        seen.update(p.id for p in added)
+        recommended.extend(added)
+        metrics.increment('store_recommender_stage_products_total', len(added), stage=name)
     
-    # 3. If we still need more, add popular products from other categories
-    if len(recommended) < limit:
-        needed = limit - len(recommended)
-        # Count the number of times each product has been saved or added to cart
-        saved_counts = SavedItem.objects.values('product').annotate(count=Count('id')).order_by('-count')
-        cart_counts = CartItem.objects.values('product').annotate(count=Count('id')).order_by('-count')
-        
-        # Combine these counts
-        product_popularity = {}
-        for item in saved_counts:
-            product_id = item['product']
-            product_popularity[product_id] = item['count']
-        
-        for item in cart_counts:
-            product_id = item['product']
-            if product_id in product_popularity:
-                product_popularity[product_id] += item['count']
-            else:
-                product_popularity[product_id] = item['count']
-        
-        # Sort by popularity
-        popular_product_ids = sorted(product_popularity.keys(), 
-                                    key=lambda k: product_popularity[k], 
-                                    reverse=True)
-        
-        # Filter out products already in our recommendations
-        popular_product_ids = [pid for pid in popular_product_ids 
-                              if pid not in [p.id for p in recommended]]
-        
-        if popular_product_ids:
-            popular_products = base_queryset.filter(id__in=popular_product_ids)
-            recommended.extend(list(popular_products)[:needed])
-    
-    # If we still don't have enough, just add random products
     if len(recommended) < limit:
-        needed = limit - len(recommended)
-        random_products = base_queryset.exclude(
-            id__in=[p.id for p in recommended]
-        ).order_by('?')
-        recommended.extend(list(random_products)[:needed])
+        found = await in_thread(random_stage, product, limit - len(recommended), list(seen), using)
+        recommended.extend(found)
+        metrics.increment('store_recommender_stage_products_total', len(found), stage=random_name)
     
-    return recommended[:limit]
\ No newline at end of file
+    return recommended[:limit]
+
+# Cached results stay fresh for RECOMMENDATIONS_FRESH_FOR seconds; after that
+# one request recomputes them while the others keep serving the stale list
+# until the cache backend's own TIMEOUT evicts it.
+RECOMMENDATIONS_FRESH_FOR = 300
+RECOMMENDATIONS_LOCK_TIMEOUT = 30
+RECOMMENDATIONS_WAIT = 0.05
+RECOMMENDATIONS_WAIT_ATTEMPTS = 20
+
+SEGMENTS = ('anonymous', 'authenticated')
+
+def _segment(user):
+    return 'authenticated' if user and user.is_authenticated else 'anonymous'
+
+def _cache_key(product_id, segment):
+    return f'recommendations:{product_id}:{segment}'
+
+def _hydrate(product_ids):
+    products = Product.objects.select_related(*CARD_RELATED).in_bulk(product_ids)
+    return [products[pk] for pk in product_ids if pk in products]
+
+async def _ahydrate(product_ids):
+    products = await Product.objects.select_related(*CARD_RELATED).ain_bulk(product_ids)
+    return [products[pk] for pk in product_ids if pk in products]
+
+def _usable(entry, limit):
+    return entry is not None and entry['limit'] >= limit
+
+def _entry(recommended, limit):
+    return {
+        'ids': [p.id for p in recommended],
+        'limit': limit,
+        'fresh_until': time.time() + RECOMMENDATIONS_FRESH_FOR,
+    }
+
+def get_cached_recommendations(user, product, limit=5):
+    """
+    Cached wrapper around get_recommended_products.
+    
+    Results only depend on the product and whether the user is signed in,
+    so they are cached per (product, segment) in the 'recommendations'
+    cache as a list of product IDs. A per-key lock makes sure that only one
+    request recomputes an expired or missing entry, reading the primary:
+    a lagging replica could cache recommendations of deleted products or
+    miss new ones for RECOMMENDATIONS_FRESH_FOR.
+    
+    Args:
+        user: The current user (or None if anonymous)
+        product: The current product being viewed
+        limit: Number of recommendations to return
+    
+    Returns:
+        List of recommended products
+    """
+    cache = caches['recommendations']
+    key = _cache_key(product.id, _segment(user))
+    lock_key = f'{key}:lock'
+    
+    entry = cache.get(key)
+    usable = _usable(entry, limit)
+    if usable and entry['fresh_until'] > time.time():
+        metrics.increment('store_recommendations_cache_total', outcome='hit')
+        return _hydrate(entry['ids'][:limit])
+    
+    locked = cache.add(lock_key, True, RECOMMENDATIONS_LOCK_TIMEOUT)
+    if not locked:
+        if usable:
+            # Someone else is refreshing this entry, serve the stale one
+            metrics.increment('store_recommendations_cache_total', outcome='stale')
+            return _hydrate(entry['ids'][:limit])
+        for _ in range(RECOMMENDATIONS_WAIT_ATTEMPTS):
+            time.sleep(RECOMMENDATIONS_WAIT)
+            entry = cache.get(key)
+            if _usable(entry, limit):
+                metrics.increment('store_recommendations_cache_total', outcome='waited')
+                return _hydrate(entry['ids'][:limit])
+    
+    metrics.increment('store_recommendations_cache_total', outcome='miss')
+    try:
+        recommended = get_recommended_products(user, product, limit=limit, using=DEFAULT_DB_ALIAS)
+        cache.set(key, _entry(recommended, limit))
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return recommended
+
+async def aget_cached_recommendations(user, product, limit=5):
+    """
+    Async get_cached_recommendations, computing misses with
+    aget_recommended_products and waiting for another request's refresh
+    without blocking the event loop.
+    """
+    cache = caches['recommendations']
+    key = _cache_key(product.id, _segment(user))
+    lock_key = f'{key}:lock'
+    
+    entry = await cache.aget(key)
+    usable = _usable(entry, limit)
+    if usable and entry['fresh_until'] > time.time():
+        metrics.increment('store_recommendations_cache_total', outcome='hit')
+        return await _ahydrate(entry['ids'][:limit])
+    
+    locked = await cache.aadd(lock_key, True, RECOMMENDATIONS_LOCK_TIMEOUT)
+    if not locked:
+        if usable:
+            metrics.increment('store_recommendations_cache_total', outcome='stale')
+            return await _ahydrate(entry['ids'][:limit])
+        for _ in range(RECOMMENDATIONS_WAIT_ATTEMPTS):
+            await asyncio.sleep(RECOMMENDATIONS_WAIT)
+            entry = await cache.aget(key)
+            if _usable(entry, limit):
+                metrics.increment('store_recommendations_cache_total', outcome='waited')
+                return await _ahydrate(entry['ids'][:limit])
+    
+    metrics.increment('store_recommendations_cache_total', outcome='miss')
+    try:
+        recommended = await aget_recommended_products(user, product, limit=limit, using=DEFAULT_DB_ALIAS)
+        await cache.aset(key, _entry(recommended, limit))
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+    return recommended
+
+def invalidate_recommendations(product_ids):
+    """
+    Drop the cached recommendations of the given products once the current
+    transaction commits, so a concurrent request cannot re-cache old data.
+    """
+    keys = [
+        _cache_key(product_id, segment)
+        for product_id in product_ids
+        for segment in SEGMENTS
+    ]
+    if keys:
+        transaction.on_commit(partial(caches['recommendations'].delete_many, keys))
@@ -0,0 +1,127 @@
+# store/replication.py
+
+import sqlite3
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Session key holding the time until which a user reads from the primary
+PIN_SESSION_KEY = '_replica_pinned_until'
+
+def replica_aliases():
+    """
+    The configured DATABASE_REPLICAS that exist in DATABASES.
+    """
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in settings.DATABASES]
+
+def is_replicated(model):
+    return model._meta.label_lower in getattr(settings, 'REPLICATED_MODELS', ())
+
+class _RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned  # Wrote in an earlier request, less than REPLICA_PIN_SECONDS ago
+        self.wrote = False
+
+# State of the request being handled. Context variables follow it into
+# the threads of sync_to_async() and store.concurrency.in_thread.
+_current = ContextVar('replica_request_state', default=None)
+
+def in_request():
+    """
+    Whether a request is being handled (see ReplicaPinningMiddleware).
+    """
+    return _current.get() is not None
+
+def is_pinned():
+    """
+    Whether the current request must read from the primary: it wrote
+    something itself or its user did in an earlier request recently.
+    """
+    state = _current.get()
+    return state is not None and (state.pinned or state.wrote)
+
+def note_write(model):
+    """
+    Called by the router for every write; the session save that records
+    the pin does not count.
+    """
+    state = _current.get()
+    if state is not None and model._meta.label_lower != 'sessions.session':
+        state.wrote = True
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes for replicas: after a request writes (adds to the
+    cart, checks out, logs in, ...) its user is pinned to the primary for
+    REPLICA_PIN_SECONDS, which has to exceed the replication lag. The pin
+    is kept in the session, so this goes after SessionMiddleware.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+        
+        state = _RequestState(request.session.get(PIN_SESSION_KEY, 0) > time.time())
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if state.wrote:
+            request.session[PIN_SESSION_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+        return response
+    
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+        
+        state = _RequestState(await request.session.aget(PIN_SESSION_KEY, 0) > time.time())
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        if state.wrote:
+            await request.session.aset(PIN_SESSION_KEY, time.time() + settings.REPLICA_PIN_SECONDS)
+        return response
+
+def copy_database(source_path, replica_path):
+    """
+    Copy a SQLite database into another file with the online backup API.
+    The copy is a consistent snapshot of the committed data; readers of
+    the replica see the old contents until it is done.
+    """
+    source = sqlite3.connect(source_path)
+    replica = sqlite3.connect(replica_path, timeout=30)
+    try:
+        source.backup(replica)
+    finally:
+        replica.close()
+        source.close()
+
+def sync_replicas(source=DEFAULT_DB_ALIAS):
+    """
+    Stand-in for database replication in local setups: copy the primary
+    into every replica file (see 'manage.py replicate'). Replicas that are
+    the primary file itself, like the test mirrors, are skipped.
+    
+    Returns:
+        List of the aliases copied to
+    """
+    source_path = str(connections[source].settings_dict['NAME'])
+    synced = []
+    for alias in replica_aliases():
+        replica_path = str(connections[alias].settings_dict['NAME'])
+        if replica_path != source_path:
+            copy_database(source_path, replica_path)
+            synced.append(alias)
+    return synced
@@ -0,0 +1,52 @@
+# store/routers.py
+
+import random
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from .replication import in_request, is_pinned, is_replicated, note_write, replica_aliases
+
+def read_aliases():
+    """
+    The configured DATABASE_READ_ALIASES that exist in DATABASES.
+    """
+    return [alias for alias in getattr(settings, 'DATABASE_READ_ALIASES', []) if alias in settings.DATABASES]
+
+class ReadWriteRouter:
+    """
+    Sends writes to the default database (the primary) and reads to
+    connections that never take the write lock:
+    - Catalog and recommendation models (REPLICATED_MODELS) to a random
+      one of DATABASE_REPLICAS, unless the request is pinned to the
+      primary after a write (see replication.ReplicaPinningMiddleware).
+      Outside requests (management commands, rebuilds, background jobs)
+      they are read from the primary, since what those read is usually
+      written back or cached and must not lag behind.
+    - Everything else to a read alias (DATABASE_READ_ALIASES), a second
+      connection to the primary.
+    
+    Reads inside a transaction on the default database stay on it, so a
+    view sees its own uncommitted writes and SELECT ... FOR UPDATE keeps
+    its locks. This also keeps every read of a TestCase, which runs in a
+    transaction, on the test database connection.
+    """
+    
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = replica_aliases()
+        if replicas and is_replicated(model) and in_request() and not is_pinned():
+            return random.choice(replicas)
+        aliases = read_aliases()
+        return aliases[0] if aliases else DEFAULT_DB_ALIAS
+    
+    def db_for_write(self, model, **hints):
+        note_write(model)
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Read aliases and replicas hold the same data as the default database
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema with the data
+        return db not in read_aliases() and db not in replica_aliases()
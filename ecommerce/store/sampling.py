@@ -0,0 +1,56 @@
+# store/sampling.py
+
+import random
+from array import array
+from django.db import DEFAULT_DB_ALIAS
+from .models import Product
+from . import versions
+
+# The product ID array is held per process; the shared cache only carries a
+# version token so every process notices when products are added or removed.
+VERSION_CACHE_KEY = 'store:product_ids:version'
+
+_product_ids = {'version': None, 'ids': array('q')}
+
+def product_ids():
+    """
+    All product IDs as a compact array, reloaded only after invalidate().
+    The reload reads the primary, which already has the products the new
+    version announces.
+    """
+    version = versions.current(VERSION_CACHE_KEY)
+    if _product_ids['version'] != version:
+        _product_ids['ids'] = array(
+            'q', Product.objects.using(DEFAULT_DB_ALIAS).order_by().values_list('id', flat=True)
+        )
+        _product_ids['version'] = version
+    return _product_ids['ids']
+
+def invalidate():
+    """
+    Called when products are created or deleted.
+    """
+    versions.bump(VERSION_CACHE_KEY)
+
+def sample_products(n, exclude_ids=(), rng=random, using=None):
+    """
+    Pick up to n random products without asking the database to shuffle
+    the whole table.
+    
+    Args:
+        n: Number of products wanted
+        exclude_ids: Product IDs that must not be returned
+        rng: Random number generator (anything with a ``sample`` method)
+        using: Database alias to load the products from (routed by default)
+    
+    Returns:
+        List of Product instances in random order
+    """
+    ids = product_ids()
+    exclude = set(exclude_ids)
+    # Oversample by the size of the exclusion list so that filtering it
+    # out still leaves n candidates
+    candidates = rng.sample(ids, min(len(ids), n + len(exclude)))
+    chosen = [pk for pk in candidates if pk not in exclude][:n]
+    products = Product.objects.using(using).in_bulk(chosen)
+    return [products[pk] for pk in chosen if pk in products]
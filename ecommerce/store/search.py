@@ -0,0 +1,466 @@
+# store/search.py
+
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from decimal import Decimal
+from typing import NamedTuple
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from .models import Product
+
+# Price facet buckets as (label, lower bound inclusive, upper bound exclusive)
+PRICE_RANGES = (
+    ('under-25', None, Decimal('25')),
+    ('25-50', Decimal('25'), Decimal('50')),
+    ('50-100', Decimal('50'), Decimal('100')),
+    ('100-250', Decimal('100'), Decimal('250')),
+    ('250-plus', Decimal('250'), None),
+)
+
+# Relative weight of matches in each field
+FIELD_WEIGHTS = {
+    'name': 10.0,
+    'description': 1.0,
+    'category': 2.0,
+}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# The Python backend hands ranked matches to the database as a list of
+# IDs, so ranked querysets (the admin search) get at most this many
+RANKED_QUERYSET_LIMIT = 500
+
+# Product changes the Python backend appends to its journal before it
+# writes a new snapshot of the whole index
+JOURNAL_COMPACT_AFTER = 1000
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+def price_range(price):
+    for label, low, high in PRICE_RANGES:
+        if (low is None or price >= low) and (high is None or price < high):
+            return label
+
+class SearchResults(NamedTuple):
+    products: list
+    total: int
+    facets: dict
+
+class Fts5Backend:
+    """
+    SQLite FTS5 index in the store_product_fts virtual table, keyed by
+    product ID (rowid) and ranked with bm25. The table is created by
+    'manage.py migrate' (see signals.create_search_table).
+    """
+    table = 'store_product_fts'
+    
+    @classmethod
+    def available(cls, using=DEFAULT_DB_ALIAS):
+        if connections[using].vendor != 'sqlite':
+            return False
+        with connections[using].cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            return any('FTS5' in row[0] for row in cursor.fetchall())
+    
+    def ensure_table(self, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+                "USING fts5(name, description, category, tokenize='unicode61')"
+            )
+    
+    @staticmethod
+    def _match(tokens):
+        return ' '.join(f'"{token}"*' for token in tokens)
+    
+    @staticmethod
+    def _weights():
+        return ', '.join(str(FIELD_WEIGHTS[field]) for field in ('name', 'description', 'category'))
+    
+    def index(self, rows):
+        # One transaction per batch; in autocommit mode every row would
+        # be its own commit
+        with transaction.atomic(), connection.cursor() as cursor:
+            ids = [(row['id'],) for row in rows]
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', ids)
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                [(row['id'], row['name'], row['description'], row['category__name']) for row in rows]
+            )
+    
+    def remove(self, product_ids):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids]
+            )
+    
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+        self.ensure_table()
+    
+    def search(self, tokens, category_id=None, price_range=None, limit=20, offset=0):
+        match = self._match(tokens)
+        weights = self._weights()
+        bucket = 'CASE ' + ' '.join(
+            f"WHEN {self._range_sql(low, high)} THEN '{label}'" for label, low, high in PRICE_RANGES
+        ) + ' END'
+        base = (
+            f'FROM {self.table} f JOIN store_product p ON p.id = f.rowid '
+            f'WHERE {self.table} MATCH %s'
+        )
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT p.category_id, {bucket}, COUNT(*) {base} GROUP BY 1, 2', [match]
+            )
+            counts = cursor.fetchall()
+            
+            filters, params = '', [match]
+            if category_id is not None:
+                filters += ' AND p.category_id = %s'
+                params.append(category_id)
+            if price_range is not None:
+                filters += f' AND ({bucket}) = %s'
+                params.append(price_range)
+            cursor.execute(
+                f'SELECT p.id {base}{filters} ORDER BY bm25({self.table}, {weights}) LIMIT %s OFFSET %s',
+                params + [-1 if limit is None else limit, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        
+        facets = _facets(counts)
+        total = sum(
+            n for category, bucket_label, n in counts
+            if (category_id is None or category == category_id)
+            and (price_range is None or bucket_label == price_range)
+        )
+        return ids, total, facets
+    
+    def rank_queryset(self, queryset, tokens):
+        match = self._match(tokens)
+        product = f'{connection.ops.quote_name(Product._meta.db_table)}.{connection.ops.quote_name("id")}'
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match])
+        ).annotate(search_rank=RawSQL(
+            f'SELECT bm25({self.table}, {self._weights()}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {product}',
+            [match]
+        ))
+    
+    @staticmethod
+    def _range_sql(low, high):
+        parts = []
+        if low is not None:
+            parts.append(f'p.price >= {low}')
+        if high is not None:
+            parts.append(f'p.price < {high}')
+        return ' AND '.join(parts)
+
+class InvertedIndex:
+    """
+    Pure-Python BM25 inverted index, stored by InvertedIndexBackend. Used
+    when the database has no FTS5.
+    """
+    k1 = 1.2
+    b = 0.75
+    
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {product_id: weighted term frequency}
+        self.docs = {}  # product_id -> (length, category_id, price range, terms)
+        self.total_length = 0.0  # sum of the document lengths, for their average
+        self._terms = None  # sorted term list for prefix lookups
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'total_length' not in state:
+            # Snapshot pickled before the running total was kept
+            self.total_length = sum(doc[0] for doc in self.docs.values())
+    
+    def add(self, product_id, fields, category_id, price):
+        self.remove(product_id)
+        frequencies = defaultdict(float)
+        for field, text in fields.items():
+            for token in tokenize(text):
+                frequencies[token] += FIELD_WEIGHTS[field]
+        for term, frequency in frequencies.items():
+            self.postings[term][product_id] = frequency
+        length = sum(frequencies.values())
+        self.docs[product_id] = (length, category_id, price_range(price), tuple(frequencies))
+        self.total_length += length
+        self._terms = None
+    
+    def remove(self, product_id):
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc[0]
+        for term in doc[3]:
+            postings = self.postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self.postings[term]
+        self._terms = None
+    
+    def _expand(self, prefix):
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        start = bisect_left(self._terms, prefix)
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+    
+    def search(self, tokens, category_id=None, price_range=None, limit=20, offset=0):
+        if not self.docs:
+            return [], 0, _facets([])
+        average_length = self.total_length / len(self.docs)
+        scores = None
+        for token in tokens:
+            token_scores = defaultdict(float)
+            for term in self._expand(token):
+                postings = self.postings[term]
+                idf = math.log(1 + (len(self.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for product_id, frequency in postings.items():
+                    length = self.docs[product_id][0]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    token_scores[product_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pk: score + token_scores[pk] for pk, score in scores.items() if pk in token_scores}
+        scores = scores or {}
+        
+        counts = defaultdict(int)
+        for product_id in scores:
+            doc = self.docs[product_id]
+            counts[doc[1], doc[2]] += 1
+        matching = [
+            product_id for product_id in scores
+            if (category_id is None or self.docs[product_id][1] == category_id)
+            and (price_range is None or self.docs[product_id][2] == price_range)
+        ]
+        matching.sort(key=lambda pk: (-scores[pk], pk))
+        facets = _facets((category, bucket, n) for (category, bucket), n in counts.items())
+        end = None if limit is None else offset + limit
+        return matching[offset:end], len(matching), facets
+
+class InvertedIndexBackend:
+    """
+    Keeps an InvertedIndex in settings.SEARCH_INDEX_PATH as a pickled
+    snapshot plus a journal (the same path with '.log' added) of the
+    changes made since. Index updates append to the journal instead of
+    pickling the whole index; processes replay what they have not seen
+    yet, and the journal is folded into a new snapshot every
+    JOURNAL_COMPACT_AFTER product changes.
+    """
+    _lock = threading.Lock()
+    _cache = {'mtime': None, 'index': None, 'offset': 0, 'changes': 0}
+    
+    @property
+    def path(self):
+        return getattr(settings, 'SEARCH_INDEX_PATH', settings.BASE_DIR / 'search_index.pickle')
+    
+    @property
+    def journal_path(self):
+        return f'{self.path}.log'
+    
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except OSError:
+            journal_size = 0
+        cache = self._cache
+        if cache['index'] is None or cache['mtime'] != mtime or journal_size < cache['offset']:
+            index = InvertedIndex()
+            if mtime is not None:
+                with open(self.path, 'rb') as f:
+                    index = pickle.load(f)
+            cache.update(index=index, mtime=mtime, offset=0, changes=0)
+        if journal_size > cache['offset']:
+            self._replay(cache)
+        return cache['index']
+    
+    def _replay(self, cache):
+        with open(self.journal_path, 'rb') as f:
+            f.seek(cache['offset'])
+            while True:
+                try:
+                    action, items = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    # The end, or an entry another process is still writing
+                    break
+                if action == 'add':
+                    for row in items:
+                        cache['index'].add(
+                            row['id'],
+                            {'name': row['name'], 'description': row['description'], 'category': row['category__name']},
+                            row['category_id'],
+                            row['price']
+                        )
+                else:
+                    for product_id in items:
+                        cache['index'].remove(product_id)
+                cache['changes'] += len(items)
+                cache['offset'] = f.tell()
+    
+    def save(self, index):
+        """
+        Write a snapshot of the whole index and empty the journal.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, self.path)
+        # Replaying entries already in the snapshot is harmless, so a crash
+        # before the truncation loses nothing
+        open(self.journal_path, 'wb').close()
+        self._cache.update(index=index, mtime=os.path.getmtime(self.path), offset=0, changes=0)
+    
+    def _append(self, action, items):
+        with self._lock:
+            with open(self.journal_path, 'ab') as f:
+                f.write(pickle.dumps((action, items), protocol=pickle.HIGHEST_PROTOCOL))
+            index = self.load()
+            if self._cache['changes'] >= JOURNAL_COMPACT_AFTER:
+                self.save(index)
+    
+    def index(self, rows):
+        self._append('add', list(rows))
+    
+    def remove(self, product_ids):
+        self._append('remove', list(product_ids))
+    
+    def clear(self):
+        with self._lock:
+            self.save(InvertedIndex())
+    
+    def search(self, tokens, **kwargs):
+        return self.load().search(tokens, **kwargs)
+    
+    def rank_queryset(self, queryset, tokens):
+        ids = self.search(tokens, limit=RANKED_QUERYSET_LIMIT)[0]
+        rank = Case(
+            *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+            output_field=IntegerField()
+        )
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank)
+
+def _facets(counts):
+    categories = defaultdict(int)
+    prices = {label: 0 for label, low, high in PRICE_RANGES}
+    for category_id, bucket, n in counts:
+        categories[category_id] += n
+        prices[bucket] += n
+    return {'category': dict(categories), 'price': prices}
+
+_backend = {}
+
+def get_backend():
+    """
+    The configured backend (settings.SEARCH_BACKEND: 'fts5', 'python' or
+    'auto', the default, which prefers FTS5 when SQLite has it).
+    """
+    if 'backend' not in _backend:
+        choice = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if choice == 'fts5' or (choice == 'auto' and Fts5Backend.available()):
+            _backend['backend'] = Fts5Backend()
+        else:
+            _backend['backend'] = InvertedIndexBackend()
+    return _backend['backend']
+
+INDEX_FIELDS = ('id', 'name', 'description', 'category_id', 'category__name', 'price')
+
+def index_products(product_ids):
+    """
+    (Re)index the given products; called after Product saves, so they are
+    read from the primary rather than a replica that may not have them yet.
+    """
+    rows = list(Product.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=product_ids).values(*INDEX_FIELDS))
+    if rows:
+        get_backend().index(rows)
+
+def remove_products(product_ids):
+    get_backend().remove(product_ids)
+
+def rebuild(batch_size=2000):
+    """
+    Index the whole catalog from scratch.
+    
+    Returns:
+        Number of products indexed
+    """
+    backend = get_backend()
+    backend.clear()
+    batch, total = [], 0
+    with transaction.atomic():
+        for row in Product.objects.order_by().values(*INDEX_FIELDS).iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                backend.index(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            backend.index(batch)
+            total += len(batch)
+    return total
+
+def search_ids(query, category_id=None, price_range=None, limit=20, offset=0):
+    """
+    Product IDs matching every word of ``query`` (each as a prefix), best
+    match first.
+    
+    Returns:
+        (ids, total, facets) tuple
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return [], 0, _facets([])
+    return get_backend().search(
+        tokens, category_id=category_id, price_range=price_range, limit=limit, offset=offset
+    )
+
+def rank_queryset(queryset, query):
+    """
+    Narrow a Product queryset to the matches of ``query``, annotated with
+    ``search_rank`` (lower is better). For callers that need a queryset
+    rather than a page of IDs, like the admin changelist.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+    return get_backend().rank_queryset(queryset, tokens)
+
+def search(query, category_id=None, price_range=None, limit=20, offset=0):
+    """
+    Full-text product search with ranking, prefix matching and facet
+    counts by category and price range.
+    
+    Args:
+        query: Words to look for in product name, description and category
+        category_id: Only return products of this category
+        price_range: Only return products in this PRICE_RANGES bucket
+        limit: Page size (None for all matches)
+        offset: Number of results to skip
+    
+    Returns:
+        SearchResults with the page of products, the total number of
+        matches and a {'category': {id: count}, 'price': {label: count}}
+        dict of facet counts over all matches
+    """
+    ids, total, facets = search_ids(query, category_id, price_range, limit, offset)
+    products = Product.objects.select_related('category').in_bulk(ids)
+    return SearchResults([products[pk] for pk in ids if pk in products], total, facets)
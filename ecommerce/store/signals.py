@@ -0,0 +1,172 @@
+# store/signals.py
+
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from django.db import router, transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+from cart.models import Cart, CartItem, OrderItem
+from .models import Category, Product, ProductImage, SavedItem
+from . import categories, cooccurrence, facets, images, popularity, primary_images, sampling, search
+from .recommendations import invalidate_recommendations
+
+_state = threading.local()
+
+@contextmanager
+def suspended():
+    """
+    Skip the co-occurrence and popularity bookkeeping for saved, cart and
+    order items written inside the block. Bulk code paths use this and do
+    the equivalent bookkeeping themselves.
+    """
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+def _unless_suspended(handler):
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not getattr(_state, 'suspended', False):
+            handler(*args, **kwargs)
+    return wrapper
+
+@receiver(post_save, sender=SavedItem)
+@_unless_suspended
+def saved_item_created(sender, instance, created, **kwargs):
+    if created:
+        invalidate_recommendations(
+            cooccurrence.record_interaction(instance.user_id, instance.product_id)
+        )
+        popularity.record_event(instance.product_id, 'save')
+
+@receiver(pre_delete, sender=SavedItem)
+@_unless_suspended
+def saved_item_deleting(sender, instance, **kwargs):
+    cooccurrence.pending_delete(instance.user_id, instance.product_id)
+
+@receiver(post_delete, sender=SavedItem)
+@_unless_suspended
+def saved_item_deleted(sender, instance, **kwargs):
+    invalidate_recommendations(
+        cooccurrence.forget_interaction(instance.user_id, instance.product_id)
+    )
+
+@receiver(post_save, sender=CartItem)
+@_unless_suspended
+def cart_item_created(sender, instance, created, **kwargs):
+    if created:
+        invalidate_recommendations(
+            cooccurrence.record_interaction(instance.cart.user_id, instance.product_id)
+        )
+        popularity.record_event(instance.product_id, 'cart')
+
+@receiver(pre_delete, sender=CartItem)
+@_unless_suspended
+def cart_item_deleting(sender, instance, **kwargs):
+    cooccurrence.pending_delete(instance.cart.user_id, instance.product_id)
+
+@receiver(post_delete, sender=CartItem)
+@_unless_suspended
+def cart_item_deleted(sender, instance, **kwargs):
+    invalidate_recommendations(
+        cooccurrence.forget_interaction(instance.cart.user_id, instance.product_id)
+    )
+
+@receiver(post_save, sender=OrderItem)
+@_unless_suspended
+def order_item_created(sender, instance, created, **kwargs):
+    if created:
+        invalidate_recommendations(
+            cooccurrence.record_interaction(instance.order.user_id, instance.product_id)
+        )
+        popularity.record_event(instance.product_id, 'order', instance.quantity)
+
+@receiver(pre_delete, sender=OrderItem)
+@_unless_suspended
+def order_item_deleting(sender, instance, **kwargs):
+    cooccurrence.pending_delete(instance.order.user_id, instance.product_id)
+
+@receiver(post_delete, sender=OrderItem)
+@_unless_suspended
+def order_item_deleted(sender, instance, **kwargs):
+    invalidate_recommendations(
+        cooccurrence.forget_interaction(instance.order.user_id, instance.product_id)
+    )
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, **kwargs):
+    # Remember the facet cell the stored row is counted in, and its price
+    stored = None if instance._state.adding else facets.stored_values(instance.pk)
+    instance._facet_previous = facets.facet_key(*stored) if stored else None
+    instance._price_previous = stored[1] if stored else None  # FACET_FIELDS: category_id, price, quantity
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    facets.product_changed(getattr(instance, '_facet_previous', None), facets.product_key(instance))
+    previous_price = getattr(instance, '_price_previous', None)
+    if previous_price is not None and previous_price != instance.price:
+        # Stored cart subtotals are at the current price; the cart views adjust them by deltas
+        Cart.objects.filter(items__product=instance).recalculate_totals()
+    if created:
+        sampling.invalidate()
+    invalidate_recommendations([instance.id])
+    product_id = instance.id
+    transaction.on_commit(lambda: search.index_products([product_id]))
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    facets.product_changed(facets.product_key(instance), None)
+    sampling.invalidate()
+    invalidate_recommendations([instance.id])
+    product_id = instance.id
+    transaction.on_commit(lambda: search.remove_products([product_id]))
+
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=Category)
+def image_saving(sender, instance, **kwargs):
+    # A file uploaded in this save is still uncommitted here
+    instance._image_uploaded = bool(instance.image) and not instance.image._committed
+    if sender is ProductImage and instance.is_primary:
+        primary_images.clear_others(instance)
+
+def _schedule_derivatives(instance, created):
+    if instance.image and (created or instance._image_uploaded or not instance.image_hash):
+        model, pk = type(instance), instance.pk
+        transaction.on_commit(lambda: images.schedule(model, [pk]))
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, created=False, **kwargs):
+    # Cached product cards (store.fragments) are keyed by Product.updated
+    Product.objects.filter(pk=instance.product_id).update(
+        primary_image=primary_images.refresh(instance.product_id),
+        updated=timezone.now()
+    )
+    if kwargs['signal'] is post_save:
+        _schedule_derivatives(instance, created)
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    categories.invalidate()
+    _schedule_derivatives(instance, created)
+    if not created:
+        # Products are indexed with their category name
+        product_ids = list(instance.products.values_list('id', flat=True))
+        if product_ids:
+            transaction.on_commit(lambda: search.index_products(product_ids))
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    categories.invalidate()
+
+@receiver(post_migrate)
+def create_search_table(sender, using, **kwargs):
+    # The FTS5 index is not a model, so create it once here rather than
+    # on every search
+    if sender.name == 'store' and router.allow_migrate(using, 'store') and search.Fts5Backend.available(using):
+        search.Fts5Backend().ensure_table(using)
@@ -0,0 +1,30 @@
+# store/templatetags/store_fragments.py
+
+from django import template
+from django.utils.safestring import mark_safe
+from store import fragments
+
+register = template.Library()
+
+@register.simple_tag
+def product_card(product):
+    """
+    {% product_card product %}: one cached product card.
+    """
+    return fragments.render_cards([product])[0]
+
+@register.simple_tag
+def product_cards(products):
+    """
+    {% product_cards products %}: the cached cards of a whole listing,
+    fetched from the cache in one round trip.
+    """
+    return mark_safe(''.join(fragments.render_cards(products)))
+
+@register.simple_tag
+def recommendation_block(product, recommended_products):
+    """
+    {% recommendation_block product recommended_products %}: the cached
+    "You may also like" block of a product page.
+    """
+    return fragments.render_recommendations(product, recommended_products)
@@ -0,0 +1,35 @@
+# store/templatetags/store_images.py
+
+from django import template
+from store import images
+
+register = template.Library()
+
+@register.simple_tag
+def image_url(source, variant='card', fmt='jpeg'):
+    """
+    {% image_url product_image 'thumb' %}: URL of one resized variant.
+    """
+    return images.derived_url(source, variant, fmt)
+
+@register.simple_tag
+def image_srcset(source, fmt='jpeg'):
+    """
+    {% image_srcset category 'webp' %}: ``srcset`` value with every variant.
+    """
+    return images.srcset(source, fmt)
+
+@register.inclusion_tag('store/includes/responsive_image.html')
+def responsive_image(source, variant='card', sizes='100vw', alt=''):
+    """
+    {% responsive_image image 'card' '(max-width: 600px) 50vw, 400px' product.name %}:
+    a <picture> offering WebP and JPEG derivatives, the browser picking the
+    width. ``variant`` is the fallback src.
+    """
+    return {
+        'src': images.derived_url(source, variant),
+        'webp_srcset': images.srcset(source, 'webp'),
+        'jpeg_srcset': images.srcset(source, 'jpeg'),
+        'sizes': sizes,
+        'alt': alt,
+    }
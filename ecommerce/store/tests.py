@@ -1,3 +1,901 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+import base64
+import contextvars
+import csv
+import importlib
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.testcases import DatabaseOperationForbidden
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from cart.models import Cart, CartItem, Order
+from users.models import Profile
+from . import (
+    async_views, benchmarks, catalog, cooccurrence, dbtuning, facets, fragments, images, metrics, popularity,
+    primary_images, recommendations, replication, sampling, search, urls
+)
+from .models import (
+    Category, Product, ProductActivity, ProductCooccurrence, ProductFacetCount, ProductImage, ProductPopularity,
+    SavedItem
+)
+from .categories import get_categories
+from .context_processors import categories
+from .inventory import decrement_stock, hold_for_cart, take_stock
+from .loadgen import LoadGenerator
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .querybudget import QueryBudgetExceeded, QueryRecorder, fingerprint
+from .queryplans import problems
+from .recommendations import aget_recommended_products, get_recommended_products
+from .routers import ReadWriteRouter
 
-# Create your tests here.
+class CooccurrenceTests(TestCase):
+    def scores(self):
+        return sorted(ProductCooccurrence.objects.values_list('product_id', 'related_id', 'score'))
+    
+    def test_incremental_updates_match_a_rebuild(self):
+        category = Category.objects.create(name='Pairs', slug='pairs')
+        products = [
+            Product.objects.create(category=category, name=f'p{i}', slug=f'p{i}', price=1)
+            for i in range(4)
+        ]
+        first, second = User.objects.create_user('first'), User.objects.create_user('second')
+        SavedItem.objects.create(user=first, product=products[0])
+        SavedItem.objects.create(user=first, product=products[1])
+        cart = Cart.objects.create(user=first)
+        CartItem.objects.create(cart=cart, product=products[1])
+        CartItem.objects.create(cart=cart, product=products[2])
+        SavedItem.objects.create(user=second, product=products[0])
+        SavedItem.objects.create(user=second, product=products[2])
+        # Still in the cart, so the pairs with products[1] stay
+        SavedItem.objects.filter(user=first, product=products[1]).delete()
+        
+        incremental = self.scores()
+        self.assertIn((products[0].id, products[2].id, 2), incremental)
+        cooccurrence.rebuild()
+        self.assertEqual(self.scores(), incremental)
+        
+        # A cascade removes several rows of the same user at once
+        cart.delete()
+        incremental = self.scores()
+        self.assertNotIn(products[1].id, [product_id for product_id, _, _ in incremental])
+        cooccurrence.rebuild()
+        self.assertEqual(self.scores(), incremental)
+    
+    def test_recommendations_start_with_the_top_scores(self):
+        category = Category.objects.create(name='Top', slug='top')
+        products = [
+            Product.objects.create(category=category, name=f't{i}', slug=f't{i}', price=1)
+            for i in range(5)
+        ]
+        for score, related in enumerate(products[1:4], start=1):
+            ProductCooccurrence.objects.create(product=products[0], related=related, score=score)
+        found = get_recommended_products(User.objects.create_user('shopper'), products[0], limit=2)
+        self.assertEqual(found, [products[3], products[2]])
+
+class PopularityTests(TestCase):
+    def test_events_feed_the_ranking_and_windows(self):
+        category = Category.objects.create(name='Popular', slug='popular')
+        products = [
+            Product.objects.create(category=category, name=f'p{i}', slug=f'p{i}', price=1)
+            for i in range(4)
+        ]
+        user = User.objects.create_user('shopper')
+        SavedItem.objects.create(user=user, product=products[1])
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=products[1])
+        CartItem.objects.create(cart=cart, product=products[2])
+        with self.assertNumQueries(1):
+            top = popularity.get_popular_products(5, exclude_ids=[products[0].id])
+        self.assertEqual(top, [products[1], products[2]])
+        
+        # The events of products[1] fall out of the 24h window
+        ProductActivity.objects.filter(product=products[1]).update(hour=timezone.now() - timedelta(days=2))
+        popularity.refresh_windows()
+        scores = ProductPopularity.objects.get(product=products[1])
+        self.assertEqual((scores.score_24h, scores.score_7d, scores.score_all), (0, 2, 2))
+        self.assertEqual(popularity.get_popular_products(5, window='24h'), [products[2]])
+        
+        self.assertEqual(popularity.rebuild(), 2)
+        self.assertEqual(ProductPopularity.objects.get(product=products[1]).score_all, 2)
+
+class SamplingTests(TestCase):
+    def test_samples_skip_excluded_and_deleted_products(self):
+        category = Category.objects.create(name='Sample', slug='sample')
+        with self.captureOnCommitCallbacks(execute=True):
+            products = [
+                Product.objects.create(category=category, name=f'p{i}', slug=f'p{i}', price=1)
+                for i in range(10)
+            ]
+        found = sampling.sample_products(3, exclude_ids=[p.id for p in products[:5]])
+        self.assertEqual(len(found), 3)
+        self.assertTrue(set(found) <= set(products[5:]))
+        self.assertEqual(len(sampling.sample_products(20, exclude_ids=[products[0].id])), 9)
+        # The ID array is cached; only the in_bulk lookup hits the database
+        with self.assertNumQueries(1):
+            sampling.sample_products(3)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            products[1].delete()
+        self.assertNotIn(products[1].id, sampling.product_ids())
+
+class RecommendationCacheTests(TestCase):
+    def setUp(self):
+        caches['recommendations'].clear()
+        self.addCleanup(caches['recommendations'].clear)
+        category = Category.objects.create(name='Cached', slug='cached')
+        self.products = [
+            Product.objects.create(category=category, name=f'p{i}', slug=f'p{i}', price=1)
+            for i in range(8)
+        ]
+    
+    def test_hits_are_one_query_and_saves_invalidate(self):
+        product = self.products[0]
+        key = recommendations._cache_key(product.id, 'anonymous')
+        first = recommendations.get_cached_recommendations(None, product, 5)
+        with self.assertNumQueries(1):
+            self.assertEqual(recommendations.get_cached_recommendations(None, product, 5), first)
+        
+        user = User.objects.create_user('shopper')
+        with self.captureOnCommitCallbacks(execute=True):
+            SavedItem.objects.create(user=user, product=product)
+            SavedItem.objects.create(user=user, product=self.products[3])
+        self.assertIsNone(caches['recommendations'].get(key))
+        self.assertEqual(recommendations.get_cached_recommendations(user, product, 5)[0], self.products[3])
+    
+    def test_expired_entry_is_served_while_another_request_refreshes_it(self):
+        product = self.products[0]
+        key = recommendations._cache_key(product.id, 'anonymous')
+        first = recommendations.get_cached_recommendations(None, product, 3)
+        cache = caches['recommendations']
+        cache.set(key, {**cache.get(key), 'fresh_until': 0})
+        cache.add(f'{key}:lock', True)
+        with self.assertNumQueries(1):
+            self.assertEqual(recommendations.get_cached_recommendations(None, product, 3), first)
+
+class CategoryCacheTests(TestCase):
+    def test_categories_are_cached_until_one_changes(self):
+        request = RequestFactory().get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Alpha', slug='alpha')
+            beta = Category.objects.create(name='Beta', slug='beta')
+        self.assertEqual([c.slug for c in categories(request)['categories']], ['alpha', 'beta'])
+        with self.assertNumQueries(0):
+            categories(request)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            beta.delete()
+        self.assertEqual([c.slug for c in categories(request)['categories']], ['alpha'])
+
+class TakeStockTests(TestCase):
+    def make_product(self, quantity):
+        category = Category.objects.create(name='Hot', slug='hot')
+        return Product.objects.create(
+            category=category, name='Hot SKU', slug='hot-sku', price=Decimal('10.00'), quantity=quantity
+        )
+    
+    def test_partial_take_reports_each_line(self):
+        product = self.make_product(3)
+        other = Product.objects.create(
+            category=product.category, name='Other', slug='other', price=Decimal('1.00'), quantity=1
+        )
+        lines = take_stock({product.id: 2, other.id: 5}, partial=True)
+        self.assertTrue(lines[product.id].taken)
+        self.assertFalse(lines[other.id].taken)
+        self.assertEqual(lines[other.id].available, 1)
+        product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((product.quantity, other.quantity), (1, 1))
+    
+    def test_all_or_nothing_takes_nothing_when_a_line_is_short(self):
+        product = self.make_product(3)
+        other = Product.objects.create(
+            category=product.category, name='Other', slug='other', price=Decimal('1.00'), quantity=1
+        )
+        lines = take_stock({product.id: 2, other.id: 5})
+        self.assertFalse(any(line.taken for line in lines.values()))
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 3)
+    
+    def test_reservations_of_other_carts_are_respected(self):
+        product = self.make_product(3)
+        holder = Cart.objects.create(user=User.objects.create_user('holder'))
+        buyer = Cart.objects.create(user=User.objects.create_user('buyer'))
+        self.assertTrue(hold_for_cart(holder.id, {product.id: 2})[product.id].taken)
+        self.assertFalse(hold_for_cart(buyer.id, {product.id: 2})[product.id].taken)
+        self.assertFalse(take_stock({product.id: 2}, cart_id=buyer.id)[product.id].taken)
+        self.assertTrue(take_stock({product.id: 2}, cart_id=holder.id)[product.id].taken)
+        self.assertFalse(holder.reservations.exists())
+
+class KeysetPaginationTests(TestCase):
+    def test_pages_cover_every_product_once_with_ties(self):
+        category = Category.objects.create(name='Pages', slug='pages')
+        products = [
+            Product.objects.create(category=category, name=f'p{i}', slug=f'p{i}', price=1)
+            for i in range(7)
+        ]
+        # Equal timestamps are ordered by id
+        Product.objects.update(created=products[0].created)
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Product.objects.filter(category=category), cursor, per_page=3)
+            seen += [p.id for p in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted((p.id for p in products), reverse=True))
+        
+        product = Product.objects.get(pk=products[2].pk)
+        self.assertEqual(decode_cursor(encode_cursor(product)), (product.created, product.id))
+    
+    def test_invalid_or_tampered_cursors_are_rejected(self):
+        def encoded(raw):
+            return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+        
+        for cursor in ('!!!', 'a', encoded(b'\xff\xfe'), encoded(b'no separator'),
+                       encoded(b'2024-01-01T00:00:00+00:00|1|2'), encoded(b'yesterday|1'),
+                       encoded(b'2024-01-01T00:00:00+00:00|one')):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+        Category.objects.create(name='Pages', slug='pages')
+        response = self.client.get(reverse('store:category_detail', args=['pages']) + '?after=!!!')
+        self.assertEqual(response.status_code, 404)
+
+class SearchTests(TestCase):
+    def setUp(self):
+        search._backend.clear()
+        self.addCleanup(search._backend.clear)
+    
+    def use_python_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(search.InvertedIndexBackend._cache.update, index=None, mtime=None, offset=0, changes=0)
+        path = os.path.join(directory, 'index.pickle')
+        settings = override_settings(SEARCH_BACKEND='python', SEARCH_INDEX_PATH=path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        return path
+    
+    def check_search(self):
+        shoes = Category.objects.create(name='Shoes', slug='shoes')
+        hats = Category.objects.create(name='Hats', slug='hats')
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe = Product.objects.create(
+                category=shoes, name='Running shoe', slug='shoe', price=Decimal('30'), description='light runner'
+            )
+            boot = Product.objects.create(
+                category=shoes, name='Leather boot', slug='boot', price=Decimal('120'), description='running errands'
+            )
+            hat = Product.objects.create(category=hats, name='Sun hat', slug='hat', price=Decimal('10'))
+        results = search.search('run')
+        self.assertEqual(results.products, [shoe, boot])
+        self.assertEqual(results.facets['category'], {shoes.id: 2})
+        self.assertEqual(results.facets['price']['25-50'], 1)
+        self.assertEqual(search.search('run', price_range='100-250').products, [boot])
+        self.assertEqual(search.search('shoes').total, 2)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            hat.name = 'Running cap'
+            hat.save()
+            boot.delete()
+        self.assertEqual(set(search.search('runn').products), {shoe, hat})
+        self.assertEqual(search.rebuild(), 2)
+        self.assertEqual(search.search('runn').total, 2)
+        self.assertEqual(search.search('"odd* (query').total, 0)
+        ranked = search.rank_queryset(Product.objects.all(), 'running').order_by('search_rank')
+        self.assertEqual(list(ranked), search.search('running').products)
+    
+    def test_fts5_backend(self):
+        with override_settings(SEARCH_BACKEND='fts5'):
+            with CaptureQueriesContext(connection) as queries:
+                self.check_search()
+        # The table is created by migrate; only rebuild() recreates it
+        self.assertEqual(sum('CREATE VIRTUAL TABLE' in query['sql'] for query in queries), 1)
+    
+    def test_python_backend(self):
+        self.use_python_backend()
+        self.check_search()
+    
+    def test_python_backend_journals_changes(self):
+        path = self.use_python_backend()
+        category = Category.objects.create(name='Journal', slug='journal')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(category=category, name='Journal entry', slug='entry', price=1)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.getsize(f'{path}.log'))
+        # Another process starts from the snapshot and replays the journal
+        search.InvertedIndexBackend._cache.update(index=None, mtime=None, offset=0, changes=0)
+        self.assertEqual(search.search('journ').products, [product])
+        
+        with mock.patch.object(search, 'JOURNAL_COMPACT_AFTER', 2):
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(os.path.getsize(f'{path}.log'), 0)
+        self.assertEqual(search.search('journ').products, [product])
+    
+    def test_inverted_index_keeps_a_running_length_total(self):
+        index = search.InvertedIndex()
+        index.add(1, {'name': 'red shoe', 'description': 'red'}, 1, Decimal('10'))
+        index.add(2, {'name': 'blue hat', 'description': ''}, 1, Decimal('10'))
+        index.add(1, {'name': 'shoe', 'description': ''}, 1, Decimal('10'))
+        index.remove(2)
+        self.assertAlmostEqual(index.total_length, index.docs[1][0])
+        # Snapshots pickled without the total get it on load
+        state = dict(index.__dict__)
+        del state['total_length']
+        old = search.InvertedIndex.__new__(search.InvertedIndex)
+        old.__setstate__(state)
+        self.assertAlmostEqual(old.total_length, index.total_length)
+        self.assertEqual(pickle.loads(pickle.dumps(index)).total_length, index.total_length)
+    
+    def test_admin_search_is_ranked(self):
+        category = Category.objects.create(name='Admin', slug='admin')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(category=category, name='Lamp', slug='lamp', price=1, description='a desk lamp')
+            Product.objects.create(category=category, name='Desk', slug='desk', price=1)
+            Product.objects.create(category=category, name='Chair', slug='chair', price=1)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get(reverse('admin:store_product_changelist'), {'q': 'desk'})
+        self.assertEqual([p.slug for p in response.context['cl'].result_list], ['desk', 'lamp'])
+
+class FacetTests(TestCase):
+    def cells(self):
+        return sorted(
+            ProductFacetCount.objects.filter(count__gt=0).values_list('category_id', 'price_range', 'in_stock', 'count')
+        )
+    
+    def test_incremental_counts_match_a_rebuild(self):
+        first = Category.objects.create(name='First', slug='first')
+        second = Category.objects.create(name='Second', slug='second')
+        cheap = Product.objects.create(category=first, name='Cheap', slug='cheap', price=Decimal('10'), quantity=2)
+        repriced = Product.objects.create(category=first, name='Repriced', slug='repriced', price=60, quantity=0)
+        moved = Product.objects.create(category=second, name='Moved', slug='moved', price=Decimal('300'), quantity=1)
+        repriced.price = Decimal('20')
+        repriced.save()
+        moved.category = first
+        moved.save()
+        Product.objects.create(category=second, name='Gone', slug='gone', price=Decimal('5'), quantity=5).delete()
+        # Queryset UPDATE, no signals
+        decrement_stock({cheap.id: 2})
+        
+        incremental = self.cells()
+        facets.rebuild()
+        self.assertEqual(self.cells(), incremental)
+        
+        counts = facets.get_facet_counts(category_id=first.id, in_stock=False)
+        self.assertEqual(counts.total, 2)
+        self.assertEqual(counts.price['under-25'], 2)
+        # A facet's own selection does not narrow its counts
+        self.assertEqual(counts.in_stock, {True: 1, False: 2})
+    
+    def test_filter_products_applies_the_selection(self):
+        category = Category.objects.create(name='Filter', slug='filter')
+        Product.objects.create(category=category, name='In', slug='in', price=Decimal('10'), quantity=2)
+        Product.objects.create(category=category, name='Out', slug='out', price=Decimal('10'), quantity=0)
+        Product.objects.create(category=category, name='Dear', slug='dear', price=Decimal('30'), quantity=2)
+        found = facets.filter_products(Product.objects.all(), price_range='under-25', in_stock=True)
+        self.assertEqual([p.slug for p in found], ['in'])
+        with self.assertRaises(ValueError):
+            facets.filter_products(Product.objects.all(), price_range='bogus')
+
+class CatalogTests(TestCase):
+    def write_csv(self, path, rows):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'category', 'price', 'quantity', 'description', 'image'])
+            writer.writerows(rows)
+    
+    def test_import_export_round_trip(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, 'catalog.csv')
+        self.write_csv(source, [
+            *[[f'Widget {i}', ['Tools', 'Toys'][i % 2], f'{i}.50', i % 3, 'Sturdy', ''] for i in range(25)],
+            ['', 'Tools', '1.00', 1, '', ''],
+            ['Broken', 'Tools', 'abc', 1, '', ''],
+        ])
+        out, err = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', source, '--batch-size', '10', stdout=out, stderr=err)
+        self.assertIn('Imported 25 new and 0 updated products, 2 new categories', out.getvalue())
+        self.assertEqual(err.getvalue().count('skipped'), 2)
+        self.assertEqual(Product.objects.count(), 25)
+        
+        exported = os.path.join(directory, 'catalog.jsonl')
+        call_command('export_catalog', exported, stdout=StringIO())
+        with open(exported) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0]['slug'], 'widget-0')
+        self.assertEqual(rows[0]['category'], 'tools')
+        
+        with open(exported, 'w') as f:
+            for row in rows[:5]:
+                f.write(json.dumps({**row, 'price': '99.00', 'quantity': 7}) + '\n')
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', exported, stdout=out)
+        self.assertIn('Imported 0 new and 5 updated products, 0 new categories', out.getvalue())
+        self.assertEqual(Product.objects.count(), 25)
+        self.assertEqual(Product.objects.get(slug='widget-3').quantity, 7)
+        self.assertEqual(Product.objects.get(slug='widget-3').price, Decimal('99.00'))
+        
+        csv_out = StringIO()
+        call_command('export_catalog', '-', '--format', 'csv', stdout=csv_out)
+        self.assertEqual(len(csv_out.getvalue().splitlines()), 26)
+    
+    def test_new_categories_are_counted_and_cached(self):
+        request = RequestFactory().get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Tools', slug='tools')
+        self.assertEqual([c.slug for c in categories(request)['categories']], ['tools'])
+        
+        importer = catalog.CatalogImporter()
+        # Created after the importer loaded its categories: looked up, not counted
+        Category.objects.create(name='Garden', slug='garden')
+        rows = [
+            (i, {'name': f'Item {i}', 'category': name, 'price': '1.00', 'quantity': 1})
+            for i, name in enumerate(['Tools', 'Garden', 'Toys', 'Toys'], start=2)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = importer.run(rows)
+        self.assertEqual(stats['categories'], 1)
+        self.assertEqual(stats['created'], 4)
+        self.assertEqual([c.slug for c in categories(request)['categories']], ['tools', 'garden', 'toys'])
+
+class LoadGeneratorTests(TestCase):
+    def generate(self, prefix):
+        call_command(
+            'generate_load_data', '--users', '20', '--products', '100', '--categories', '4',
+            '--prefix', prefix, '--seed', '7', stdout=StringIO()
+        )
+    
+    def test_generated_data_is_reproducible_and_consistent(self):
+        self.generate('a')
+        self.generate('b')
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Profile.objects.count(), 40)
+        products = [
+            list(
+                Product.objects.filter(slug__startswith=f'{prefix}-').order_by('id')
+                .values_list('name', 'price', 'quantity')
+            )
+            for prefix in ('a', 'b')
+        ]
+        self.assertEqual(len(products[0]), 100)
+        self.assertEqual(products[0], products[1])
+        
+        # Stored totals match the lines; facet counts were rebuilt
+        for cart in Cart.objects.with_totals():
+            self.assertEqual(cart.items_count, cart.line_count)
+            self.assertEqual(cart.subtotal, cart.computed_subtotal)
+        for order in Order.objects.with_totals():
+            self.assertEqual(order.grand_total, order.items_total)
+        self.assertEqual(sum(ProductFacetCount.objects.values_list('count', flat=True)), 200)
+        
+        with self.assertRaises(CommandError):
+            self.generate('a')
+        with self.assertRaisesMessage(CommandError, '--categories'):
+            call_command('generate_load_data', '--categories', '0', '--prefix', 'c', stdout=StringIO())
+    
+    def test_signals_are_reconnected(self):
+        self.generate('a')
+        user = User.objects.create_user('after')
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+
+class BenchmarkTests(TestCase):
+    def test_scenarios_run_and_roll_back(self):
+        LoadGenerator(prefix='bench', seed=1).generate(users=10, categories=2, products=50)
+        orders = Order.objects.count()
+        results = benchmarks.BenchmarkRun(repeat=2, warmup=0).run()
+        self.assertEqual(set(results), {scenario.name for scenario in benchmarks.SCENARIOS})
+        for metrics in results.values():
+            self.assertGreater(metrics['queries'], 0)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p95_ms'])
+        self.assertEqual(Order.objects.count(), orders)
+    
+    def test_compare_flags_regressions(self):
+        baseline = {'1000': {'home': {'p50_ms': 10, 'p95_ms': 20, 'queries': 5, 'alloc_kb': 100}}}
+        same = {'1000': {'home': {'p50_ms': 10.5, 'p95_ms': 20.5, 'queries': 5, 'alloc_kb': 110}}}
+        self.assertEqual(benchmarks.compare(same, baseline), [])
+        worse = {'1000': {'home': {'p50_ms': 15, 'p95_ms': 20, 'queries': 6, 'alloc_kb': 100}}}
+        self.assertEqual(benchmarks.compare(worse, baseline), [
+            ('1000', 'home', 'p50_ms', 10, 15), ('1000', 'home', 'queries', 5, 6)
+        ])
+        self.assertEqual(benchmarks.compare(worse, {}), [])
+
+@override_settings(QUERY_BUDGET_MODE='raise', QUERY_BUDGET_HEADERS=True)
+class QueryBudgetTests(TestCase):
+    def test_within_budget_sets_headers(self):
+        with override_settings(QUERY_BUDGETS={'store:home': 5}):
+            response = self.client.get(reverse('store:home'))
+        self.assertEqual(response['X-Query-Budget'], '5')
+        self.assertLessEqual(int(response['X-Query-Count']), 5)
+        self.assertNotIn('X-Query-Budget-Exceeded', response)
+    
+    def test_over_budget_raises(self):
+        self.client.force_login(User.objects.create_user('shopper'))
+        with override_settings(QUERY_BUDGETS={'store:home': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('store:home'))
+    
+    def test_repeated_query_shape_is_detected(self):
+        category = Category.objects.create(name='N+1', slug='n-plus-1')
+        products = [
+            Product.objects.create(category=category, name=f'p{i}', slug=f'p{i}', price=1)
+            for i in range(5)
+        ]
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+                product.category.name
+                Product.objects.get(pk=product.pk)
+        shapes = dict(recorder.duplicates(threshold=3))
+        self.assertIn(5, shapes.values())
+        self.assertEqual(
+            fingerprint('SELECT 1 FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            'SELECT ? FROM t WHERE id IN (...) LIMIT ?'
+        )
+
+class QueryPlanTests(TestCase):
+    def test_full_scans_of_large_tables_are_reported(self):
+        sql = 'SELECT 1 FROM "store_product" WHERE "category_id" IN (SELECT U0."id" FROM "store_category" U0)'
+        plan = [
+            'SCAN store_product',
+            'LIST SUBQUERY 1',
+            'SCAN U0',
+            'SEARCH store_saveditem USING INDEX store_saveditem_product_id (product_id=?)',
+            'SCAN store_product USING INDEX store_product_created_idx',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        found = problems(plan, sql, {'store_product': 5000, 'store_category': 20})
+        self.assertEqual(found, [
+            ('full scan', 'store_product', 'SCAN store_product'),
+            ('temp sort', 'ORDER BY', 'USE TEMP B-TREE FOR ORDER BY'),
+        ])
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+    
+    def test_disabled_records_nothing_and_hides_endpoint(self):
+        with override_settings(METRICS_ENABLED=False):
+            self.client.get(reverse('store:home'))
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertEqual(metrics.snapshot(), ({}, {}))
+    
+    @override_settings(METRICS_ENABLED=True, METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_enabled_records_views_and_exports(self):
+        self.client.get(reverse('store:home'))
+        histograms, counters = metrics.snapshot()
+        self.assertIn(('store_view_seconds', (('status', '2xx'), ('view', 'store:home'))), histograms)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE store_view_seconds histogram', body)
+        self.assertIn('store_view_seconds_count{status="2xx",view="store:home"} 1', body)
+
+class FragmentTests(TestCase):
+    def test_cards_are_cached_until_the_product_changes(self):
+        category = Category.objects.create(name='Cards', slug='cards')
+        product = Product.objects.create(category=category, name='Old name', slug='card', price=1)
+        product = Product.objects.select_related('category').get(pk=product.pk)
+        self.assertIn('Old name', fragments.render_cards([product])[0])
+        with self.assertNumQueries(0):
+            self.assertIn('Old name', fragments.render_cards([product])[0])
+        
+        product.name = 'New name'
+        product.save()
+        self.assertIn('New name', fragments.render_cards([product])[0])
+    
+    def test_pages_render_the_cached_fragments(self):
+        caches['fragments'].clear()
+        self.addCleanup(caches['fragments'].clear)
+        category = Category.objects.create(name='Cards', slug='cards')
+        for i in range(3):
+            Product.objects.create(category=category, name=f'Card {i}', slug=f'card-{i}', price=1)
+        response = self.client.get(reverse('store:category_detail', args=['cards']))
+        self.assertContains(response, 'class="product-card"', count=3)
+        
+        # The listing stored every card; the product page reuses them for its recommendations
+        with mock.patch.object(fragments, 'get_template', wraps=fragments.get_template) as get_template:
+            self.client.get(reverse('store:category_detail', args=['cards']))
+            response = self.client.get(reverse('store:product_detail', args=['card-0']))
+        self.assertContains(response, '<h1>Card 0</h1>')
+        self.assertContains(response, 'class="product-card"', count=2)
+        get_template.assert_called_once_with(fragments.RECOMMENDATIONS_TEMPLATE)
+
+class PrimaryImageTests(TestCase):
+    def test_product_points_at_its_one_primary_image(self):
+        category = Category.objects.create(name='Primary', slug='primary')
+        product = Product.objects.create(category=category, name='Two photos', slug='two-photos', price=1)
+        first = ProductImage.objects.create(product=product, image='products/first.jpg')
+        second = ProductImage.objects.create(product=product, image='products/second.jpg', is_primary=True)
+        first.refresh_from_db()
+        product.refresh_from_db()
+        self.assertFalse(first.is_primary)
+        self.assertEqual(product.primary_image_id, second.pk)
+        
+        second.delete()
+        first.refresh_from_db()
+        product.refresh_from_db()
+        self.assertTrue(first.is_primary)
+        self.assertEqual(product.primary_image_id, first.pk)
+    
+    def test_rebuild_fixes_bulk_inserted_images(self):
+        category = Category.objects.create(name='Primary', slug='primary')
+        product = Product.objects.create(category=category, name='Imported', slug='imported', price=1)
+        Product.objects.filter(pk=product.pk).update(updated=timezone.now() - timedelta(days=1))
+        first, second = ProductImage.objects.bulk_create([
+            ProductImage(product=product, image='products/first.jpg', is_primary=True),
+            ProductImage(product=product, image='products/second.jpg'),
+        ])
+        self.assertEqual(primary_images.rebuild([product.pk]), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image_id, first.pk)
+        self.assertGreater(product.updated, timezone.now() - timedelta(minutes=1))
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+    
+    def test_upload_generates_derivatives_and_misses_are_lazy(self):
+        upload = BytesIO()
+        Image.new('RGBA', (1200, 800), (200, 10, 10, 128)).save(upload, 'PNG')
+        category = Category.objects.create(name='Photos', slug='photos')
+        product = Product.objects.create(category=category, name='Photo', slug='photo', price=1)
+        with override_settings(MEDIA_ROOT=self.media_root, IMAGE_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                image = ProductImage.objects.create(
+                    product=product, image=SimpleUploadedFile('photo.png', upload.getvalue()), is_primary=True
+                )
+            image.refresh_from_db()
+            card = os.path.join(self.media_root, images.derived_name(image.image_hash, 'card', 'jpeg'))
+            with Image.open(card) as derivative:
+                self.assertEqual((derivative.size, derivative.mode), ((400, 267), 'RGB'))
+            self.assertEqual((image.image_width, image.image_height), (1200, 800))
+            # No cropped thumb; zoom is the 1200px original, not 1600px
+            self.assertEqual(images.srcset(image, 'webp'), ', '.join([
+                f"{images.derived_url(image, 'card', 'webp')} 400w",
+                f"{images.derived_url(image, 'zoom', 'webp')} 1200w",
+            ]))
+            
+            os.remove(card)
+            response = self.client.get(images.derived_url(image, 'card'))
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            response.close()
+            self.assertTrue(os.path.exists(card))
+    
+    def test_processing_a_category_image_invalidates_the_category_cache(self):
+        upload = BytesIO()
+        Image.new('RGB', (600, 400)).save(upload, 'PNG')
+        with override_settings(MEDIA_ROOT=self.media_root, IMAGE_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                category = Category.objects.create(name='Framed', slug='framed')
+            self.assertEqual(next(c for c in get_categories() if c.pk == category.pk).image_hash, '')
+            
+            name = default_storage.save('categories/framed.png', ContentFile(upload.getvalue()))
+            Category.objects.filter(pk=category.pk).update(image=name)
+            with self.captureOnCommitCallbacks(execute=True):
+                images.process(Category, category.pk)
+            cached = next(c for c in get_categories() if c.pk == category.pk)
+            self.assertEqual((cached.image_width, cached.image_height), (600, 400))
+            self.assertEqual(len(cached.image_hash), 32)
+    
+    def test_srcset_skips_variants_wider_than_the_original(self):
+        category = Category(name='Small', slug='small', image='categories/small.png', image_hash='0' * 32)
+        self.assertEqual(images.srcset(category), '')
+        category.image_width, category.image_height = 300, 200
+        self.assertEqual(images.srcset(category), f"{images.derived_url(category, 'card')} 300w")
+        category.image_width, category.image_height = 600, 2000
+        self.assertEqual(images.srcset(category), ', '.join([
+            f"{images.derived_url(category, 'card')} 120w", f"{images.derived_url(category, 'zoom')} 480w"
+        ]))
+
+class DbTuningTests(TestCase):
+    databases = {'default', 'read'}
+    
+    def connect(self, alias, path):
+        wrapper = connections[alias].__class__({**connections[alias].settings_dict, 'NAME': path}, alias)
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+    
+    def test_file_connections_are_tuned(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tuned.sqlite3')
+            writer = self.connect('default', path)
+            self.assertEqual(
+                dbtuning.pragma_values(writer, ['journal_mode', 'synchronous']), {'journal_mode': 'wal', 'synchronous': 1}
+            )
+            self.assertEqual(writer.transaction_mode, 'IMMEDIATE')
+            reader = self.connect('read', path)
+            self.assertEqual(dbtuning.pragma_values(reader, ['query_only']), {'query_only': 1})
+            reader.close()
+            writer.close()
+    
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_reads_outside_transactions_use_the_read_alias(self):
+        router = ReadWriteRouter()
+        # A TestCase runs in a transaction; a new thread's connection does not
+        self.assertEqual(router.db_for_read(Product), 'default')
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(executor.submit(router.db_for_read, Product).result(), 'read')
+        self.assertEqual(router.db_for_write(Product), 'default')
+
+class ReplicaRoutingTests(TestCase):
+    def route(self, model):
+        # From a new thread, outside the TestCase transaction
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(context.run, ReadWriteRouter().db_for_read, model).result()
+    
+    @override_settings(DATABASE_REPLICAS=['read'], DATABASE_READ_ALIASES=[])
+    def test_catalog_reads_go_to_replicas_until_the_request_writes(self):
+        # Outside a request (commands, background jobs) everything reads the primary
+        self.assertEqual(self.route(Product), 'default')
+        self.assertEqual(self.route(Cart), 'default')
+        token = replication._current.set(replication._RequestState(pinned=False))
+        try:
+            self.assertEqual(self.route(Product), 'read')
+            ReadWriteRouter().db_for_write(CartItem)
+            self.assertEqual(self.route(Product), 'default')
+        finally:
+            replication._current.reset(token)
+    
+    @mock.patch.object(ReadWriteRouter, 'db_for_read', return_value='read')
+    def test_rebuilds_and_derived_data_read_the_primary(self, db_for_read):
+        # 'read' is not in databases, so a query routed to it fails the test
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name='Fresh', slug='fresh')
+            product = Product.objects.create(category=category, name='Fresh', slug='fresh', price=1, quantity=1)
+        image = ProductImage.objects.create(product=product, image='products/missing.jpg')
+        self.assertIn(category, get_categories())
+        self.assertIn(product.id, sampling.product_ids())
+        caches['recommendations'].clear()
+        self.addCleanup(caches['recommendations'].clear)
+        recommendations.get_cached_recommendations(None, Product(id=0, category=category))
+        self.assertEqual(primary_images.refresh(product.id), image.id)
+        search.index_products([product.id])
+        with self.assertLogs('store.images', 'WARNING'):
+            self.assertEqual(images.process(ProductImage, image.id), 0)
+        self.assertRaises(DatabaseOperationForbidden, list, Product.objects.all())
+    
+    @override_settings(DATABASE_REPLICAS=['read'])
+    def test_cart_writes_pin_the_user_to_the_primary(self):
+        category = Category.objects.create(name='Pinned', slug='pinned')
+        product = Product.objects.create(category=category, name='p', slug='p', price=1, quantity=5)
+        self.client.force_login(User.objects.create_user('shopper'))
+        self.client.get(reverse('store:home'))
+        self.assertNotIn(replication.PIN_SESSION_KEY, self.client.session)
+        self.client.get(reverse('cart:add_to_cart', args=[product.id]))
+        self.assertGreater(self.client.session[replication.PIN_SESSION_KEY], time.time())
+    
+    def test_copy_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+            with closing(sqlite3.connect(primary)) as db:
+                db.execute('CREATE TABLE t (x)')
+                db.execute('INSERT INTO t VALUES (1)')
+                db.commit()
+            replication.copy_database(primary, replica)
+            with closing(sqlite3.connect(replica)) as db:
+                self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(1,)])
+
+class AsyncRecommendationTests(TransactionTestCase):
+    # Committed data, since the concurrent stages use their own connections
+    databases = '__all__'
+    
+    def test_concurrent_stages_match_sequential(self):
+        user = User.objects.create_user('shopper')
+        category = Category.objects.create(name='Same', slug='same')
+        products = [
+            Product.objects.create(category=category, name=f'p{i}', slug=f'p{i}', price=1)
+            for i in range(8)
+        ]
+        for score, related in enumerate(products[4:7]):
+            ProductCooccurrence.objects.create(product=products[0], related=related, score=score)
+        
+        for limit in (2, 5):
+            expected = [p.id for p in get_recommended_products(user, products[0], limit)]
+            found = [p.id for p in async_to_sync(aget_recommended_products)(user, products[0], limit)]
+            self.assertEqual(found, expected)
+
+class AsyncViewTests(TransactionTestCase):
+    databases = '__all__'
+    
+    def setUp(self):
+        # store.urls picks the catalog views when it is imported, and the
+        # root URLconf holds the resolver built from it
+        root = importlib.import_module(settings.ROOT_URLCONF)
+        self.addCleanup(clear_url_caches)
+        self.addCleanup(importlib.reload, root)
+        self.addCleanup(importlib.reload, urls)
+        enabled = override_settings(ASYNC_VIEWS=True)
+        enabled.enable()
+        self.addCleanup(enabled.disable)
+        importlib.reload(urls)
+        importlib.reload(root)
+        clear_url_caches()
+        caches['recommendations'].clear()
+        self.addCleanup(caches['recommendations'].clear)
+        
+        self.category = Category.objects.create(name='Lamps', slug='lamps')
+        self.products = [
+            Product.objects.create(category=self.category, name=f'Desk lamp {i}', slug=f'lamp-{i}', price=10 + i)
+            for i in range(3)
+        ]
+    
+    def test_catalog_routes_to_the_async_views(self):
+        self.assertIs(resolve(reverse('store:home')).func, async_views.home)
+        self.assertIs(resolve(reverse('store:product_detail', args=['lamp-0'])).func, async_views.product_detail)
+    
+    async def test_home_and_category_list(self):
+        for name in ('store:home', 'store:category_list'):
+            response = await self.async_client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['categories']), [self.category])
+    
+    async def test_product_list(self):
+        response = await self.async_client.get(reverse('store:category_detail', args=['lamps']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['category'], self.category)
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertEqual(response.context['facets'].total, 3)
+        
+        response = await self.async_client.get(reverse('store:category_detail', args=['lamps']) + '?in_stock=1')
+        self.assertIs(response.context['in_stock'], True)
+        
+        response = await self.async_client.get(reverse('store:category_detail', args=['lamps']) + '?after=!!!')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('store:category_detail', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+    
+    async def test_product_detail(self):
+        user = await User.objects.acreate_user('shopper')
+        await SavedItem.objects.acreate(user=user, product=self.products[0])
+        await self.async_client.aforce_login(user)
+        
+        response = await self.async_client.get(reverse('store:product_detail', args=['lamp-0']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product'], self.products[0])
+        self.assertIs(response.context['is_saved'], True)
+        response = await self.async_client.get(reverse('store:product_detail', args=['lamp-1']))
+        self.assertIs(response.context['is_saved'], False)
+        
+        response = await self.async_client.get(reverse('store:product_detail', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+    
+    async def test_search(self):
+        search._backend.clear()
+        self.addCleanup(search._backend.clear)
+        await sync_to_async(search.rebuild)()
+        
+        response = await self.async_client.get(reverse('store:search'), {'q': 'desk'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['query'], 'desk')
+        self.assertEqual(response.context['total'], 3)
+        self.assertFalse(response.context['has_next'])
+        
+        response = await self.async_client.get(reverse('store:search'), {'q': 'desk', 'page': 'two'})
+        self.assertEqual(response.status_code, 404)
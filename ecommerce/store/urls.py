@@ -1,15 +1,20 @@
 # store/urls.py
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Catalog views, async under ASGI (see settings.ASYNC_VIEWS)
+catalog = async_views if settings.ASYNC_VIEWS else views
 
 app_name = 'store'
 
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('categories/', views.category_list, name='category_list'),
-    path('category/<slug:category_slug>/', views.product_list, name='category_detail'),
-    path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('', catalog.home, name='home'),
+    path('search/', catalog.search, name='search'),
+    path('categories/', catalog.category_list, name='category_list'),
+    path('category/<slug:category_slug>/', catalog.product_list, name='category_detail'),
+    path('product/<slug:slug>/', catalog.product_detail, name='product_detail'),
     path('save/<int:product_id>/', views.toggle_save_product, name='toggle_save_product'),
     path('saved/', views.saved_products, name='saved_products'),
 ]
\ No newline at end of file
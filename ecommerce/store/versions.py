@@ -0,0 +1,24 @@
+# store/versions.py
+
+import uuid
+from functools import partial
+from django.core.cache import cache
+from django.db import transaction
+
+def current(key):
+    """
+    Return the version token stored under key in the shared cache,
+    creating one if it is missing.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+def bump(key):
+    """
+    Replace the version token once the current transaction commits,
+    invalidating everything derived from it.
+    """
+    transaction.on_commit(partial(cache.set, key, uuid.uuid4().hex, None))
@@ -3,34 +3,70 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.views.decorators.http import require_GET
 from .models import Category, Product, SavedItem
-from .recommendations import get_recommended_products
+from .pagination import keyset_page
+from .categories import get_categories
+from .facets import filter_products, get_facet_counts
+from .recommendations import get_cached_recommendations
+from . import images
+from . import search as product_search
 def home(request):
-    categories = Category.objects.all()
+    categories = get_categories()
     return render(request, 'home.html', {'categories': categories})
 
 def category_list(request):
-    categories = Category.objects.all()
+    categories = get_categories()
     return render(request, 'store/category_list.html', {'categories': categories})
 
+PRODUCTS_PER_PAGE = 24
+
+def listing_queryset(category=None):
+    """
+    Products of a listing page, with their category and primary image.
+    """
+    products = Product.objects.select_related('category', 'primary_image')
+    if category is not None:
+        products = products.filter(category=category)
+    return products
+
 def product_list(request, category_slug=None):
     category = None
-    products = Product.objects.all()
-    
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+    products = listing_queryset(category)
+    
+    price_range = request.GET.get('price') or None
+    in_stock = {'1': True, '0': False}.get(request.GET.get('in_stock'))
+    
+    try:
+        products = filter_products(products, price_range=price_range, in_stock=in_stock)
+        products, next_cursor = keyset_page(
+            products, request.GET.get('after'), per_page=PRODUCTS_PER_PAGE
+        )
+    except ValueError:
+        raise Http404('Invalid filter or page cursor')
     
     return render(request, 'store/product_list.html', {
         'category': category,
-        'products': products
+        'products': products,
+        'next_cursor': next_cursor,
+        'price_range': price_range,
+        'in_stock': in_stock,
+        'facets': get_facet_counts(
+            category_id=category.id if category else None,
+            price_range=price_range,
+            in_stock=in_stock
+        )
     })
 
 def product_detail(request, slug):
     product = get_object_or_404(Product, slug=slug)
     
     # Get recommended products using our recommendation system
-    recommended_products = get_recommended_products(request.user, product, limit=5)
+    recommended_products = get_cached_recommendations(request.user, product, limit=5)
     
     # Check if product is in user's saved items
     is_saved = False
@@ -42,6 +78,35 @@ def product_detail(request, slug):
         'recommended_products': recommended_products,
         'is_saved': is_saved
     })
+SEARCH_RESULTS_PER_PAGE = 20
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    category_id = request.GET.get('category')
+    price_range = request.GET.get('price') or None
+    try:
+        category_id = int(category_id) if category_id else None
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        raise Http404('Invalid search parameters')
+    
+    results = product_search.search(
+        query,
+        category_id=category_id,
+        price_range=price_range,
+        limit=SEARCH_RESULTS_PER_PAGE,
+        offset=(page - 1) * SEARCH_RESULTS_PER_PAGE
+    )
+    
+    return render(request, 'store/search_results.html', {
+        'query': query,
+        'products': results.products,
+        'total': results.total,
+        'facets': results.facets,
+        'page': page,
+        'has_next': page * SEARCH_RESULTS_PER_PAGE < results.total
+    })
+
 @login_required
 def toggle_save_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
@@ -55,4 +120,26 @@ def toggle_save_product(request, product_id):
 @login_required
 def saved_products(request):
     saved_items = SavedItem.objects.filter(user=request.user)
-    return render(request, 'saved/saved_items.html', {'saved_items': saved_items})
\ No newline at end of file
+    return render(request, 'saved/saved_items.html', {'saved_items': saved_items})
+
+@require_GET
+def image_derivative(request, variant, filename):
+    """
+    Serve a resized image from MEDIA_ROOT/derived/, generating it first if
+    it does not exist yet. The front-end server serves existing files
+    itself and only passes misses on to this view.
+    """
+    match = images.DERIVED_NAME_RE.match(filename)
+    if variant not in images.VARIANTS or not match:
+        raise Http404('Unknown image variant')
+    fmt = 'webp' if match['ext'] == 'webp' else 'jpeg'
+    name = images.derived_name(match['hash'], variant, fmt)
+    if not default_storage.exists(name):
+        source_name = images.find_source(match['hash'])
+        if source_name is None:
+            raise Http404('Unknown image')
+        images.generate(source_name, match['hash'], variants=[variant], formats=[fmt])
+    response = FileResponse(default_storage.open(name, 'rb'), content_type=images.FORMATS[fmt][1])
+    # Content-hash names never change contents
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -1,4 +1,3 @@
-
 # users/views.py
 
 from django.shortcuts import render, redirect
@@ -21,13 +20,3 @@ def register(request):
 @login_required
 def profile(request):
     return render(request, 'users/profile.html')
-
-# users/urls.py
-
-from django.urls import path
-from . import views
-
-urlpatterns = [
-    path('register/', views.register, name='register'),
-    path('profile/', views.profile, name='profile'),
-]